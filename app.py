@@ -23,4 +23,7 @@ def chat():
         print()  # Add spacing for readability
 
 if __name__ == "__main__":
-    chat()
+    try:
+        chat()
+    finally:
+        lia.close()
@@ -23,11 +23,13 @@ class ChatChain(BaseChain):
         if context is None:
             context = {}
         
-        # Build conversation history
-        history = ""
-        conversations = context.get("conversations", [])
-        for conv in conversations:
-            history += f"User: {conv['user']}\nLia: {conv['lia']}\n"
+        # Prefer the token-budgeted history built by LiaMain
+        history = context.get("history")
+        if history is None:
+            history = ""
+            conversations = context.get("conversations", [])
+            for conv in conversations:
+                history += f"User: {conv['user']}\nLia: {conv['lia']}\n"
         
         # Construct prompt
         prompt = CHAT_PROMPT_TEMPLATE.format(
@@ -8,7 +8,8 @@ import platform
 from typing import Dict, Any, Optional
 from chains.base_chain import BaseChain
 from rag.retriever import Retriever
-from rag.vectordb import VectorDB
+from rag.embedder import get_embedder
+from rag.vectordb import get_vectordb
 
 OS_COMMAND_PROMPT_TEMPLATE = """
 You are an expert system administrator. Convert the user's request into the correct command for their operating system.
@@ -46,8 +47,8 @@ class OSCommandChain(BaseChain):
         
         # Initialize RAG components
         try:
-            vectordb = VectorDB()
-            self.retriever = Retriever(vectordb)
+            # Shared with the other chains, so a turn's input is embedded once
+            self.retriever = Retriever(get_vectordb(), get_embedder())
             self.rag_available = True
         except Exception as e:
             print(f"Warning: Could not initialize RAG components: {e}")
@@ -73,13 +74,14 @@ class OSCommandChain(BaseChain):
         }
         return os_map.get(self.os_type, ['common'])
     
-    def _retrieve_relevant_docs(self, user_input: str, n_results: int = 5) -> str:
+    def _retrieve_relevant_docs(self, user_input: str, n_results: int = 3, turn=None) -> str:
         """
         Retrieve relevant TLDR documentation for the user's request.
         
         Args:
             user_input: User's natural language request
-            n_results: Number of documents to retrieve
+            n_results: Number of documents to retrieve (all go into the prompt)
+            turn: TurnContext whose input embedding is reused if a vector search runs
             
         Returns:
             Formatted documentation string
@@ -88,32 +90,24 @@ class OSCommandChain(BaseChain):
             return self._get_fallback_examples()
         
         try:
-            # Search for relevant commands
+            # Only this OS's pages are searched; a page present for several
+            # platforms comes back once, in the preferred platform's version
             docs = self.retriever.search(
                 query=user_input,
                 collection="os_commands",
-                n_results=n_results
+                n_results=n_results,
+                turn=turn,
+                platforms=self._get_platform_priority(),
+                dedupe_by="command"
             )
             
             if not docs:
                 return self._get_fallback_examples()
             
-            # Filter by platform preference
-            platform_priority = self._get_platform_priority()
-            
-            # Sort docs by platform priority
-            def get_platform_score(doc):
-                platform = doc.get('metadata', {}).get('platform', 'common')
-                if platform in platform_priority:
-                    return platform_priority.index(platform)
-                return len(platform_priority)
-            
-            docs.sort(key=get_platform_score)
-            
             # Format documentation
             formatted = "RELEVANT COMMAND DOCUMENTATION (from tldr-pages):\n\n"
             
-            for i, doc in enumerate(docs[:3], 1):  # Show top 3 most relevant
+            for i, doc in enumerate(docs, 1):
                 formatted += f"[Document {i}]\n"
                 formatted += doc['text']
                 formatted += "\n" + "="*60 + "\n\n"
@@ -159,7 +153,7 @@ Network:
             context = {}
         
         # Retrieve relevant TLDR documentation
-        retrieved_docs = self._retrieve_relevant_docs(user_input)
+        retrieved_docs = self._retrieve_relevant_docs(user_input, turn=context.get("turn"))
         
         # Construct prompt
         prompt = OS_COMMAND_PROMPT_TEMPLATE.format(
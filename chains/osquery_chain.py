@@ -3,7 +3,9 @@ import re
 from typing import Dict, Any, Optional, List
 from .base_chain import BaseChain
 from rag.retriever import Retriever
-from rag.vectordb import VectorDB
+from rag.embedder import get_embedder
+from rag.vectordb import get_vectordb
+from core.sql_analyzer import SQL_ANALYZER
 
 OSQUERY_PROMPT_TEMPLATE = """
 You are an expert in osquery SQL. Convert the user's security/forensics question into a valid osquery SQL statement.
@@ -71,8 +73,8 @@ class OsqueryChain(BaseChain):
         
         # Initialize RAG components
         try:
-            vectordb = VectorDB()
-            self.retriever = Retriever(vectordb)
+            # Shared with the other chains, so a turn's input is embedded once
+            self.retriever = Retriever(get_vectordb(), get_embedder())
         except Exception as e:
             print(f"Warning: Could not initialize RAG components: {e}")
             self.retriever = None
@@ -166,7 +168,8 @@ class OsqueryChain(BaseChain):
                 docs = self.retriever.search(
                     query=user_input,
                     collection="osquery_docs",
-                    n_results=3
+                    n_results=3,
+                    turn=context.get("turn")
                 )
                 
                 if docs:
@@ -211,9 +214,15 @@ Response: SELECT uid, username, shell, directory FROM users WHERE shell NOT IN (
             examples=examples
         )
         
+        # Session context (recent turns and queries) goes right before the request
+        if context.get("history"):
+            head, marker, tail = prompt.rpartition("\nUser: ")
+            prompt = (f"{head}\nSESSION CONTEXT (for resolving references like \"that\" or \"those\"):\n"
+                      f"{context['history']}\n{marker}{tail}")
+
         # Add context from previous queries if available
         recent_queries = context.get("queries", [])
-        if recent_queries and attempt > 0:
+        if recent_queries and attempt > 0 and not context.get("history"):
             prompt += f"\n\nNote: Previous similar queries:\n"
             for q in recent_queries[-3:]:
                 prompt += f"- {q.get('query', '')}\n"
@@ -242,27 +251,8 @@ Response: SELECT uid, username, shell, directory FROM users WHERE shell NOT IN (
         return sql_query.strip()
     
     def _is_valid_osquery_sql(self, sql: str) -> bool:
-        """Basic validation of osquery SQL"""
-        sql_lower = sql.lower()
-        
-        # Must start with SELECT
-        if not sql_lower.startswith('select'):
-            return False
-        
-        # Must contain FROM
-        if 'from' not in sql_lower:
-            return False
-        
-        # Should not contain forbidden keywords
-        forbidden = ['drop', 'delete', 'insert', 'update', 'create', 'alter', 'truncate']
-        if any(keyword in sql_lower for keyword in forbidden):
-            return False
-        
-        # Check for basic SQL injection patterns
-        if '--' in sql or '/*' in sql or '*/' in sql:
-            return False
-        
-        return True
+        """Validate generated SQL on real tokens (same cached analysis SafetyChecker uses)"""
+        return SQL_ANALYZER.check(sql)[0]
     
     def _is_reference_to_previous_query(self, user_input: str) -> bool:
         """Check if user is referring to a previous query"""
@@ -0,0 +1,115 @@
+"""
+Content-addressed, compressed blob store for large tool results.
+
+Blobs are canonical JSON compressed with zlib and stored under the SHA-256 of
+the uncompressed bytes, so identical results are written once no matter how
+often they are recorded. Readers decompress only the blobs they ask for.
+"""
+import hashlib
+import json
+import os
+import time
+import zlib
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class BlobStore:
+    """Directory of zlib-compressed JSON blobs keyed by content hash."""
+
+    def __init__(self, directory: str = "data/memory_blobs", level: int = 6):
+        """
+        Args:
+            directory: Where blobs are kept (fanned out by the first two hex digits)
+            level: zlib compression level
+        """
+        self.directory = directory
+        self.level = level
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest[2:] + ".z")
+
+    def put(self, value: Any) -> Tuple[str, int]:
+        """
+        Store a JSON-serialisable value
+
+        Returns:
+            Tuple of (content hash, compressed size in bytes)
+        """
+        data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            size = os.path.getsize(path)
+            os.utime(path)  # Refresh so GC sees it as recently used
+            return digest, size
+        except OSError:
+            pass
+
+        compressed = zlib.compress(data, self.level)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return digest, len(compressed)
+
+    def get(self, digest: str) -> Optional[Any]:
+        """Decompress and decode a blob; None if it is missing or damaged"""
+        try:
+            with open(self._path(digest), "rb") as f:
+                return json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def delete(self, digest: str):
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """Every stored blob as (hash, size, mtime)"""
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if not entry.name.endswith(".z"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                result.append((bucket.name + entry.name[:-2], stat.st_size, stat.st_mtime))
+        return result
+
+    def total_size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def collect(self, live: Iterable[str], grace: float = 3600.0) -> Tuple[int, int]:
+        """
+        Delete blobs that nothing references any more
+
+        Args:
+            live: Hashes still referenced
+            grace: Unreferenced blobs younger than this (seconds) are kept, so a
+                result written by another process just before its row is
+                inserted isn't collected
+
+        Returns:
+            Tuple of (blobs deleted, bytes freed)
+        """
+        live = set(live)
+        cutoff = time.time() - grace
+        deleted = freed = 0
+        for digest, size, mtime in self.entries():
+            if digest not in live and mtime < cutoff:
+                self.delete(digest)
+                deleted += 1
+                freed += size
+        return deleted, freed
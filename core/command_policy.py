@@ -0,0 +1,552 @@
+"""
+Shell-aware policy engine for generated OS commands.
+
+A command line is tokenised with shlex (punctuation-aware, so pipes, `&&`,
+`;` and subshells split it into simple commands), wrappers such as `sudo`,
+`env`, `xargs`, `bash -c`, `ssh host ...` and `find -exec` are unwrapped, and
+each simple command is checked against the rules for its binary. Code handed
+to an interpreter (`python -c`, `perl -e`, ...) cannot be parsed as shell, so
+its string literals are vetted as commands and a substring denylist backs
+them up; a shell or interpreter reading its script from a pipe, `<<<` or a
+heredoc is denied outright, since that script is not visible here. Rules are declared in
+COMMAND_RULES and compiled once into a per-binary index of frozensets, so a
+verdict is a dictionary lookup plus set intersections per simple command.
+Verdicts are memoised, which makes re-checking the same command (a retry, a
+fleet-wide batch) free.
+"""
+import posixpath
+import re
+import shlex
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Declarative rules, compiled by CommandPolicy. Keys:
+#   binaries: command names the rule applies to
+#   action: "deny" (default) or "allow"; allow rules for a binary are tried first
+#   flags: any of these flags present (short flags also match inside clusters like -rf)
+#   all_flags: a list of flag sets that must each be present
+#   tokens: any of these arguments present, case-insensitive (Windows-style /s switches)
+#   subcommand: first operand is one of these
+#   last_arg: the final argument is one of these
+#   protected_operand: an operand is a protected path (a string limits this to operands with
+#       that prefix, e.g. dd's "of=")
+#   operands_under: every operand lies inside one of these directories
+#   write_target: a file the command writes is a protected path, judged like a `>` redirect
+#       target; "operands" (every operand) or "destination" (-t DIR, else the last operand)
+COMMAND_RULES = [
+    # rm: recursive deletes of scratch directories are fine, anything else recursive and forced is not
+    {"binaries": {"rm"}, "action": "allow", "all_flags": [{"-r", "-R", "--recursive"}],
+     "operands_under": ("/tmp/", "/var/tmp/"), "reason": "Recursive delete inside a temporary directory"},
+    {"binaries": {"rm"}, "all_flags": [{"-r", "-R", "--recursive"}, {"-f", "--force"}],
+     "reason": "Forced recursive delete"},
+    {"binaries": {"rm"}, "flags": {"--no-preserve-root"}, "reason": "Deleting the root filesystem"},
+    {"binaries": {"rm", "rmdir", "unlink", "shred", "mv", "truncate"}, "protected_operand": True,
+     "reason": "Deleting or overwriting a system path"},
+    {"binaries": {"shred", "wipefs", "mkswap", "fdisk", "sfdisk", "cfdisk", "parted", "gdisk", "sgdisk",
+                  "blkdiscard", "diskpart", "bcdedit", "format", "halt", "poweroff", "reboot", "shutdown",
+                  "init", "telinit", "killall5", "diskutil"},
+     "reason": "Destructive disk or power operation"},
+    {"binaries": {"dd"}, "protected_operand": "of=", "reason": "Writing raw data to a device or system path"},
+    {"binaries": {"tee"}, "write_target": "operands", "reason": "Writing to a system path"},
+    {"binaries": {"cp", "install", "ln"}, "write_target": "destination", "reason": "Overwriting a system path"},
+    {"binaries": {"chmod", "chown", "chgrp", "chattr", "setfacl"}, "protected_operand": True,
+     "reason": "Changing ownership or permissions of a system path"},
+    {"binaries": {"find"}, "flags": {"-delete"}, "protected_operand": True,
+     "reason": "Deleting files under a system path"},
+    {"binaries": {"kill"}, "last_arg": {"-1"}, "reason": "Killing every process"},
+    {"binaries": {"crontab"}, "flags": {"-r"}, "reason": "Removing the crontab"},
+    {"binaries": {"iptables", "ip6tables"}, "flags": {"-F", "--flush", "-X"}, "reason": "Flushing the firewall"},
+    {"binaries": {"ufw"}, "subcommand": {"disable", "reset"}, "reason": "Disabling the firewall"},
+    {"binaries": {"systemctl"}, "subcommand": {"poweroff", "reboot", "halt", "kexec", "rescue", "emergency"},
+     "reason": "Power state change"},
+    {"binaries": {"del", "erase", "rd", "rmdir"}, "tokens": {"/s"}, "reason": "Recursive delete"},
+    {"binaries": {"cipher"}, "tokens": {"/w"}, "reason": "Wiping free disk space"},
+    {"binaries": {"mkfs", "mke2fs", "newfs"} | {f"mkfs.{fs}" for fs in ("ext2", "ext3", "ext4", "xfs", "btrfs",
+                                                                        "vfat", "fat", "msdos", "ntfs", "exfat")},
+     "reason": "Creating a filesystem"},
+]
+
+# Paths whose contents are off limits for destructive commands
+PROTECTED_TREES = ("/bin", "/boot", "/dev", "/etc", "/lib", "/lib32", "/lib64", "/proc", "/sbin", "/sys",
+                   "/usr", "/var/log", "/System", "/Library", "/private/etc", "c:/windows", "c:/program files")
+# Subtrees of PROTECTED_TREES meant for local administration
+EXEMPT_TREES = ("/usr/local", "/usr/src")
+# Paths that are protected themselves, but not what's inside them
+PROTECTED_ROOTS = {"/", "~", "/home", "/Users", "/root", "/var", "/opt", "/srv", "/mnt", "/media",
+                   "/tmp", "/var/tmp", "/Applications", "c:", "c:/users"}
+# Devices writes are always fine for
+HARMLESS_DEVICES = {"/dev/null", "/dev/zero", "/dev/stdout", "/dev/stderr", "/dev/tty", "/dev/random", "/dev/urandom"}
+
+# Leading words that run their arguments as a command: name -> options that take a value
+WRAPPERS = {
+    "sudo": {"-u", "-g", "-C", "-D", "-h", "-p", "-r", "-t", "-U", "--user", "--group"},
+    "doas": {"-u", "-C"},
+    "nohup": set(), "command": set(), "builtin": set(), "exec": set(), "time": set(),
+    "nice": {"-n", "--adjustment"},
+    "ionice": {"-c", "-n", "-p", "--class", "--classdata"},
+    "stdbuf": {"-i", "-o", "-e"},
+    "timeout": {"-s", "-k", "--signal", "--kill-after"},
+    "env": {"-u", "-C", "-S", "--unset", "--chdir"},
+    "xargs": {"-I", "-i", "-n", "-P", "-L", "-d", "-E", "-s", "-a", "--max-args", "--max-procs", "--delimiter"},
+    "watch": {"-n", "-d", "--interval"},
+    "chroot": set(),
+    "busybox": set(),
+}
+SHELLS = {"sh", "bash", "dash", "zsh", "ksh", "fish"}
+DOWNLOADERS = {"curl", "wget", "fetch", "invoke-webrequest", "iwr"}
+# Interpreter (version suffix stripped) -> options that take inline code
+INLINE_CODE_OPTIONS = {
+    "python": {"-c"}, "perl": {"-e", "-E"}, "ruby": {"-e"}, "node": {"-e", "--eval", "-p", "--print"},
+    "php": {"-r"}, "powershell": {"-c", "-command"}, "pwsh": {"-c", "-command"},
+}
+INTERPRETERS = SHELLS | set(INLINE_CODE_OPTIONS) | {"iex"}
+# Interpreter and shell options that take a value (so the value isn't mistaken for a script file)
+SCRIPT_OPTIONS_WITH_VALUES = {"-o", "-O", "+o", "+O", "--rcfile", "--init-file", "-W", "-X", "-I", "-file"}
+# Options of ssh that take a value; the first operand after them is the host
+SSH_OPTIONS_WITH_VALUES = {"-B", "-b", "-c", "-D", "-E", "-e", "-F", "-I", "-i", "-J", "-L", "-l", "-m", "-O",
+                           "-o", "-p", "-Q", "-R", "-S", "-W", "-w"}
+# Stdin operators that hand a command its input inline
+INLINE_INPUT_OPERATORS = {"<<", "<<<"}
+# Backstop for inline interpreter code: substrings no one-liner has a good reason to contain
+INLINE_CODE_DENYLIST = ["rm -rf", "rm -fr", "--no-preserve-root", "mkfs", "dd if=", "shutdown", "del /s",
+                        "rd /s", "format c:"]
+STRING_LITERAL = re.compile(r"'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"|`([^`]*)`"
+                            r"|\bq[qx]?\s*(?:\{([^}]*)\}|\(([^)]*)\)|\[([^\]]*)\])")
+
+# Raw-text patterns no tokeniser view can make safe
+RAW_PATTERNS = [
+    (re.compile(r"(\S+)\s*\(\s*\)\s*\{[^}]*\1\s*\|\s*\1\s*&"), "Fork bomb"),
+]
+
+SEPARATOR_CHARS = set(";&|()\n")
+REDIRECT_OPERATORS = {">", ">>", ">|", "&>", "&>>", ">&", "<>", "1>", "2>"}
+SUBSTITUTION = re.compile(r"\$\(([^()]*)\)|`([^`]*)`")
+
+
+class CompiledRule:
+    """One entry of COMMAND_RULES with its sets frozen for fast matching."""
+
+    def __init__(self, spec: Dict):
+        self.action = spec.get("action", "deny")
+        self.reason = spec["reason"]
+        self.flags = frozenset(spec.get("flags", ()))
+        self.all_flags = [frozenset(group) for group in spec.get("all_flags", ())]
+        self.tokens = frozenset(token.lower() for token in spec.get("tokens", ()))
+        self.subcommand = frozenset(spec.get("subcommand", ()))
+        self.last_arg = frozenset(spec.get("last_arg", ()))
+        self.protected_operand = spec.get("protected_operand", False)
+        self.operands_under = tuple(spec.get("operands_under", ()))
+        self.write_target = spec.get("write_target")
+
+    def matches(self, flags: frozenset, args: List[str], operands: List[str]) -> bool:
+        if self.flags and not (self.flags & flags):
+            return False
+        if any(not (group & flags) for group in self.all_flags):
+            return False
+        if self.tokens and not any(arg.lower() in self.tokens for arg in args):
+            return False
+        if self.subcommand and (not operands or operands[0] not in self.subcommand):
+            return False
+        if self.last_arg and (not args or args[-1] not in self.last_arg):
+            return False
+        if self.protected_operand:
+            if isinstance(self.protected_operand, str):
+                prefix = self.protected_operand
+                if not any(_is_protected_write(operand[len(prefix):]) for operand in operands
+                           if operand.startswith(prefix)):
+                    return False
+            elif not any(is_protected_path(operand) for operand in operands):
+                return False
+        if self.write_target:
+            if not any(_is_protected_write(target) for target in _write_targets(self.write_target, args, operands)):
+                return False
+        if self.operands_under:
+            if not operands:
+                return False
+            for operand in operands:
+                path = _normalise_path(operand)
+                if not any(path.startswith(prefix) and len(path) > len(prefix) for prefix in self.operands_under):
+                    return False
+        return True
+
+
+class CommandPolicy:
+    """Compiled allow/deny rules with memoised verdicts."""
+
+    def __init__(self, rules: Optional[List[Dict]] = None, cache_size: int = 4096):
+        """
+        Args:
+            rules: Rule specs (defaults to COMMAND_RULES)
+            cache_size: Verdicts remembered
+        """
+        self.rules: Dict[str, List[CompiledRule]] = {}
+        for spec in rules if rules is not None else COMMAND_RULES:
+            rule = CompiledRule(spec)
+            for binary in spec["binaries"]:
+                self.rules.setdefault(binary.lower(), []).append(rule)
+        for binary_rules in self.rules.values():
+            binary_rules.sort(key=lambda rule: rule.action != "allow")  # Allow rules first, stable otherwise
+        self.cache_size = cache_size
+        self._verdicts: "OrderedDict[str, Tuple[bool, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, command: str) -> Tuple[bool, str]:
+        """
+        Vet a command line
+
+        Returns:
+            (is_allowed, reason)
+        """
+        with self._lock:
+            verdict = self._verdicts.get(command)
+            if verdict is not None:
+                self._verdicts.move_to_end(command)
+                return verdict
+        verdict = self._evaluate(command)
+        with self._lock:
+            self._verdicts[command] = verdict
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+        return verdict
+
+    def check_many(self, commands: Iterable[str]) -> List[Tuple[bool, str]]:
+        """Vet a batch of command lines (e.g. one per host of a fleet run)"""
+        return [self.check(command) for command in commands]
+
+    def _evaluate(self, command: str) -> Tuple[bool, str]:
+        for pattern, reason in RAW_PATTERNS:
+            if pattern.search(command):
+                return False, reason
+        try:
+            pipelines = _split(command)
+        except ValueError as e:
+            return False, f"Could not parse command: {e}"
+        for pipeline in pipelines:
+            previous = None
+            for argv, redirects, stdin in pipeline:
+                for target in redirects:
+                    if _is_protected_write(target):
+                        return False, f"Writing to {target}"
+                if stdin is None and previous is not None:
+                    stdin = "|"
+                verdict = self._check_simple(argv, previous, stdin)
+                if verdict is not None:
+                    return verdict
+                previous = _binary(argv[0]) if argv else previous
+        return True, "Safe"
+
+    def _check_simple(self, argv: List[str], previous: Optional[str], stdin: Optional[str] = None,
+                      depth: int = 0) -> Optional[Tuple[bool, str]]:
+        """
+        Deny verdict for one simple command (None if nothing matched)
+
+        Args:
+            argv: The command's words
+            previous: Binary of the command piping into this one, if any
+            stdin: How stdin is fed: "|", "<<", "<<<", "<" or None
+            depth: Unwrapping depth (wrappers nest)
+        """
+        argv = _strip_assignments(argv)
+        if not argv or depth > 8:
+            return None
+        binary = _binary(argv[0])
+
+        if binary in WRAPPERS:
+            inner = _unwrap(argv, WRAPPERS[binary])
+            return self._check_simple(inner, previous, stdin, depth + 1) if inner else None
+        if binary == "eval":
+            return self._check_script(" ".join(argv[1:]))
+        if binary == "ssh":
+            remote = _ssh_command(argv)
+            return self._check_script(remote) if remote else None
+        interpreter = _interpreter(binary)
+        if interpreter in INTERPRETERS:
+            source, code = _script_source(interpreter, argv)
+            if source == "code":
+                return self._check_script(code) if interpreter in SHELLS else self._check_inline_code(code)
+            if source == "stdin" and (stdin == "|" or stdin in INLINE_INPUT_OPERATORS):
+                kind = "a shell" if interpreter in SHELLS else "an interpreter"
+                if previous in DOWNLOADERS:
+                    return False, f"Piping downloaded content into {kind}"
+                return False, f"Feeding {kind} a script on stdin"
+        if binary == "find":
+            for inner in _find_exec_commands(argv):
+                verdict = self._check_simple(inner, None, None, depth + 1)
+                if verdict is not None:
+                    return verdict
+
+        rules = self.rules.get(binary)
+        if not rules:
+            return None
+        args = argv[1:]
+        flags = _flags(args)
+        operands = [arg for arg in args if not arg.startswith("-") or arg == "-"]
+        for rule in rules:
+            if rule.matches(flags, args, operands):
+                return None if rule.action == "allow" else (False, rule.reason)
+        return None
+
+    def _check_script(self, script: str) -> Optional[Tuple[bool, str]]:
+        """Deny verdict for a shell script run by another command (sh -c, eval, ssh)"""
+        allowed, reason = self._evaluate(script)
+        return None if allowed else (False, reason)
+
+    def _check_inline_code(self, code: str) -> Optional[Tuple[bool, str]]:
+        """Deny verdict for python -c / perl -e style code: its string literals are vetted as commands"""
+        lowered = " ".join(code.lower().split())
+        for dangerous in INLINE_CODE_DENYLIST:
+            if dangerous in lowered:
+                return False, f"Inline code contains `{dangerous}`"
+        literals = _string_literals(code)
+        # Each literal on its own (os.system('...')), then all of them as one argv (subprocess.run([...]))
+        for script in literals + [" ".join(literals)]:
+            try:
+                _split(script)
+            except ValueError:
+                continue  # Prose, not a command line
+            verdict = self._check_script(script)
+            if verdict is not None:
+                return verdict
+        return None
+
+
+def split_command(command: str) -> List[List[Tuple[List[str], List[str]]]]:
+    """
+    Split a command line into pipelines of (argv, redirect targets)
+
+    `&&`, `||`, `;`, `&`, newlines and parentheses end a pipeline; `|`
+    continues it. Command substitutions ($(...) and backticks, also inside
+    quotes) are returned as pipelines of their own.
+
+    Raises:
+        ValueError: Unbalanced quotes
+    """
+    return [[(argv, redirects) for argv, redirects, _ in pipeline] for pipeline in _split(command)]
+
+
+def _split(command: str) -> List[List[Tuple[List[str], List[str], Optional[str]]]]:
+    """split_command, also noting how each simple command's stdin is redirected ("<", "<<", "<<<" or None)"""
+    pipelines: List[List[Tuple[List[str], List[str], Optional[str]]]] = []
+    for inner in _substitutions(command):
+        pipelines.extend(_split(inner))
+
+    lexer = shlex.shlex(command, posix=True, punctuation_chars="();<>|&\n")
+    lexer.whitespace = " \t\r"
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    tokens = list(lexer)
+
+    pipeline: List[Tuple[List[str], List[str], Optional[str]]] = []
+    argv: List[str] = []
+    redirects: List[str] = []
+    stdin: Optional[str] = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if "\n" in token and token.strip("\n") in ("|", "|&"):
+            token = token.strip("\n")  # A pipe continued on the next line
+        if token and set(token) <= SEPARATOR_CHARS | {"<", ">"}:
+            if token in REDIRECT_OPERATORS or (set(token) <= {"<", ">", "&", "|"} and ">" in token):
+                if argv and argv[-1].isdigit():
+                    argv.pop()  # fd number of e.g. 2>/dev/null
+                if i + 1 < len(tokens):
+                    redirects.append(tokens[i + 1])
+                i += 2
+                continue
+            if "<" in token and not set(token) & SEPARATOR_CHARS:
+                stdin = token  # Input redirection: reads only
+                i += 2
+                continue
+            if argv or redirects:
+                pipeline.append((argv, redirects, stdin))  # A bare `> file` still writes file
+            argv, redirects, stdin = [], [], None
+            if token not in ("|", "|&"):
+                if pipeline:
+                    pipelines.append(pipeline)
+                pipeline = []
+            i += 1
+            continue
+        if token in ("{", "}", "!", "$") and not argv:
+            i += 1
+            continue
+        argv.append(token)
+        i += 1
+    if argv or redirects:
+        pipeline.append((argv, redirects, stdin))
+    if pipeline:
+        pipelines.append(pipeline)
+    return pipelines
+
+
+def _substitutions(command: str) -> List[str]:
+    return [match.group(1) if match.group(1) is not None else match.group(2)
+            for match in SUBSTITUTION.finditer(command)]
+
+
+def _binary(word: str) -> str:
+    name = word.replace("\\", "/").rsplit("/", 1)[-1].lower()
+    return name[:-4] if name.endswith(".exe") else name
+
+
+def _strip_assignments(argv: List[str]) -> List[str]:
+    """Drop leading VAR=value words"""
+    i = 0
+    while i < len(argv) and re.match(r"^[A-Za-z_][A-Za-z0-9_]*=", argv[i]):
+        i += 1
+    return argv[i:]
+
+
+def _unwrap(argv: List[str], options_with_values) -> List[str]:
+    """The command a wrapper such as sudo or xargs runs"""
+    binary = _binary(argv[0])
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--":
+            i += 1
+            break
+        if arg.startswith("-"):
+            i += 2 if arg in options_with_values else 1
+            continue
+        if binary == "env" and "=" in arg:
+            i += 1
+            continue
+        if binary == "timeout" and re.match(r"^\d+(\.\d+)?[smhd]?$", arg):
+            i += 1  # The duration
+        break
+    return argv[i:]
+
+
+def _interpreter(binary: str) -> str:
+    """Binary name with a version suffix dropped (python3.11 -> python)"""
+    name = re.sub(r"[\d.]+$", "", binary)
+    return name if name in INTERPRETERS else binary
+
+
+def _script_source(interpreter: str, argv: List[str]) -> Tuple[str, Optional[str]]:
+    """
+    Where a shell or interpreter gets its script
+
+    Returns:
+        ("code", inline code), ("stdin", None) or ("file", None)
+    """
+    if interpreter == "iex":
+        return ("code", " ".join(argv[1:])) if len(argv) > 1 else ("stdin", None)
+    code_options = INLINE_CODE_OPTIONS.get(interpreter, set())
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        option = arg.lower() if interpreter in ("powershell", "pwsh") else arg
+        if option in code_options or (interpreter in SHELLS and _short_cluster_has(arg, "c")) \
+                or (interpreter not in SHELLS and _short_cluster_has(arg, "") and f"-{arg[-1]}" in code_options):
+            return "code", argv[i + 1] if i + 1 < len(argv) else ""  # -c, -ec, perl -lne
+        if interpreter == "python" and arg.startswith("-c") and len(arg) > 2:
+            return "code", arg[2:]
+        if interpreter == "python" and arg.startswith("-m"):
+            return "file", None  # Runs a module
+        if arg == "--":
+            return ("file", None) if i + 1 < len(argv) else ("stdin", None)
+        if arg == "-" or (interpreter in SHELLS and _short_cluster_has(arg, "s")):
+            return "stdin", None
+        if not arg.startswith("-") and not arg.startswith("+"):
+            return "file", None
+        i += 2 if option in SCRIPT_OPTIONS_WITH_VALUES else 1
+    return "stdin", None
+
+
+def _short_cluster_has(arg: str, letter: str) -> bool:
+    return arg.startswith("-") and not arg.startswith("--") and letter in arg[1:]
+
+
+def _ssh_command(argv: List[str]) -> str:
+    """Command ssh runs on the remote host ("" for an interactive login)"""
+    i = 1
+    while i < len(argv) and argv[i].startswith("-"):
+        i += 2 if argv[i] in SSH_OPTIONS_WITH_VALUES else 1
+    return " ".join(argv[i + 1:])
+
+
+def _string_literals(code: str) -> List[str]:
+    """Quoted strings of interpreter code ('...', "...", `...`, Perl's q{...})"""
+    return [next(group for group in match.groups() if group is not None)
+            for match in STRING_LITERAL.finditer(code)]
+
+
+def _find_exec_commands(argv: List[str]) -> List[List[str]]:
+    commands = []
+    i = 0
+    while i < len(argv):
+        if argv[i] in ("-exec", "-execdir", "-ok", "-okdir"):
+            end = i + 1
+            while end < len(argv) and argv[end] not in (";", "\\;", "+"):
+                end += 1
+            commands.append(argv[i + 1:end])
+            i = end
+        i += 1
+    return commands
+
+
+def _write_targets(mode: str, args: List[str], operands: List[str]) -> List[str]:
+    """Files a command writes: every operand, or the destination of cp/install/ln"""
+    if mode == "operands":
+        return operands
+    for i, arg in enumerate(args):
+        if arg == "--":
+            break
+        if arg.startswith("--target-directory="):
+            return [arg.split("=", 1)[1]]
+        if arg == "--target-directory" or (arg.startswith("-") and not arg.startswith("--") and "t" in arg[1:]):
+            value = arg[arg.index("t") + 1:] if not arg.startswith("--") else ""
+            if value:
+                return [value]  # -t/etc
+            return [args[i + 1]] if i + 1 < len(args) else []
+    return operands[-1:] if len(operands) > 1 else []
+
+
+def _flags(args: List[str]) -> frozenset:
+    """Flags present, with short clusters (-rf) also expanded to -r and -f"""
+    flags = set()
+    for arg in args:
+        if arg == "--":
+            break
+        if not arg.startswith("-") or arg == "-":
+            continue
+        name = arg.split("=", 1)[0]
+        flags.add(name)
+        if not arg.startswith("--") and len(name) > 2:
+            flags.update(f"-{letter}" for letter in name[1:])
+    return frozenset(flags)
+
+
+def _normalise_path(path: str) -> str:
+    path = path.strip().replace("\\", "/")
+    for home in ("${HOME}", "$HOME"):
+        if path == home or path.startswith(home + "/"):
+            path = "~" + path[len(home):]
+    if re.match(r"^[A-Za-z]:", path):
+        path = path[0].lower() + path[1:]
+    path = path.rstrip("*").rstrip("/") or "/"
+    normalised = posixpath.normpath(path) if path not in ("~",) else path
+    return "/" if normalised == "//" else normalised
+
+
+def is_protected_path(path: str) -> bool:
+    """True for system trees (and anything in them) and for key directories themselves"""
+    if not path or path.startswith("-"):
+        return False
+    normalised = _normalise_path(path)
+    if normalised in PROTECTED_ROOTS or normalised.lower() in PROTECTED_ROOTS:
+        return True
+    lowered = normalised.lower() if re.match(r"^[a-z]:", normalised) else normalised
+    if any(lowered == tree or lowered.startswith(tree + "/") for tree in EXEMPT_TREES):
+        return False
+    return any(lowered == tree or lowered.startswith(tree + "/") for tree in PROTECTED_TREES)
+
+
+def _is_protected_write(target: str) -> bool:
+    """Like is_protected_path, but writing to /dev/null and friends is fine"""
+    normalised = _normalise_path(target)
+    if normalised in HARMLESS_DEVICES or normalised.isdigit() or normalised == "-":
+        return False
+    return is_protected_path(target)
@@ -0,0 +1,170 @@
+"""
+Token-budgeted conversation context shared by the chains.
+
+Each chain gets a token budget. Recent turns (tool turns as their digests) are
+added newest first until the budget is spent; turns that no longer fit are
+folded into a per-chain rolling summary, which is only updated when turns age
+out and is persisted with the session. When the request is known, earlier
+turns and queries that are semantically close to it (MemoryManager's embedding
+index) get their own share of the budget. Rendered turns and the finished
+history are cached, so a turn costs one indexed read plus the rendering of
+whatever is new since the last build.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+DEFAULT_BUDGETS = {
+    "chat": 1500,
+    "osquery": 600,
+}
+
+# Share of a chain's budget reserved for its rolling summary
+SUMMARY_SHARE = 0.25
+
+# Share of a chain's budget for semantically relevant earlier items
+RELEVANT_SHARE = 0.2
+
+# Chains that also see recent osquery history
+QUERY_CHAINS = {"osquery"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English and SQL)"""
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def _clip(text: str, width: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+class ContextBuilder:
+    """Builds per-chain history strings within a token budget."""
+
+    def __init__(self, memory, budgets: Optional[Dict[str, int]] = None, window: int = 30,
+                 cache_size: int = 256):
+        """
+        Args:
+            memory: MemoryManager providing turns, queries and summary storage
+            budgets: Token budget per chain, overriding DEFAULT_BUDGETS
+            window: Most recent turns considered for verbatim inclusion
+            cache_size: Rendered turns kept in memory
+        """
+        self.memory = memory
+        self.budgets = dict(DEFAULT_BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+        self.window = window
+        self.cache_size = cache_size
+        self._turns: "OrderedDict[int, Tuple[str, int]]" = OrderedDict()  # id -> (text, tokens)
+        self._rendered: Dict[str, Tuple[Any, str]] = {}  # chain -> (cache key, history)
+
+    def build(self, chain: str, user_input: Optional[str] = None, turn_context=None) -> str:
+        """
+        History for a chain's prompt, within the chain's token budget
+
+        Args:
+            chain: Chain name (selects the budget)
+            user_input: Current request; enables semantically relevant earlier context
+            turn_context: TurnContext whose input embedding the relevance lookup reuses
+        """
+        budget = self.budgets.get(chain, DEFAULT_BUDGETS["chat"])
+        turns = self.memory.get_recent_conversations(self.window)
+        queries = self.memory.get_recent_queries(3) if chain in QUERY_CHAINS else []
+
+        newest = turns[-1]["id"] if turns else 0
+        key = (newest, budget, tuple(query["id"] for query in queries), user_input)
+        cached = self._rendered.get(chain)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        summary_budget = int(budget * SUMMARY_SHARE)
+        relevant_budget = int(budget * RELEVANT_SHARE) if user_input else 0
+        remaining = budget - summary_budget - relevant_budget
+
+        query_lines = []
+        for query in reversed(queries):
+            line = f"- {_clip(query['query'], 160)} ({query['summary']})"
+            tokens = estimate_tokens(line)
+            if tokens > remaining:
+                break
+            query_lines.insert(0, line)
+            remaining -= tokens
+
+        included = []
+        oldest_included = newest + 1
+        for turn in reversed(turns):
+            text, tokens = self._render_turn(turn)
+            if tokens > remaining:
+                break
+            included.insert(0, text)
+            remaining -= tokens
+            oldest_included = turn["id"]
+
+        summary = self._update_summary(chain, oldest_included - 1, summary_budget)
+
+        relevant_lines = []
+        if user_input:
+            exclude = {("conversation", turn["id"]) for turn in turns if turn["id"] >= oldest_included}
+            exclude.update(("query", query["id"]) for query in queries)
+            for item in self.memory.get_relevant_context(user_input, k=5, exclude=exclude, turn=turn_context):
+                line = "- " + _clip(item["text"], 300)
+                tokens = estimate_tokens(line)
+                if tokens > relevant_budget:
+                    break
+                relevant_lines.append(line)
+                relevant_budget -= tokens
+
+        parts = []
+        if summary:
+            parts.append(f"Earlier in this session:\n{summary}")
+        if relevant_lines:
+            parts.append("Possibly relevant earlier context:\n" + "\n".join(relevant_lines))
+        if query_lines:
+            parts.append("Recent queries:\n" + "\n".join(query_lines))
+        if included:
+            parts.append("".join(included).rstrip("\n"))
+        history = "\n\n".join(parts)
+
+        self._rendered[chain] = (key, history)
+        return history
+
+    def _render_turn(self, turn: Dict[str, Any]) -> Tuple[str, int]:
+        cached = self._turns.get(turn["id"])
+        if cached is not None:
+            self._turns.move_to_end(turn["id"])
+            return cached
+        text = f"User: {turn['user']}\nLia: {turn['lia']}\n"
+        rendered = (text, estimate_tokens(text))
+        self._turns[turn["id"]] = rendered
+        while len(self._turns) > self.cache_size:
+            self._turns.popitem(last=False)
+        return rendered
+
+    def _update_summary(self, chain: str, upto_id: int, summary_budget: int) -> str:
+        """
+        Fold turns up to upto_id into the chain's rolling summary
+
+        Only turns that aged out since the last update are read; the summary
+        keeps its newest lines within summary_budget.
+        """
+        folded_upto, summary = self.memory.get_summary(chain)
+        if upto_id <= folded_upto:
+            return summary
+
+        lines = summary.splitlines() if summary else []
+        for turn in self.memory.get_conversations_between(folded_upto, upto_id, limit=self.window):
+            reply = turn["lia"].strip().splitlines()[0] if turn["lia"].strip() else ""
+            lines.append(f"- User asked: {_clip(turn['user'], 80)} -> {_clip(reply, 100)}")
+
+        kept: List[str] = []
+        tokens = 0
+        for line in reversed(lines):
+            line_tokens = estimate_tokens(line)
+            if tokens + line_tokens > summary_budget:
+                break
+            kept.insert(0, line)
+            tokens += line_tokens
+        summary = "\n".join(kept)
+        self.memory.save_summary(chain, upto_id, summary)
+        return summary
@@ -1,14 +1,54 @@
 import cohere
-from typing import Dict, Any
+import re
+import threading
+from typing import Callable, Dict, Any, Optional, Tuple
 from core.router import IntentRouter, Intent
 from core.memory import MemoryManager
+from core.context_builder import ContextBuilder
+from core.turn_context import TurnContext
 from core.safety import SafetyChecker
 from chains.chat_chain import ChatChain
 from chains.os_chain import OSCommandChain
 from chains.osquery_chain import OsqueryChain
 from engines.command_engine import CommandEngine
 from engines.osquery_engine import OsqueryEngine
+from engines.hash_cache import HashCache
+from engines.job_queue import JobQueue, Job
+from engines.resource_limits import LIMIT_LEDGER, CHILD_SLOTS
 from tools.formatter import ResultFormatter
+from tools.process_tree import ProcessTree
+from tools.ioc_matcher import IOCMatcher
+from rag.embedder import get_embedder
+
+# Phrases that ask for work to run as a background job
+BACKGROUND_PATTERN = re.compile(r"\s*\b(?:in the background|as a (?:background )?job|in background)\b", re.IGNORECASE)
+
+# "with a budget of 10 minutes" / "timeout of 90s"
+BUDGET_PATTERN = re.compile(
+    r"\s*\b(?:with )?an? (?:budget|timeout) of (\d+)\s*(s|sec|secs|seconds?|m|min|mins|minutes?|h|hours?)\b",
+    re.IGNORECASE
+)
+
+JOB_RESULT_PATTERN = re.compile(r"\b(?:result|results|output|status|progress) (?:of|for) job #?(\d+)\b|\bjob #?(\d+) (?:result|results|output|status)\b", re.IGNORECASE)
+JOB_CANCEL_PATTERN = re.compile(r"\b(?:cancel|stop|kill|abort) job #?(\d+)\b", re.IGNORECASE)
+JOB_LIST_PATTERN = re.compile(r"^\s*(?:(?:list|show)(?: me)?(?: all)? (?:background )?jobs|jobs)\s*\??\s*$", re.IGNORECASE)
+# OSCommandChain.os_type -> tldr page directory
+TLDR_PLATFORMS = {"Linux": "linux", "macOS": "osx", "Windows": "windows"}
+
+CACHE_STATS_PATTERN = re.compile(r"^\s*(?:show(?: me)? )?(?:command )?cache (?:stats|statistics)\s*\??\s*$", re.IGNORECASE)
+LIMIT_REPORT_PATTERN = re.compile(r"^\s*(?:show(?: me)? )?(?:resource )?limit (?:stats|statistics|report|events)\s*\??\s*$", re.IGNORECASE)
+
+# Lineage questions answered from the process tree index
+ANCESTRY_PATTERN = re.compile(
+    r"\b(?:what|who|which process)\s+(?:spawned|started|launched)\s+(?P<target>.+)$"
+    r"|\b(?:parent|parents|ancestors|ancestry|lineage)\s+(?:process(?:es)?\s+)?of\s+(?P<target2>.+)$",
+    re.IGNORECASE
+)
+DESCENDANTS_PATTERN = re.compile(
+    r"\b(?:descendants|children|child processes|subprocesses|process tree)\s+(?:of|for|under)\s+(?P<target>.+)$"
+    r"|\bwhat (?:did|has|does)\s+(?P<target2>.+?)\s+(?:spawn|spawned|start|started)\b",
+    re.IGNORECASE
+)
 
 class LiaMain:
     def __init__(self, api_key: str, memory_file: str = "lia_memory.json"):
@@ -16,7 +56,9 @@ class LiaMain:
         self.co = cohere.Client(api_key)
         self.router = IntentRouter(self.co)
         self.memory = MemoryManager(memory_file)
+        self.context_builder = ContextBuilder(self.memory)
         self.safety = SafetyChecker()
+        self.embedder = get_embedder()  # Embeds each turn's input once for retrieval and memory
         
         # Initialize chains
         self.chat_chain = ChatChain(self.co)
@@ -24,23 +66,64 @@ class LiaMain:
         self.osquery_chain = OsqueryChain(self.co)
         
         # Initialize engines
-        self.command_engine = CommandEngine()
-        self.osquery_engine = OsqueryEngine()
+        self.command_engine = CommandEngine(persistent_shell=True)
+        # The cache learns read-only commands from the tldr pages once the vector DB is open (first OS command)
+        self._policy_seeded = False
+        self.osquery_engine = OsqueryEngine(hash_cache=HashCache())
+
+        # Background jobs and their default per-job budgets (seconds)
+        self.jobs = JobQueue(max_workers=2)
+        self.job_budgets = {"command": 300, "osquery": 600}
+
+        # Process lineage index (filled by one `processes` scan on demand)
+        self.process_tree = ProcessTree(self.osquery_engine)
+
+        # Indicator lists checked against every osquery result
+        try:
+            self.ioc = IOCMatcher.from_directory("data/ioc")
+        except Exception as e:
+            print(f"Warning: Could not load IOC lists: {e}")
+            self.ioc = IOCMatcher()
         
         # Initialize formatter
         self.formatter = ResultFormatter()
 
+    def close(self):
+        """Cancel background jobs so the process can exit without waiting out their budgets"""
+        self.jobs.shutdown(cancel=True)
     
-    def process_input(self, user_input: str) -> str:
-        """Main entry point for processing user input"""
+    def process_input(self, user_input: str, on_output: Optional[Callable[[str], None]] = None,
+                      cancel_event: Optional[threading.Event] = None) -> str:
+        """
+        Main entry point for processing user input
+
+        Args:
+            user_input: The user's request
+            on_output: Called with command output as it streams in
+            cancel_event: Set to abort a running command
+        """
 
         if "dashboard" in user_input.lower() or "security status" in user_input.lower():
             from tools.security_dashboard import SecurityDashboard
             dashboard = SecurityDashboard(self)
             return dashboard.generate_dashboard()
 
-        # Get context from memory
+        if CACHE_STATS_PATTERN.match(user_input):
+            return self.formatter.format_cache_stats(self.command_engine.cache_stats())
+        if LIMIT_REPORT_PATTERN.match(user_input):
+            return self.formatter.format_limit_report(LIMIT_LEDGER.summary(), CHILD_SLOTS)
+
+        job_response = self._handle_job_request(user_input)
+        if job_response is not None:
+            return job_response
+
+        lineage_response = self._handle_lineage(user_input)
+        if lineage_response is not None:
+            return lineage_response
+
+        # Get context from memory; the turn carries the input's (lazy) embedding to every consumer
         context = self.memory.get_memory_context()
+        context["turn"] = TurnContext(self._strip_job_options(user_input), self.embedder)
         
         # Classify intent
         intent = self.router.classify_intent(user_input)
@@ -49,8 +132,9 @@ class LiaMain:
         if intent == Intent.CHAT:
             return self._handle_chat(user_input, context)
         elif intent == Intent.OS_COMMAND:
-            return self._handle_os_command(user_input, context)
+            return self._handle_os_command(user_input, context, on_output, cancel_event)
         elif intent == Intent.OSQUERY:
+            context["history"] = self.context_builder.build("osquery", user_input, turn_context=context["turn"])
             return self._handle_osquery(user_input, context)
         else:
             # Default to chat for unknown intents
@@ -58,6 +142,7 @@ class LiaMain:
     
     def _handle_chat(self, user_input: str, context: Dict[str, Any]) -> str:
         """Handle chat intent"""
+        context = dict(context, history=self.context_builder.build("chat", user_input, turn_context=context.get("turn")))
         result = self.chat_chain.process(user_input, context)
         response = result["response"]
         
@@ -66,32 +151,58 @@ class LiaMain:
         
         return response
     
-    def _handle_os_command(self, user_input: str, context: Dict[str, Any]) -> str:
+    def _handle_os_command(self, user_input: str, context: Dict[str, Any],
+                           on_output: Optional[Callable[[str], None]] = None,
+                           cancel_event: Optional[threading.Event] = None) -> str:
         """Handle OS command intent"""
         # Generate command
-        result = self.os_chain.process(user_input, context)
+        result = self.os_chain.process(self._strip_job_options(user_input), context)
         command = result["response"]
+        if not self._policy_seeded and self.os_chain.retriever is not None and self.command_engine.cache is not None:
+            # The first retrieval has opened the vector DB; read the tldr pages off the critical path
+            self._policy_seeded = True
+            threading.Thread(target=self._seed_command_policy, daemon=True).start()
         
         if not command:
             # Fall back to chat if no command generated
             return self._handle_chat(user_input, context)
         
         # Safety check
-        if not self.safety.is_os_command_safe(command):
-            error_msg = "⚠ This command has been blocked for security reasons."
+        is_safe, reason = self.safety.check_os_command(command)
+        if not is_safe:
+            error_msg = f"⚠ This command has been blocked for security reasons: {reason}"
             self.memory.add_conversation(user_input, error_msg)
             return error_msg
         
+        background, budget = self._job_options(user_input)
+        if background:
+            # Through execute_command so builtins, the result cache and the shell session still apply
+            job = self.jobs.submit(
+                "command", command,
+                lambda job: self.command_engine.execute_command(
+                    job.target, timeout=job.timeout,
+                    on_output=job.append_output, cancel_event=job.cancel_event),
+                timeout=budget or self.job_budgets["command"],
+                user_input=user_input
+            )
+            response = self.formatter.format_job_submitted(job)
+            self.memory.add_conversation(user_input, response)
+            return response
+
         # Execute command
-        output, error = self.command_engine.execute_command(command)
+        output, error = self.command_engine.execute_command(command, timeout=budget, on_output=on_output,
+                                                            cancel_event=cancel_event)
         
         if error:
             formatted_response = self.formatter.format_error(f"Failed to execute command: {error}")
         else:
             formatted_response = self.formatter.format_os_result(command, output)
         
-        # Save to memory
-        self.memory.add_conversation(user_input, formatted_response)
+        # Save to memory; later prompts only see the digest
+        self.memory.add_conversation(
+            user_input, formatted_response,
+            digest=self.formatter.digest_command_output(command, output, error)
+        )
         
         return formatted_response
     
@@ -104,7 +215,7 @@ class LiaMain:
             return error_msg
         
         # Generate SQL query
-        result = self.osquery_chain.process(user_input, context)
+        result = self.osquery_chain.process(self._strip_job_options(user_input), context)
         sql_query = result["response"]
         
         if not sql_query:
@@ -118,20 +229,161 @@ class LiaMain:
             self.memory.add_conversation(user_input, error_msg)
             return error_msg
         
+        background, budget = self._job_options(user_input)
+        if background:
+            job = self.jobs.submit(
+                "osquery", sql_query,
+                lambda job: self.osquery_engine.execute_query(
+                    job.target, timeout=job.timeout, cancel_event=job.cancel_event),
+                timeout=budget or self.job_budgets["osquery"],
+                user_input=user_input
+            )
+            response = self.formatter.format_job_submitted(job)
+            self.memory.add_conversation(user_input, response)
+            return response
+
         # Execute query
-        results, error = self.osquery_engine.execute_query(sql_query)
+        results, error = self.osquery_engine.execute_query(sql_query, timeout=budget)
         
+        return self._finish_osquery(user_input, sql_query, results, error)
+
+    def _finish_osquery(self, user_input: str, sql_query: str, results, error: str, record: bool = True) -> str:
+        """Format osquery results and (unless record is False) record them in memory"""
         if error:
             formatted_response = self.formatter.format_error(f"Failed to execute query: {error}")
-        else:
-            # Sanitize results
-            sanitized_results = self.safety.sanitize_osquery_result(results)
-            formatted_response = self.formatter.format_osquery_result(sql_query, sanitized_results)
-        
-        # Save to memory
-        self.memory.add_conversation(user_input, formatted_response)
-        if not error:
-            self.memory.add_query(sql_query, str(results))
+            if record:
+                self.memory.add_conversation(user_input, formatted_response)
+            return formatted_response
+
+        # Sanitize results
+        sanitized_results = self.safety.sanitize_osquery_result(results)
+        formatted_response = self.formatter.format_osquery_result(sql_query, sanitized_results)
+        ioc_lines = []
+        hits = self.ioc.match_results(results)
+        if hits:
+            ioc_lines = self.ioc.summarize_hits(hits)
+            formatted_response += "\n\n" + self.formatter.format_ioc_hits(ioc_lines)
+
+        if not record:
+            return formatted_response
+
+        # Save to memory: the full result under a query handle, a digest for later prompts
+        query_id = self.memory.add_query(sql_query, results)
+        digest = self.formatter.digest_osquery_result(
+            sql_query, sanitized_results, extra_lines=[f"Indicator match: {line}" for line in ioc_lines]
+        )
+        self.memory.add_conversation(user_input, formatted_response, digest=digest, query_id=query_id)
         
         return formatted_response
 
+    def _seed_command_policy(self):
+        try:
+            self.command_engine.cache.policy.seed_from_tldr(
+                self.os_chain.retriever.vectordb, platforms=[TLDR_PLATFORMS.get(self.os_chain.os_type, "linux")])
+        except Exception as e:
+            print(f"Warning: Could not load command policies from tldr pages: {e}")
+
+    def _job_options(self, user_input: str) -> Tuple[bool, Optional[float]]:
+        """
+        Extract background/budget options from the user's request
+
+        Returns:
+            Tuple of (run_in_background, budget_seconds or None)
+        """
+        background = bool(BACKGROUND_PATTERN.search(user_input))
+        budget = None
+        match = BUDGET_PATTERN.search(user_input)
+        if match:
+            unit = match.group(2).lower()
+            multiplier = 3600 if unit.startswith("h") else 60 if unit.startswith("m") else 1
+            budget = float(match.group(1)) * multiplier
+        return background, budget
+
+    def _handle_lineage(self, user_input: str) -> Optional[str]:
+        """Answer "what spawned X" / "descendants of X" from the process tree"""
+        ancestry = ANCESTRY_PATTERN.search(user_input)
+        descendants = None if ancestry else DESCENDANTS_PATTERN.search(user_input)
+        match = ancestry or descendants
+        if match is None:
+            return None
+        if not self.osquery_engine.is_osquery_installed():
+            return None  # Let the normal chains handle it
+
+        error = self.process_tree.ensure_fresh()
+        if error:
+            return self.formatter.format_error(f"Failed to read the process list: {error}")
+
+        target = match.group("target") or match.group("target2")
+        pids = self.process_tree.resolve(target)
+        if not pids:
+            return None  # Not a running process; let the router decide
+
+        sections = []
+        for pid in pids[:5]:
+            node = self.process_tree.get(pid)
+            if ancestry:
+                chain = list(reversed(self.process_tree.ancestors(pid))) + [node]
+                nodes = list(enumerate(chain))
+                title = f"Lineage of {node.name} (pid {pid})"
+            else:
+                nodes = [(0, node)] + self.process_tree.descendants(pid)
+                title = f"Descendants of {node.name} (pid {pid})"
+            sections.append(self.formatter.format_process_tree(title, nodes))
+        if len(pids) > 5:
+            sections.append(f"...and {len(pids) - 5} more matching processes.")
+
+        response = "\n\n".join(sections)
+        self.memory.add_conversation(user_input, response, digest=self.formatter.digest_text(response))
+        return response
+
+    def _strip_job_options(self, user_input: str) -> str:
+        """Remove background/budget phrases before the request reaches a chain"""
+        return BUDGET_PATTERN.sub("", BACKGROUND_PATTERN.sub("", user_input)).strip()
+
+    def _handle_job_request(self, user_input: str) -> Optional[str]:
+        """Answer job listing, status/result and cancellation requests"""
+        if JOB_LIST_PATTERN.match(user_input):
+            return self.formatter.format_job_list(self.jobs.list_jobs())
+
+        match = JOB_CANCEL_PATTERN.search(user_input)
+        if match:
+            job_id = int(match.group(1))
+            if self.jobs.cancel(job_id):
+                return f"🛑 Cancelling job {job_id}."
+            job = self.jobs.get(job_id)
+            if job is None:
+                return self.formatter.format_error(f"There is no job {job_id}.")
+            return f"Job {job_id} already finished ({job.status.value})."
+
+        match = JOB_RESULT_PATTERN.search(user_input)
+        if match:
+            job_id = int(match.group(1) or match.group(2))
+            job = self.jobs.get(job_id)
+            if job is None:
+                return self.formatter.format_error(f"There is no job {job_id}.")
+            if not job.is_finished:
+                return self.formatter.format_job_status(job)
+            return self._format_job_result(job)
+
+        return None
+
+    def _format_job_result(self, job: Job) -> str:
+        """Format a finished job's result, recording it in memory the first time it is shown"""
+        record, job.recorded = not job.recorded, True
+        if job.kind == "osquery":
+            return self._finish_osquery(job.user_input or f"job {job.id}", job.target, job.result or [], job.error,
+                                        record=record)
+
+        if job.error:
+            formatted_response = self.formatter.format_error(f"Job {job.id} {job.status.value}: {job.error}")
+            if job.result:
+                formatted_response += "\n\n" + self.formatter.format_os_result(job.target, job.result)
+        else:
+            formatted_response = self.formatter.format_os_result(job.target, job.result)
+        if record:
+            self.memory.add_conversation(
+                job.user_input or f"job {job.id}", formatted_response,
+                digest=self.formatter.digest_command_output(job.target, job.result or "", job.error or "")
+            )
+        return formatted_response
+
@@ -1,90 +1,630 @@
 import json
-from typing import List, Dict, Any
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from core.blob_store import BlobStore
+from core.semantic_index import VectorIndex, load_embedder, vector_to_bytes, vector_from_bytes
+
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    user TEXT NOT NULL,
+    lia TEXT NOT NULL,
+    digest TEXT,
+    query_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations (session_id, id);
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    query TEXT NOT NULL,
+    result TEXT NOT NULL DEFAULT '',
+    result_hash TEXT,
+    result_size INTEGER,
+    row_count INTEGER,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_queries_session ON queries (session_id, id);
+CREATE TABLE IF NOT EXISTS personal_info (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    task TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    session_id TEXT NOT NULL,
+    chain TEXT NOT NULL,
+    upto_id INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (session_id, chain)
+);
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    ref_id INTEGER NOT NULL,
+    session_id TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model, kind, ref_id)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_session ON embeddings (session_id, model);
+CREATE TABLE IF NOT EXISTS migrations (
+    source TEXT PRIMARY KEY,
+    migrated_at REAL NOT NULL
+);
+"""
+
+
+class RetentionPolicy:
+    """How much of one history table to keep per session."""
+
+    def __init__(self, max_rows: Optional[int] = None, max_age_days: Optional[float] = None):
+        """
+        Args:
+            max_rows: Newest rows kept per session (None keeps all)
+            max_age_days: Rows older than this are dropped (None keeps all)
+        """
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+
+
+DEFAULT_RETENTION = {
+    "conversations": RetentionPolicy(max_rows=1000, max_age_days=180),
+    "queries": RetentionPolicy(max_rows=200, max_age_days=30),
+}
+
+# Part of the stored embeddings' model key; bump it when _turn_content or
+# _query_content change so older vectors are re-embedded
+EMBEDDED_TEXT_FORMAT = "content"
+
 
 class MemoryManager:
-    def __init__(self, memory_file: str = "lia_memory.json"):
+    """
+    Conversation and query history in SQLite (WAL).
+
+    Every turn is a single indexed INSERT, so persistence cost doesn't grow with
+    history, and the TUI and CLI can share one database without clobbering each
+    other. Each client keeps its own named session, and retention is enforced
+    every few hundred inserts instead of slicing the history on every write.
+
+    Query results live in a content-addressed BlobStore; a query row holds only
+    the hash, row count and a summary, and results are decompressed on demand.
+
+    Turns and queries are also embedded by a background worker into an in-memory
+    VectorIndex (vectors are persisted alongside), so get_relevant_context can
+    find earlier material by meaning rather than recency.
+    """
+
+    def __init__(self, memory_file: str = "lia_memory.json", db_path: str = "data/lia_memory.sqlite3",
+                 session: Optional[str] = None, retention: Optional[Dict[str, RetentionPolicy]] = None,
+                 prune_every: int = 200, blob_dir: str = "data/memory_blobs",
+                 max_blob_bytes: int = 256 * 1024 * 1024, semantic: bool = True):
+        """
+        Args:
+            memory_file: Legacy JSON memory file; imported once into this session
+            db_path: SQLite database shared by all sessions
+            session: Session name; defaults to the memory file's name so the TUI
+                ("Hound_memory") and CLI ("lia_memory") keep separate histories
+            retention: Per-table retention policies overriding DEFAULT_RETENTION
+            prune_every: Inserts between retention passes
+            blob_dir: Blob store for query results (shared by all sessions)
+            max_blob_bytes: Compressed result bytes kept; older results beyond
+                this are dropped (their summaries stay)
+            semantic: Maintain the embedding index for get_relevant_context
+        """
         self.memory_file = memory_file
-        self.load_memory()
-    
-    def load_memory(self):
-        """Load memory from file"""
-        try:
-            with open(self.memory_file, "r") as f:
-                self.memory = json.load(f)
-            
-            # Ensure all required keys exist
-            required_keys = ["conversations", "personal_info", "tasks", "queries"]
-            for key in required_keys:
-                if key not in self.memory:
-                    if key == "queries":
-                        self.memory[key] = []
-                    elif key == "conversations":
-                        self.memory[key] = []
-                    elif key == "personal_info":
-                        self.memory[key] = {}
-                    elif key == "tasks":
-                        self.memory[key] = []
-        except FileNotFoundError:
-            # Initialize with default structure
-            self.memory = {
-                "conversations": [],
-                "personal_info": {},
-                "tasks": [],
-                "queries": []  # For storing osquery history
-            }
-            self.save_memory()
-        except Exception:
-            # Fallback if file is corrupted
-            self.memory = {
-                "conversations": [],
-                "personal_info": {},
-                "tasks": [],
-                "queries": []
-            }
-            self.save_memory()
-    
-    def save_memory(self):
-        """Save memory to file"""
+        self.db_path = db_path
+        self.session = session or os.path.splitext(os.path.basename(memory_file))[0] or "default"
+        self.retention = dict(DEFAULT_RETENTION)
+        if retention:
+            self.retention.update(retention)
+        self.prune_every = prune_every
+        self.blobs = BlobStore(blob_dir)
+        self.max_blob_bytes = max_blob_bytes
+        self._inserts = 0
+        self._lock = threading.Lock()  # Background jobs write to memory from worker threads
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+
+        self.session_id = self._open_session(self.session)
+        self.migrate_json(memory_file)
+        self.prune()
+
+        # Embedding index, filled by a background worker so adding a turn stays O(1)
+        self._embedder = None
+        self._index: Optional[VectorIndex] = None
+        self._indexed = set()  # (kind, ref_id) already in the index
+        self._embed_queue: "queue.Queue" = queue.Queue()
+        if semantic:
+            threading.Thread(target=self._index_worker, name="lia-memory-index", daemon=True).start()
+
+    def _init_schema(self):
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 2:
+                self._add_columns("conversations", {"digest": "TEXT", "query_id": "INTEGER"})
+            if version < 3:
+                self._add_columns("queries", {
+                    "result_hash": "TEXT", "result_size": "INTEGER", "row_count": "INTEGER", "summary": "TEXT"
+                })
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_queries_result_hash ON queries (result_hash)")
+                # Move results stored inline by older versions into the blob store
+                inline = self.conn.execute("SELECT id, result FROM queries WHERE result != ''").fetchall()
+                for query_id, result in inline:
+                    result_hash, result_size = self.blobs.put(result)
+                    self.conn.execute(
+                        "UPDATE queries SET result = '', result_hash = ?, result_size = ? WHERE id = ?",
+                        (result_hash, result_size, query_id)
+                    )
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _add_columns(self, table: str, columns: Dict[str, str]):
+        existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        for name, declaration in columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+    def _open_session(self, name: str) -> str:
+        """Sessions are keyed by name so a client resumes its own history"""
+        row = self.conn.execute("SELECT id FROM sessions WHERE name = ?", (name,)).fetchone()
+        if row:
+            return row[0]
+        session_id = uuid.uuid4().hex
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO sessions (id, name, started_at) VALUES (?, ?, ?)", (session_id, name, time.time())
+            )
+        return session_id
+
+    def migrate_json(self, memory_file: str) -> bool:
+        """
+        Import a legacy JSON memory file into the current session (once per file)
+
+        Returns:
+            True if the file was imported by this call
+        """
+        source = os.path.abspath(memory_file)
+        if not os.path.exists(source):
+            return False
+        if self.conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+            return False
         try:
-            with open(self.memory_file, "w") as f:
-                json.dump(self.memory, f, indent=4)
+            with open(source, "r") as f:
+                legacy = json.load(f)
         except Exception as e:
+            print(f"Warning: Could not migrate memory from {memory_file}: {e}")
+            legacy = {}
+        if not isinstance(legacy, dict):
+            legacy = {}
+
+        now = time.time()
+        conversations = legacy.get("conversations", []) or []
+        queries = legacy.get("queries", []) or []
+        with self._lock, self.conn:
+            # Legacy entries have no timestamps; space them out so ordering survives
+            self.conn.executemany(
+                "INSERT INTO conversations (session_id, created_at, user, lia) VALUES (?, ?, ?, ?)",
+                [(self.session_id, now - (len(conversations) - i) * 1e-3, str(c.get("user", "")), str(c.get("lia", "")))
+                 for i, c in enumerate(conversations) if isinstance(c, dict)]
+            )
+            query_rows = []
+            for i, q in enumerate(queries):
+                if not isinstance(q, dict):
+                    continue
+                # Legacy results are Python reprs; keep the text as an opaque blob
+                result_hash, result_size = self.blobs.put(str(q.get("result", "")))
+                query_rows.append((self.session_id, now - (len(queries) - i) * 1e-3, str(q.get("query", "")),
+                                   result_hash, result_size, "imported result"))
+            self.conn.executemany(
+                "INSERT INTO queries (session_id, created_at, query, result_hash, result_size, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                query_rows
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO personal_info (key, value) VALUES (?, ?)",
+                [(str(k), json.dumps(v)) for k, v in (legacy.get("personal_info") or {}).items()]
+            )
+            self.conn.executemany(
+                "INSERT INTO tasks (session_id, created_at, task) VALUES (?, ?, ?)",
+                [(self.session_id, now, json.dumps(t)) for t in legacy.get("tasks", []) or []]
+            )
+            self.conn.execute("INSERT INTO migrations (source, migrated_at) VALUES (?, ?)", (source, now))
+        return True
+
+    def _insert(self, sql: str, params: tuple) -> Optional[int]:
+        try:
+            with self._lock, self.conn:
+                row_id = self.conn.execute(sql, params).lastrowid
+                self._inserts += 1
+                due = self._inserts % self.prune_every == 0
+            if due:
+                self.prune()
+            return row_id
+        except sqlite3.Error as e:
             print(f"Warning: Could not save memory: {e}")
-    
-    def add_conversation(self, user_input: str, response: str):
-        """Add a conversation turn to memory"""
-        self.memory["conversations"].append({
-            "user": user_input,
-            "lia": response
-        })
-        # Keep only last 50 conversations to prevent memory bloat
-        if len(self.memory["conversations"]) > 50:
-            self.memory["conversations"] = self.memory["conversations"][-50:]
-        self.save_memory()
-    
-    def add_query(self, query: str, result: str):
-        """Add an osquery to memory"""
-        self.memory["queries"].append({
-            "query": query,
-            "result": result
-        })
-        # Keep only last 20 queries
-        if len(self.memory["queries"]) > 20:
-            self.memory["queries"] = self.memory["queries"][-20:]
-        self.save_memory()
-    
-    def get_recent_conversations(self, count: int = 5) -> List[Dict[str, str]]:
-        """Get recent conversation history"""
-        return self.memory["conversations"][-count:] if self.memory["conversations"] else []
-    
-    def get_recent_queries(self, count: int = 3) -> List[Dict[str, str]]:
-        """Get recent osquery history"""
-        queries = self.memory.get("queries", [])
-        return queries[-count:] if queries else []
-    
+            return None
+
+    def prune(self):
+        """Apply the retention policies to the current session, then collect result blobs"""
+        now = time.time()
+        try:
+            with self._lock, self.conn:
+                for table, policy in self.retention.items():
+                    if policy.max_age_days is not None:
+                        self.conn.execute(
+                            f"DELETE FROM {table} WHERE session_id = ? AND created_at < ?",
+                            (self.session_id, now - policy.max_age_days * 86400)
+                        )
+                    if policy.max_rows is not None:
+                        self.conn.execute(
+                            f"DELETE FROM {table} WHERE session_id = ? AND id <= ("
+                            f"SELECT id FROM {table} WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                            (self.session_id, self.session_id, policy.max_rows)
+                        )
+                for kind, table in (("conversation", "conversations"), ("query", "queries")):
+                    self.conn.execute(
+                        f"DELETE FROM embeddings WHERE session_id = ? AND kind = ? AND ref_id NOT IN ("
+                        f"SELECT id FROM {table} WHERE session_id = ?)",
+                        (self.session_id, kind, self.session_id)
+                    )
+        except sqlite3.Error as e:
+            print(f"Warning: Could not prune memory: {e}")
+            return
+        self.collect_blobs()
+
+    def collect_blobs(self):
+        """
+        Bound the blob store to max_blob_bytes and delete unreferenced blobs
+
+        Results are kept newest first across all sessions; rows whose result
+        falls outside the budget lose their blob but keep their summary.
+        """
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT id, result_hash, COALESCE(result_size, 0) FROM queries "
+                    "WHERE result_hash IS NOT NULL ORDER BY id DESC"
+                ).fetchall()
+                live, budget, expired = set(), 0, []
+                for query_id, result_hash, size in rows:
+                    if result_hash in live:
+                        continue
+                    if budget + size > self.max_blob_bytes:
+                        expired.append(result_hash)
+                        continue
+                    live.add(result_hash)
+                    budget += size
+                if expired:
+                    with self.conn:
+                        self.conn.executemany(
+                            "UPDATE queries SET result_hash = NULL WHERE result_hash = ?",
+                            [(result_hash,) for result_hash in expired]
+                        )
+            self.blobs.collect(live)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: Could not collect result blobs: {e}")
+
+    def add_conversation(self, user_input: str, response: str, digest: Optional[str] = None,
+                         query_id: Optional[int] = None) -> Optional[int]:
+        """
+        Add a conversation turn to memory
+
+        Args:
+            user_input: What the user asked
+            response: Full response shown to the user
+            digest: Compact stand-in for tool output, used in history instead of response
+            query_id: Handle of the stored osquery result behind this turn
+
+        Returns:
+            Conversation id (handle for get_full_response), None if it couldn't be saved
+        """
+        conversation_id = self._insert(
+            "INSERT INTO conversations (session_id, created_at, user, lia, digest, query_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self.session_id, time.time(), user_input, response, digest, query_id)
+        )
+        if conversation_id is not None:
+            self._embed_queue.put(("conversation", conversation_id, _turn_content(user_input, digest or response)))
+        return conversation_id
+
+    def add_query(self, query: str, results: Any, summary: Optional[str] = None) -> Optional[int]:
+        """
+        Add an osquery and its results to memory
+
+        Args:
+            query: SQL that was run
+            results: Result rows (any JSON-serialisable value); written once to the blob store
+            summary: Short description kept inline; defaults to row count and columns
+
+        Returns:
+            Query id (handle for get_query_result), None if it couldn't be saved
+        """
+        row_count = len(results) if isinstance(results, list) else None
+        if summary is None:
+            summary = f"{row_count if row_count is not None else '?'} row(s)"
+            if row_count and isinstance(results[0], dict):
+                summary += "; columns: " + ", ".join(list(results[0].keys())[:20])
+        try:
+            result_hash, result_size = self.blobs.put(results)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Warning: Could not store query result: {e}")
+            result_hash, result_size = None, None
+        query_id = self._insert(
+            "INSERT INTO queries (session_id, created_at, query, result_hash, result_size, row_count, summary) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.session_id, time.time(), query, result_hash, result_size, row_count, summary)
+        )
+        if query_id is not None:
+            self._embed_queue.put(("query", query_id, _query_content(query, summary)))
+        return query_id
+
+    def _index_worker(self):
+        """Load the embedder and stored vectors, backfill, then embed new items as they arrive"""
+        try:
+            embedder = load_embedder()
+            self._load_index(embedder)
+        except Exception as e:
+            print(f"Warning: Semantic memory unavailable: {e}")
+            return
+        while True:
+            item = self._embed_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < 64:
+                try:
+                    item = self._embed_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._embed_items(batch)
+                    return
+                batch.append(item)
+            self._embed_items(batch)
+
+    def _load_index(self, embedder):
+        dim = embedder.encode(["probe"]).shape[1]
+        index = VectorIndex(dim)
+        model_key = f"{embedder.name}/{EMBEDDED_TEXT_FORMAT}"
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT kind, ref_id, vector FROM embeddings WHERE session_id = ? AND model = ?",
+                (self.session_id, model_key)
+            ).fetchall()
+        keys = [(kind, ref_id) for kind, ref_id, _ in rows]
+        if rows:
+            index.add_many(keys, [vector_from_bytes(vector, dim) for _, _, vector in rows])
+        self._indexed.update(keys)
+        self._embedder, self._index, self._model_key = embedder, index, model_key
+
+        # Turns stored before the index existed (or with another embedder)
+        with self._lock:
+            missing = [("conversation", ref_id, _turn_content(user, lia)) for ref_id, user, lia in self.conn.execute(
+                "SELECT id, user, COALESCE(digest, lia) FROM conversations c WHERE session_id = ? AND NOT EXISTS ("
+                "SELECT 1 FROM embeddings e WHERE e.model = ? AND e.kind = 'conversation' AND e.ref_id = c.id)",
+                (self.session_id, model_key)
+            )]
+            missing += [("query", ref_id, _query_content(query, summary)) for ref_id, query, summary in self.conn.execute(
+                "SELECT id, query, summary FROM queries q WHERE session_id = ? AND NOT EXISTS ("
+                "SELECT 1 FROM embeddings e WHERE e.model = ? AND e.kind = 'query' AND e.ref_id = q.id)",
+                (self.session_id, model_key)
+            )]
+        for start in range(0, len(missing), 64):
+            self._embed_items(missing[start:start + 64])
+
+    def _embed_items(self, items: List[Tuple[str, int, str]]):
+        items = [item for item in items if (item[0], item[1]) not in self._indexed]
+        if not items:
+            return
+        try:
+            vectors = self._embedder.encode([text for _, _, text in items])
+            with self._lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, kind, ref_id, session_id, vector) VALUES (?, ?, ?, ?, ?)",
+                    [(self._model_key, kind, ref_id, self.session_id, vector_to_bytes(vector))
+                     for (kind, ref_id, _), vector in zip(items, vectors)]
+                )
+        except Exception as e:
+            print(f"Warning: Could not index memory: {e}")
+            return
+        keys = [(kind, ref_id) for kind, ref_id, _ in items]
+        self._index.add_many(keys, vectors)
+        self._indexed.update(keys)
+
+    def get_relevant_context(self, user_input: str, k: int = 5, exclude: Iterable[Tuple[str, int]] = (),
+                             min_score: Optional[float] = None, turn=None) -> List[Dict[str, Any]]:
+        """
+        Earlier turns and queries most similar to user_input
+
+        Args:
+            user_input: Text to match against
+            k: Maximum number of items
+            exclude: (kind, id) pairs to skip, e.g. turns already in the prompt
+            min_score: Minimum cosine similarity (default: the embedder's min_score,
+                higher for the hashing fallback, whose collisions alone score ~0.2)
+            turn: TurnContext; its embedding is used when it comes from the index's model
+
+        Returns:
+            List of {"kind": "conversation"/"query", "id", "text", "score"}, best
+            first; empty while the index is still loading
+        """
+        if self._index is None or not user_input.strip():
+            return []
+        exclude = set(exclude)
+        if min_score is None:
+            min_score = getattr(self._embedder, "min_score", 0.15)
+        vector = None
+        if turn is not None:
+            vector = turn.embedding_for(getattr(self._embedder, "model_name", None))
+        if vector is None:
+            vector = self._embedder.encode([user_input])[0]
+        results = []
+        for (kind, ref_id), score in self._index.search(vector, 2 * k + len(exclude)):
+            if score < min_score or len(results) >= k:
+                break
+            if (kind, ref_id) in exclude:
+                continue
+            with self._lock:
+                if kind == "conversation":
+                    row = self.conn.execute(
+                        "SELECT user, COALESCE(digest, lia) FROM conversations WHERE id = ?", (ref_id,)
+                    ).fetchone()
+                    text = _turn_text(*row) if row else None
+                else:
+                    row = self.conn.execute("SELECT query, summary FROM queries WHERE id = ?", (ref_id,)).fetchone()
+                    text = _query_text(*row) if row else None
+            if text is not None:  # Rows dropped by retention stay in the index until restart
+                results.append({"kind": kind, "id": ref_id, "text": text, "score": score})
+        return results
+
+    def get_recent_conversations(self, count: int = 5) -> List[Dict[str, Any]]:
+        """
+        Get recent conversation history
+
+        Tool turns come back as their digest under "lia"; the full response is
+        available through get_full_response(id).
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, user, COALESCE(digest, lia), query_id FROM conversations "
+                "WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (self.session_id, count)
+            ).fetchall()
+        return [{"id": conversation_id, "user": user, "lia": lia, "query_id": query_id}
+                for conversation_id, user, lia, query_id in reversed(rows)]
+
+    def get_conversations_between(self, after_id: int, upto_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest `limit` turns with after_id < id <= upto_id, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, user, COALESCE(digest, lia) FROM conversations "
+                "WHERE session_id = ? AND id > ? AND id <= ? ORDER BY id DESC LIMIT ?",
+                (self.session_id, after_id, upto_id, limit)
+            ).fetchall()
+        return [{"id": conversation_id, "user": user, "lia": lia} for conversation_id, user, lia in reversed(rows)]
+
+    def get_summary(self, chain: str) -> Tuple[int, str]:
+        """Rolling summary of a chain's aged-out turns as (last folded id, text)"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT upto_id, summary FROM summaries WHERE session_id = ? AND chain = ?",
+                (self.session_id, chain)
+            ).fetchone()
+        return (row[0], row[1]) if row else (0, "")
+
+    def save_summary(self, chain: str, upto_id: int, summary: str):
+        try:
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO summaries (session_id, chain, upto_id, summary) VALUES (?, ?, ?, ?)",
+                    (self.session_id, chain, upto_id, summary)
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: Could not save summary: {e}")
+
+    def get_full_response(self, conversation_id: int) -> Optional[str]:
+        """Full response of a conversation turn, including complete tool output"""
+        with self._lock:
+            row = self.conn.execute("SELECT lia FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_query(self, query_id: int) -> Optional[Dict[str, Any]]:
+        """Stored osquery with its summary (the result itself is not loaded)"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, query, summary, row_count, result_hash FROM queries WHERE id = ?", (query_id,)
+            ).fetchone()
+        return self._query_dict(row) if row else None
+
+    def get_query_result(self, query_id: int) -> Optional[Any]:
+        """
+        Decompress a stored query result
+
+        Returns:
+            The result rows (imported legacy entries return their text), or
+            None if the result was garbage-collected
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT result_hash, result FROM queries WHERE id = ?", (query_id,)).fetchone()
+        if row is None:
+            return None
+        result_hash, legacy_result = row
+        if result_hash:
+            return self.blobs.get(result_hash)
+        return legacy_result or None
+
+    def get_recent_queries(self, count: int = 3) -> List[Dict[str, Any]]:
+        """Get recent osquery history (summaries only)"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, query, summary, row_count, result_hash FROM queries "
+                "WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (self.session_id, count)
+            ).fetchall()
+        return [self._query_dict(row) for row in reversed(rows)]
+
+    @staticmethod
+    def _query_dict(row: tuple) -> Dict[str, Any]:
+        query_id, query, summary, row_count, result_hash = row
+        return {"id": query_id, "query": query, "summary": summary or "", "row_count": row_count,
+                "result_hash": result_hash}
+
+    def get_personal_info(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self.conn.execute("SELECT key, value FROM personal_info").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
     def get_memory_context(self) -> Dict[str, Any]:
         """Get all memory context for prompt building"""
         return {
             "conversations": self.get_recent_conversations(),
             "queries": self.get_recent_queries()
-        }
\ No newline at end of file
+        }
+
+    def close(self):
+        self._embed_queue.put(None)
+        with self._lock:
+            self.conn.close()
+
+
+def _turn_text(user: str, lia: str) -> str:
+    return f"User: {user}\nLia: {lia or ''}"[:2000]
+
+
+def _query_text(query: str, summary: Optional[str]) -> str:
+    return f"Query: {query}\nResult: {summary or ''}"
+
+
+# What gets embedded is the content alone: with the "User:"/"Lia:" labels every
+# turn shares the same words, which lifted unrelated turns over the threshold
+def _turn_content(user: str, lia: str) -> str:
+    return f"{user}\n{lia or ''}"[:2000]
+
+
+def _query_content(query: str, summary: Optional[str]) -> str:
+    return f"{query}\n{summary or ''}"
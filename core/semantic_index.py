@@ -0,0 +1,124 @@
+"""
+Embedding index over stored conversation turns and queries.
+
+Vectors are L2-normalised float32 rows of one growable matrix, so adding an
+item is amortised O(1) and a lookup is a single matrix-vector product plus a
+partial sort. That scan is memory-bound: 100k x 384 floats is ~150 MB per
+lookup, a few milliseconds with multi-threaded BLAS.
+"""
+import hashlib
+import re
+import threading
+from typing import List, Tuple, Hashable, Iterable, Optional
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_./-]+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free fallback embedder: signed feature hashing of words and
+    word bigrams. Good enough to find earlier turns about the same process,
+    path or table when sentence-transformers isn't installed.
+    """
+
+    min_score = 0.25  # Hash collisions alone give unrelated texts up to ~0.2
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+                vectors[row, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return _normalise(vectors)
+
+
+class SentenceEmbedder:
+    """rag.embedder.Embedder (sentence-transformers) behind the same interface."""
+
+    min_score = 0.15
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from rag.embedder import get_embedder
+        self.embedder = get_embedder(model_name)  # Shared with retrieval: one model, one cache
+        self.embedder.model  # Load now, so a missing install falls back to HashingEmbedder
+        self.model_name = model_name
+        self.name = f"st-{model_name}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = self.embedder.embed(texts, dtype="float32")
+        return _normalise(vectors.reshape(len(texts), -1))
+
+
+def load_embedder():
+    """The sentence-transformers embedder when available, else HashingEmbedder"""
+    try:
+        return SentenceEmbedder()
+    except Exception:
+        return HashingEmbedder()
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """In-memory cosine-similarity index with amortised O(1) appends."""
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._keys: List[Hashable] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: Hashable, vector: np.ndarray):
+        self.add_many([key], vector.reshape(1, -1))
+
+    def add_many(self, keys: Iterable[Hashable], vectors: np.ndarray):
+        keys = list(keys)
+        if not keys:
+            return
+        with self._lock:
+            size = len(self._keys)
+            needed = size + len(keys)
+            if needed > len(self._vectors):
+                capacity = max(needed, 2 * len(self._vectors))
+                grown = np.zeros((capacity, self.dim), dtype=np.float32)
+                grown[:size] = self._vectors[:size]
+                self._vectors = grown
+            self._vectors[size:needed] = vectors
+            self._keys.extend(keys)
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[Hashable, float]]:
+        """The k most similar keys as (key, cosine similarity), best first"""
+        with self._lock:
+            size = len(self._keys)
+            if size == 0 or k <= 0:
+                return []
+            scores = self._vectors[:size] @ vector.astype(np.float32).reshape(-1)
+            keys = self._keys
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(keys[i], float(scores[i])) for i in top]
+
+
+def vector_to_bytes(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def vector_from_bytes(data: bytes, dim: Optional[int] = None) -> np.ndarray:
+    vector = np.frombuffer(data, dtype=np.float32)
+    return vector if dim is None else vector.reshape(dim)
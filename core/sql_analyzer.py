@@ -0,0 +1,297 @@
+"""
+Token-level analysis of generated osquery SQL.
+
+The statement is scanned into real SQL tokens (string literals, quoted
+identifiers and comments are recognised as such), so a column named
+`delay`, a `created_at` filter or `'--'` inside a LIKE pattern are never
+mistaken for keywords. From the tokens we derive the statement count and
+type, the tables read, the join count and the functions called, and the
+safety rules are checked against those. Analyses are cached per normalised
+statement, so SafetyChecker and OsqueryChain share one parse per query.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<param>[?:@$][A-Za-z0-9_]*)
+  | (?P<op>\|\||<<|>>|<=|>=|==|!=|<>|[-+*/%&|~<>=(),.;])
+""", re.VERBOSE | re.DOTALL)
+
+# Keywords that can follow an identifier and a "(" without being a function call
+NON_FUNCTION_KEYWORDS = {"in", "exists", "as", "on", "using", "values", "from", "join", "where", "and", "or",
+                         "not", "select", "over", "filter", "when", "then", "else", "is", "like", "glob", "between"}
+JOIN_MODIFIERS = {"natural", "left", "right", "full", "inner", "outer", "cross"}
+COMPOUND_OPERATORS = {"union", "intersect", "except"}
+
+# Functions that stall or exhaust the process, or reach outside the query
+BLOCKED_FUNCTIONS = {
+    "sleep": "Time-delay functions are not allowed",
+    "delay": "Time-delay functions are not allowed",
+    "pg_sleep": "Time-delay functions are not allowed",
+    "benchmark": "Time-delay functions are not allowed",
+    "waitfor": "Time-delay functions are not allowed",
+    "randomblob": "Large blob generation is not allowed",
+    "zeroblob": "Large blob generation is not allowed",
+    "load_extension": "Loading extensions is not allowed",
+    "readfile": "File access functions are not allowed",
+    "writefile": "File access functions are not allowed",
+    "fts3_tokenizer": "Tokenizer registration is not allowed",
+}
+
+MAX_JOINS = 3
+
+# Tables that could expose sensitive data
+SENSITIVE_TABLES = {"keychain_items", "shadow", "etc_shadow"}
+
+
+class SqlSyntaxError(ValueError):
+    """The statement could not be tokenised."""
+
+
+class SqlAnalysis:
+    """What a statement does, as read from its tokens."""
+
+    def __init__(self):
+        self.statement_count = 0
+        self.statement_type = ""
+        self.tables: List[str] = []
+        self.join_count = 0
+        self.functions: Set[str] = set()
+        self.compound = False  # UNION / INTERSECT / EXCEPT
+        self.has_comments = False
+        self.error: Optional[str] = None
+
+
+class SqlAnalyzer:
+    """Tokenises SQL and checks it against the osquery safety rules, with a cache."""
+
+    def __init__(self, cache_size: int = 1024, blocked_tables: Optional[Set[str]] = None):
+        """
+        Args:
+            cache_size: Analyses kept, keyed by normalised SQL
+            blocked_tables: Tables queries may not read
+        """
+        self.cache_size = cache_size
+        self.blocked_tables = {table.lower() for table in (blocked_tables or ())}
+        self._cache: "OrderedDict[str, SqlAnalysis]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analyze(self, sql: str) -> SqlAnalysis:
+        key = normalise_sql(sql)
+        with self._lock:
+            analysis = self._cache.get(key)
+            if analysis is not None:
+                self._cache.move_to_end(key)
+                return analysis
+        analysis = _analyze(key)
+        with self._lock:
+            self._cache[key] = analysis
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return analysis
+
+    def check(self, sql: str) -> Tuple[bool, str]:
+        """
+        Check a statement against the safety rules
+
+        Returns:
+            (is_safe, reason)
+        """
+        analysis = self.analyze(sql)
+        if analysis.error:
+            return False, f"Could not parse query: {analysis.error}"
+        if analysis.statement_count != 1:
+            return False, "Exactly one statement is allowed"
+        if analysis.statement_type != "select":
+            return False, "Destructive operations are not allowed"
+        if analysis.has_comments:
+            return False, "Comments are not allowed"
+        if analysis.compound:
+            return False, "UNION queries are not allowed"
+        if analysis.join_count > MAX_JOINS:
+            return False, "Excessive JOIN operations are not allowed"
+        for function in sorted(analysis.functions):
+            if function in BLOCKED_FUNCTIONS:
+                return False, BLOCKED_FUNCTIONS[function]
+        for table in analysis.tables:
+            if table in self.blocked_tables:
+                return False, f"Table {table} is not allowed"
+        if not analysis.tables:
+            return False, "Query does not read from a table"
+        return True, "Safe"
+
+
+def normalise_sql(sql: str) -> str:
+    """Cache key: trimmed, whitespace-collapsed, without a trailing semicolon"""
+    return " ".join(sql.split()).rstrip(";").rstrip()
+
+
+def tokenize(sql: str) -> List[Tuple[str, str]]:
+    """
+    (kind, text) tokens; kinds are comment, string, quoted, number, word, param and op
+
+    Raises:
+        SqlSyntaxError: Unterminated literal or an unexpected character
+    """
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = TOKEN_PATTERN.match(sql, position)
+        if match is None:
+            if sql[position] in "'\"`[":
+                raise SqlSyntaxError("unterminated quote")
+            raise SqlSyntaxError(f"unexpected character {sql[position]!r}")
+        kind = match.lastgroup
+        if kind != "space":
+            tokens.append((kind, match.group()))
+        position = match.end()
+    return tokens
+
+
+def _analyze(sql: str) -> SqlAnalysis:
+    analysis = SqlAnalysis()
+    try:
+        tokens = tokenize(sql)
+    except SqlSyntaxError as e:
+        analysis.error = str(e)
+        return analysis
+
+    analysis.has_comments = any(kind == "comment" for kind, _ in tokens)
+    tokens = [(kind, text.lower() if kind == "word" else text) for kind, text in tokens if kind != "comment"]
+
+    statements: List[List[Tuple[str, str]]] = [[]]
+    for token in tokens:
+        if token == ("op", ";"):
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    statements = [statement for statement in statements if statement]
+    analysis.statement_count = len(statements)
+    if not statements:
+        return analysis
+
+    statement = statements[0]
+    analysis.statement_type = _statement_type(statement)
+    ctes = _cte_names(statement)
+    depth = 0
+    expect_table = False
+    skip_to = -1
+    for i, (kind, text) in enumerate(statement):
+        if i <= skip_to:
+            continue  # Rest of a schema-qualified table name
+        following = statement[i + 1] if i + 1 < len(statement) else None
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        if kind == "word":
+            if following == ("op", "(") and text not in NON_FUNCTION_KEYWORDS:
+                analysis.functions.add(text)
+            if text in COMPOUND_OPERATORS:
+                analysis.compound = True
+            if text == "join":
+                analysis.join_count += 1
+            if text in ("from", "join"):
+                expect_table = True
+                continue
+        if expect_table:
+            # SQLite also takes a string literal where a table name is expected
+            last = _qualified_name_end(statement, i) if kind in ("word", "quoted", "string") else i
+            after = statement[last + 1] if last + 1 < len(statement) else None
+            if kind in ("word", "quoted", "string") and after != ("op", "("):
+                # schema.table is recorded as the table itself
+                name = statement[last][1].strip("'\"`[]").lower()
+                if last > i or name not in ctes:
+                    analysis.tables.append(name)
+                skip_to = last
+                expect_table = False
+            elif text == ",":
+                pass
+            else:
+                expect_table = False  # Subquery or table-valued function
+            continue
+        if text == "," and _in_from_clause(statement, i):
+            analysis.join_count += 1  # Comma join
+            expect_table = True
+    return analysis
+
+
+def _qualified_name_end(statement: List[Tuple[str, str]], index: int) -> int:
+    """Index of the last part of a dotted name starting at index"""
+    while (index + 2 < len(statement) and statement[index + 1] == ("op", ".")
+           and statement[index + 2][0] in ("word", "quoted", "string")):
+        index += 2
+    return index
+
+
+def _statement_type(statement: List[Tuple[str, str]]) -> str:
+    """First top-level keyword, looking past a WITH clause"""
+    if statement[0][1] != "with":
+        return statement[0][1] if statement[0][0] == "word" else ""
+    depth = 0
+    for kind, text in statement[1:]:
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word" and text in ("select", "insert", "update", "delete", "replace", "values"):
+            return text
+    return ""
+
+
+def _cte_names(statement: List[Tuple[str, str]]) -> Set[str]:
+    names = set()
+    if statement[0][1] != "with":
+        return names
+    depth = 0
+    for i, (kind, text) in enumerate(statement):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and text == "as" and i > 0 and statement[i - 1][0] in ("word", "quoted"):
+            names.add(statement[i - 1][1].strip('"`[]').lower())
+        elif depth == 0 and text == "as" and i > 0 and statement[i - 1][1] == ")":
+            # WITH name(col, ...) AS (...): walk back over the column list
+            j, level = i - 1, 0
+            while j >= 0:
+                if statement[j][1] == ")":
+                    level += 1
+                elif statement[j][1] == "(":
+                    level -= 1
+                    if level == 0:
+                        break
+                j -= 1
+            if j > 0:
+                names.add(statement[j - 1][1].strip('"`[]').lower())
+    return names
+
+
+def _in_from_clause(statement: List[Tuple[str, str]], index: int) -> bool:
+    """True if the comma at index separates tables of a FROM list at its nesting level"""
+    depth = 0
+    for kind, text in reversed(statement[:index]):
+        if text == ")":
+            depth += 1
+        elif text == "(":
+            if depth == 0:
+                return False
+            depth -= 1
+        elif depth == 0 and kind == "word":
+            if text == "from":
+                return True
+            if text in ("select", "where", "group", "order", "having", "limit", "on", "using", "join", "values"):
+                return False
+    return False
+
+
+# Shared by SafetyChecker and OsqueryChain, so each generated query is parsed once
+SQL_ANALYZER = SqlAnalyzer(blocked_tables=SENSITIVE_TABLES)
@@ -0,0 +1,56 @@
+"""
+Per-turn state shared by everything that handles one user input.
+
+LiaMain.process_input creates a TurnContext and hands it down (as
+context["turn"]) to the chains, the context builder and memory. The input's
+embedding is computed on first demand and then reused, so a turn costs at
+most one embedding call however many consumers want it: retrieval over
+`osquery_docs` and `os_commands`, semantic memory, and any cache keyed by
+meaning rather than text. Turns that never need it (job requests, cache or
+lineage questions) never pay for it.
+"""
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class TurnContext:
+    """One user input and its lazily computed embedding."""
+
+    def __init__(self, user_input: str, embedder=None):
+        """
+        Args:
+            user_input: The request being handled (without job options)
+            embedder: rag.embedder.Embedder used for the input (None: no embedding)
+        """
+        self.user_input = user_input
+        self.embedder = embedder
+        self.embedding_calls = 0
+        self._embedding: Optional[np.ndarray] = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self) -> Optional[str]:
+        return getattr(self.embedder, "model_name", None)
+
+    @property
+    def embedding(self) -> Optional[np.ndarray]:
+        """The input's normalised float32 embedding, or None if it can't be computed"""
+        if self._embedding is None and not self._failed and self.embedder is not None:
+            with self._lock:  # Consumers on other threads wait for the one call
+                if self._embedding is None and not self._failed:
+                    self.embedding_calls += 1
+                    try:
+                        self._embedding = self.embedder.embed_query(self.user_input, dtype="float32")
+                    except Exception as e:
+                        print(f"Warning: Could not embed input: {e}")
+                        self._failed = True
+        return self._embedding
+
+    def embedding_for(self, model_name: str) -> Optional[np.ndarray]:
+        """The embedding if it comes from model_name (vectors of other models aren't comparable)"""
+        if self.embedder is None or self.model_name != model_name:
+            return None
+        return self.embedding
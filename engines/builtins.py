@@ -0,0 +1,557 @@
+"""
+In-process implementations of the most common read-only commands.
+
+`pwd`, `whoami`, `uname`, `df`, `free`, `ls`, `cat` and `ip addr` make up a
+large share of OS_COMMAND turns. Answering them from `os`, `statvfs`,
+`/proc` and `/sys` skips fork/exec entirely and keeps working in minimal
+containers that lack the binaries. Output follows the real tools (GNU
+coreutils, procps, iproute2) as they print to a pipe.
+
+run_builtin() returns None for anything it doesn't fully understand (other
+flags, shell syntax, globs), and the caller falls back to a real shell. The
+same goes for anything that could be large or block: builtins run in the
+assistant's own process, outside the output caps, resource limits, timeout
+and cancellation of the subprocess path, so `cat` only answers regular files
+up to CAT_MAX_BYTES in total.
+"""
+import grp
+import math
+import os
+import platform
+import pwd
+import shlex
+import socket
+import stat
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Anything needing a shell (pipes, redirection, expansion, globs) is not a builtin
+SHELL_SYNTAX = set("|&;<>()$`*?[]{}!\\\n")
+
+# Filesystems df leaves out by default
+PSEUDO_FILESYSTEMS = {
+    "proc", "sysfs", "cgroup", "cgroup2", "devpts", "mqueue", "securityfs", "pstore", "debugfs",
+    "tracefs", "configfs", "fusectl", "bpf", "hugetlbfs", "autofs", "binfmt_misc", "nsfs", "rpc_pipefs",
+    "selinuxfs", "efivarfs", "fuse.gvfsd-fuse", "fuse.portal"
+}
+
+# Largest total cat answers in-process; more goes through the subprocess path and its output caps
+CAT_MAX_BYTES = 256 * 1024
+
+BuiltinResult = Tuple[str, str, int]  # (stdout, stderr, exit status)
+
+
+def run_builtin(command: str, cwd: Optional[str] = None) -> Optional[BuiltinResult]:
+    """
+    Answer a command in-process
+
+    Args:
+        command: Command line as the user would type it
+        cwd: Working directory relative paths resolve against
+
+    Returns:
+        (stdout, stderr, exit status), or None if the command isn't a builtin
+    """
+    if platform.system() == "Windows" or any(c in SHELL_SYNTAX for c in command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    if not argv:
+        return None
+    handler = BUILTINS.get(argv[0])
+    if handler is None:
+        return None
+    cwd = cwd or os.getcwd()
+    try:
+        return handler(argv[1:], cwd)
+    except _Unsupported:
+        return None
+
+
+class _Unsupported(Exception):
+    """Raised by a handler for flags it doesn't implement."""
+
+
+def _flags(args: List[str], allowed: str) -> Tuple[set, List[str]]:
+    """Split short flags (combined or not) from operands; unknown flags are unsupported"""
+    flags, operands = set(), []
+    for arg in args:
+        if arg.startswith("-") and len(arg) > 1 and arg != "--":
+            if arg.startswith("--"):
+                raise _Unsupported()
+            for flag in arg[1:]:
+                if flag not in allowed:
+                    raise _Unsupported()
+                flags.add(flag)
+        else:
+            operands.append(arg)
+    return flags, operands
+
+
+def _resolve(path: str, cwd: str) -> str:
+    return os.path.join(cwd, os.path.expanduser(path))
+
+
+def _pwd(args: List[str], cwd: str) -> BuiltinResult:
+    _flags(args, "LP")
+    return cwd + "\n", "", 0
+
+
+def _whoami(args: List[str], cwd: str) -> BuiltinResult:
+    if args:
+        raise _Unsupported()
+    return _user_name(os.geteuid()) + "\n", "", 0
+
+
+def _uname(args: List[str], cwd: str) -> BuiltinResult:
+    flags, operands = _flags(args, "asnrvmo")
+    if operands:
+        raise _Unsupported()
+    info = os.uname()
+    operating_system = "GNU/Linux" if info.sysname == "Linux" else info.sysname
+    if "a" in flags:
+        flags = set("snrvmo")
+    flags = flags or {"s"}
+    fields = [("s", info.sysname), ("n", info.nodename), ("r", info.release),
+              ("v", info.version), ("m", info.machine), ("o", operating_system)]
+    return " ".join(value for flag, value in fields if flag in flags) + "\n", "", 0
+
+
+def _human(size: float, suffixes: Tuple[str, ...] = ("", "K", "M", "G", "T", "P", "E")) -> str:
+    """coreutils -h formatting: powers of 1024, rounded up, one decimal below 10"""
+    unit = 0
+    while size >= 1024 and unit < len(suffixes) - 1:
+        size /= 1024.0
+        unit += 1
+    if unit == 0:
+        return f"{int(size)}{suffixes[0]}"
+    if size < 10:
+        size = math.ceil(size * 10) / 10
+        if size < 10:
+            return f"{size:.1f}{suffixes[unit]}"
+    size = math.ceil(size)
+    if size >= 1024 and unit < len(suffixes) - 1:
+        return f"1.0{suffixes[unit + 1]}"
+    return f"{size}{suffixes[unit]}"
+
+
+def _mounts() -> List[Tuple[str, str, str]]:
+    """(device, mount point, fs type) from /proc/mounts; a remount keeps the first position but the last device"""
+    mounts: Dict[str, Tuple[str, str, str]] = {}
+    with open("/proc/mounts", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 3:
+                continue
+            device, mount_point, fs_type = (part.replace("\\040", " ") for part in parts[:3])
+            mounts[mount_point] = (device, mount_point, fs_type)
+    return list(mounts.values())
+
+
+def _df(args: List[str], cwd: str) -> BuiltinResult:
+    flags, operands = _flags(args, "hk")
+    human = "h" in flags
+    try:
+        mounts = _mounts()
+    except OSError:
+        raise _Unsupported()
+
+    selected = []
+    errors = []
+    if operands:
+        for operand in operands:
+            path = os.path.realpath(_resolve(operand, cwd))
+            if not os.path.exists(path):
+                errors.append(f"df: {operand}: No such file or directory")
+                continue
+            best = max((m for m in mounts if path == m[1] or path.startswith(m[1].rstrip("/") + "/")),
+                       key=lambda m: len(m[1]), default=None)
+            if best is not None:
+                selected.append(best)
+    else:
+        selected = [m for m in mounts if m[2] not in PSEUDO_FILESYSTEMS]
+
+    rows = []
+    for device, mount_point, fs_type in selected:
+        try:
+            st = os.statvfs(mount_point)
+        except OSError:
+            continue
+        if st.f_blocks == 0 and not operands:
+            continue
+        size = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        percent = f"{math.ceil(used * 100 / (used + avail))}%" if used + avail else "-"
+        if human:
+            values = [_human(size), _human(used), _human(avail)]
+        else:
+            values = [str(math.ceil(size / 1024)), str(math.ceil(used / 1024)), str(math.ceil(avail / 1024))]
+        rows.append([device] + values + [percent, mount_point])
+
+    header = ["Filesystem", "Size" if human else "1K-blocks", "Used", "Avail" if human else "Available",
+              "Use%", "Mounted on"]
+    min_widths = [14, 5 if human else 9, 5, 5 if human else 9, 4]
+    output = _columns([header] + rows, right_aligned={1, 2, 3, 4}, min_widths=min_widths) if rows or not errors else ""
+    return output, "\n".join(errors), 1 if errors else 0
+
+
+def _columns(rows: List[List[str]], right_aligned: set, min_widths: List[int] = ()) -> str:
+    """Align rows like coreutils: padded columns, last column left as is"""
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    widths = [max(width, minimum) for width, minimum in zip(widths, list(min_widths) + [0] * len(widths))]
+    lines = []
+    for row in rows:
+        cells = []
+        for i, cell in enumerate(row):
+            if i == len(row) - 1:
+                cells.append(cell)
+            elif i in right_aligned:
+                cells.append(cell.rjust(widths[i]))
+            else:
+                cells.append(cell.ljust(widths[i]))
+        lines.append(" ".join(cells))
+    return "\n".join(lines) + "\n"
+
+
+def _meminfo() -> Dict[str, int]:
+    """/proc/meminfo in bytes"""
+    values = {}
+    with open("/proc/meminfo", "r") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            parts = rest.split()
+            if parts:
+                values[name] = int(parts[0]) * (1024 if len(parts) > 1 else 1)
+    return values
+
+
+def _free(args: List[str], cwd: str) -> BuiltinResult:
+    flags, operands = _flags(args, "hbkmgw")
+    if operands or "w" in flags:
+        raise _Unsupported()
+    try:
+        info = _meminfo()
+    except OSError:
+        raise _Unsupported()
+
+    total = info.get("MemTotal", 0)
+    free = info.get("MemFree", 0)
+    buff_cache = info.get("Buffers", 0) + info.get("Cached", 0) + info.get("SReclaimable", 0)
+    available = info.get("MemAvailable", free)
+    used = total - available  # procps-ng 4.x definition
+    shared = info.get("Shmem", 0)
+    swap_total = info.get("SwapTotal", 0)
+    swap_free = info.get("SwapFree", 0)
+
+    if "h" in flags:
+        def fmt(value):
+            return _free_human(value)
+    else:
+        divisor = {"b": 1, "m": 1024 ** 2, "g": 1024 ** 3}.get(next((f for f in "bmg" if f in flags), "k"), 1024)
+
+        def fmt(value):
+            return str(value // divisor)
+
+    rows = [
+        ["", "total", "used", "free", "shared", "buff/cache", "available"],
+        ["Mem:", fmt(total), fmt(used), fmt(free), fmt(shared), fmt(buff_cache), fmt(available)],
+        ["Swap:", fmt(swap_total), fmt(swap_total - swap_free), fmt(swap_free)],
+    ]
+    lines = []
+    for row in rows:
+        lines.append(row[0].ljust(8) + "".join(cell.rjust(12) for cell in row[1:]))
+    return "\n".join(lines) + "\n", "", 0
+
+
+def _free_human(value: int) -> str:
+    """procps -h formatting: B, Ki, Mi, Gi, ... with one decimal below 10"""
+    units = ["B", "Ki", "Mi", "Gi", "Ti", "Pi"]
+    size = float(value)
+    unit = 0
+    while size >= 1024 and unit < len(units) - 1:
+        size /= 1024.0
+        unit += 1
+    if unit == 0:
+        return f"{int(size)}B"
+    return f"{size:.1f}{units[unit]}" if size < 10 else f"{int(size)}{units[unit]}"
+
+
+def _user_name(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def _group_name(gid: int) -> str:
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return str(gid)
+
+
+def _sort_key(name: str) -> Tuple[str, str]:
+    """ls ordering: byte order in the C locale, otherwise case and punctuation are secondary"""
+    collate = os.environ.get("LC_ALL") or os.environ.get("LC_COLLATE") or os.environ.get("LANG") or "C"
+    if collate in ("C", "POSIX") or collate.startswith("C."):
+        return "", name
+    return "".join(c for c in name.lower() if c.isalnum()), name
+
+
+def _ls_long(path: str, name: str, st: os.stat_result, human: bool, now: float) -> List[str]:
+    mode = stat.filemode(st.st_mode)
+    size = _human(st.st_size) if human else str(st.st_size)
+    if stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+        size = f"{os.major(st.st_rdev)}, {os.minor(st.st_rdev)}"
+    mtime = time.localtime(st.st_mtime)
+    if abs(now - st.st_mtime) < 182.5 * 86400:
+        when = time.strftime("%b %e %H:%M", mtime)
+    else:
+        when = time.strftime("%b %e  %Y", mtime)
+    entry = name
+    if stat.S_ISLNK(st.st_mode):
+        try:
+            entry += " -> " + os.readlink(path)
+        except OSError:
+            pass
+    return [mode, str(st.st_nlink), _user_name(st.st_uid), _group_name(st.st_gid), size, when, entry]
+
+
+def _ls(args: List[str], cwd: str) -> BuiltinResult:
+    flags, operands = _flags(args, "laAh1")
+    long_format = "l" in flags
+    human = "h" in flags
+    operands = operands or ["."]
+    now = time.time()
+
+    errors, files, directories = [], [], []
+    for operand in operands:
+        path = _resolve(operand, cwd)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            errors.append(f"ls: cannot access '{operand}': No such file or directory")
+            continue
+        if stat.S_ISDIR(st.st_mode) or (stat.S_ISLNK(st.st_mode) and not long_format and os.path.isdir(path)):
+            directories.append((operand, path))
+        else:
+            files.append((operand, path, st))
+
+    def render(entries) -> List[str]:
+        if not long_format:
+            return [name for name, _, _ in entries]
+        rows = [_ls_long(path, name, st, human, now) for name, path, st in entries]
+        if not rows:
+            return []
+        widths = [max(len(row[i]) for row in rows) for i in range(6)]
+        return [" ".join([row[0], row[1].rjust(widths[1]), row[2].ljust(widths[2]), row[3].ljust(widths[3]),
+                          row[4].rjust(widths[4]), row[5], row[6]]) for row in rows]
+
+    sections = []
+    if files:
+        sections.append("\n".join(render(sorted(files, key=lambda entry: _sort_key(entry[0])))))
+    for operand, path in sorted(directories, key=lambda entry: _sort_key(entry[0])):
+        try:
+            names = os.listdir(path)
+        except OSError as e:
+            errors.append(f"ls: cannot open directory '{operand}': {e.strerror}")
+            continue
+        if "a" in flags:
+            names += [".", ".."]
+        elif "A" not in flags:
+            names = [name for name in names if not name.startswith(".")]
+        entries = []
+        blocks = 0
+        for name in sorted(names, key=_sort_key):
+            entry_path = os.path.join(path, name)
+            try:
+                st = os.lstat(entry_path)
+            except OSError:
+                continue
+            blocks += st.st_blocks
+            entries.append((name, entry_path, st))
+        lines = render(entries)
+        if long_format:
+            total = math.ceil(blocks * 512 / 1024)
+            lines.insert(0, f"total {_human(total * 1024) if human else total}")
+        if len(operands) > 1:
+            lines.insert(0, f"{operand}:")
+        sections.append("\n".join(lines))
+
+    output = "\n\n".join(section for section in sections if section)
+    return (output + "\n" if output else ""), "\n".join(errors), 2 if errors else 0
+
+
+def _cat(args: List[str], cwd: str) -> BuiltinResult:
+    flags, operands = _flags(args, "")
+    if not operands or "-" in operands:
+        raise _Unsupported()  # Would read stdin
+    chunks, errors = [], []
+    remaining = CAT_MAX_BYTES
+    for operand in operands:
+        try:
+            # O_NONBLOCK: opening a FIFO must not wait for a writer before we can turn it down
+            fd = os.open(_resolve(operand, cwd), os.O_RDONLY | getattr(os, "O_NONBLOCK", 0))
+        except FileNotFoundError:
+            errors.append(f"cat: {operand}: No such file or directory")
+            continue
+        except PermissionError:
+            errors.append(f"cat: {operand}: Permission denied")
+            continue
+        except OSError as e:
+            errors.append(f"cat: {operand}: {e.strerror}")
+            continue
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or st.st_size > remaining:
+            os.close(fd)
+            if stat.S_ISDIR(st.st_mode):
+                errors.append(f"cat: {operand}: Is a directory")
+                continue
+            raise _Unsupported()  # FIFOs, devices and big files go through the capped subprocess path
+        with os.fdopen(fd, "r", errors="replace") as f:
+            chunk = f.read(remaining + 1)  # /proc files report size 0, so bound the read itself
+        if len(chunk) > remaining:
+            raise _Unsupported()
+        remaining -= len(chunk)
+        chunks.append(chunk)
+    return "".join(chunks), "\n".join(errors), 1 if errors else 0
+
+
+def _ip(args: List[str], cwd: str) -> BuiltinResult:
+    if not args or args[0] not in ("a", "addr", "address"):
+        raise _Unsupported()
+    rest = args[1:]
+    if rest and rest[0] in ("show", "list", "ls"):
+        rest = rest[1:]
+    device = None
+    if rest[:1] == ["dev"] and len(rest) == 2:
+        device = rest[1]
+    elif len(rest) == 1:
+        device = rest[0]
+    elif rest:
+        raise _Unsupported()
+    if not os.path.isdir("/sys/class/net"):
+        raise _Unsupported()
+
+    try:
+        interfaces = sorted(socket.if_nameindex())
+    except OSError:
+        raise _Unsupported()
+    if device is not None:
+        interfaces = [(index, name) for index, name in interfaces if name == device]
+        if not interfaces:
+            return "", f'Device "{device}" does not exist.', 1
+
+    ipv6 = _ipv6_addresses()
+    blocks = []
+    for index, name in interfaces:
+        blocks.append(_ip_interface(index, name, ipv6.get(name, [])))
+    return "\n".join(blocks) + "\n", "", 0
+
+
+IFF_FLAGS = [(0x1, "UP"), (0x2, "BROADCAST"), (0x8, "LOOPBACK"), (0x10, "POINTOPOINT"),
+             (0x80, "NOARP"), (0x1000, "MULTICAST"), (0x10000, "LOWER_UP")]
+
+
+def _sys_net(name: str, attribute: str) -> str:
+    try:
+        with open(f"/sys/class/net/{name}/{attribute}", "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _ip_interface(index: int, name: str, ipv6: List[Tuple[str, int, str, List[str]]]) -> str:
+    flags = int(_sys_net(name, "flags") or "0", 16)
+    operstate = (_sys_net(name, "operstate") or "unknown").upper()
+    if _sys_net(name, "carrier") == "1":
+        flags |= 0x10000
+    names = [label for bit, label in IFF_FLAGS if flags & bit]
+    # iproute2 prints flags in kernel order with UP after BROADCAST/LOOPBACK/MULTICAST
+    order = ["LOOPBACK", "BROADCAST", "POINTOPOINT", "NOARP", "MULTICAST", "UP", "LOWER_UP"]
+    names.sort(key=order.index)
+    mtu = _sys_net(name, "mtu") or "0"
+    qlen = _sys_net(name, "tx_queue_len") or "0"
+    # The qdisc is only available over netlink, so it is left out
+    lines = [f"{index}: {name}: <{','.join(names)}> mtu {mtu} state {operstate} group default qlen {qlen}"]
+
+    address = _sys_net(name, "address") or "00:00:00:00:00:00"
+    broadcast = _sys_net(name, "broadcast") or "ff:ff:ff:ff:ff:ff"
+    link_type = "loopback" if flags & 0x8 else "ether"
+    lines.append(f"    link/{link_type} {address} brd {broadcast}")
+
+    ipv4 = _ipv4_address(name)
+    if ipv4 is not None:
+        addr, prefix, brd = ipv4
+        scope = "host" if flags & 0x8 else "global"
+        line = f"    inet {addr}/{prefix}"
+        if brd and not flags & 0x8:
+            line += f" brd {brd}"
+        lines.append(f"{line} scope {scope} {name}")
+        lines.append("       valid_lft forever preferred_lft forever")
+    for addr, prefix, scope, flags in ipv6:
+        lines.append(f"    inet6 {addr}/{prefix} scope {scope} " + "".join(f"{flag} " for flag in flags))
+        lines.append("       valid_lft forever preferred_lft forever")
+    return "\n".join(lines)
+
+
+def _ipv4_address(name: str) -> Optional[Tuple[str, int, str]]:
+    """Primary IPv4 address, prefix length and broadcast via ioctl"""
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    SIOCGIFADDR, SIOCGIFNETMASK, SIOCGIFBRDADDR = 0x8915, 0x891B, 0x8919
+    request = struct.pack("256s", name.encode()[:15])
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            addr = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24])
+            mask = fcntl.ioctl(sock.fileno(), SIOCGIFNETMASK, request)[20:24]
+        except OSError:
+            return None
+        try:
+            brd = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFBRDADDR, request)[20:24])
+        except OSError:
+            brd = ""
+    prefix = bin(int.from_bytes(mask, "big")).count("1")
+    return addr, prefix, brd if brd != "0.0.0.0" else ""
+
+
+def _ipv6_addresses() -> Dict[str, List[Tuple[str, int, str, List[str]]]]:
+    """Interface -> [(address, prefix, scope, flags)] from /proc/net/if_inet6, global scope first"""
+    scopes = {"00": "global", "10": "host", "20": "link", "40": "site"}
+    scope_order = ["global", "site", "link", "host"]
+    address_flags = [(0x01, "temporary"), (0x02, "nodad"), (0x04, "optimistic"), (0x08, "dadfailed"),
+                     (0x20, "deprecated"), (0x40, "tentative")]
+    result: Dict[str, List[Tuple[str, int, str, List[str]]]] = {}
+    try:
+        with open("/proc/net/if_inet6", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 6:
+                    continue
+                raw, _, prefix, scope, flags, name = parts[:6]
+                addr = socket.inet_ntop(socket.AF_INET6, bytes.fromhex(raw))
+                labels = [label for bit, label in address_flags if int(flags, 16) & bit]
+                result.setdefault(name, []).append((addr, int(prefix, 16), scopes.get(scope, "global"), labels))
+    except (OSError, ValueError):
+        pass
+    for addresses in result.values():
+        addresses.sort(key=lambda entry: scope_order.index(entry[2]))
+    return result
+
+
+BUILTINS: Dict[str, Callable[[List[str], str], BuiltinResult]] = {
+    "pwd": _pwd,
+    "whoami": _whoami,
+    "uname": _uname,
+    "df": _df,
+    "free": _free,
+    "ls": _ls,
+    "cat": _cat,
+    "ip": _ip,
+}
@@ -0,0 +1,455 @@
+"""
+TTL result cache for read-only, idempotent OS commands.
+
+A CommandPolicy decides whether a command line may be cached and for how
+long. It starts from a hand-written table of commands known to only read
+state (uname, df, ip addr, ...) and can be extended from the tldr pages in
+the `os_commands` collection: a command whose description and every example
+only display, list or print something is cached for a short default TTL.
+Anything with shell syntax beyond plain pipes, an unknown program, or a
+known-volatile or mutating form (`hostname NAME`, `ip link set`) is never
+cached.
+
+CommandCache keeps results for their TTL within an entry count and a total
+size budget (large results are never cached), and collapses concurrent
+identical executions into one (later callers wait for the first). After an
+uncacheable command runs, only the entries it could have changed are
+dropped: nothing for a read-only command such as `ps`, results that read
+the paths it names for a file command such as `touch` or a `>` redirect,
+and everything for a command whose effects can't be bounded.
+"""
+import os
+import re
+import shlex
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Shell syntax that makes a command line uncacheable (pipes are split on separately)
+UNCACHEABLE_SYNTAX = set("&;<>()$`*?[]{}!\\\n")
+
+# Hand-written policy table: program -> rules
+#   ttl: seconds a result stays valid
+#   subcommands: allowed first operand (None: any)
+#   actions: allowed second operand after the subcommand (e.g. `ip addr show`)
+#   max_operands: most non-flag arguments allowed (None: any)
+#   deny_flags: flags that make the invocation mutating
+#   reads: "operands" (the files named, else the working directory) or "filesystem" (any file);
+#       absent for commands that only report system state, which file writes don't change
+COMMAND_POLICIES: Dict[str, Dict[str, Any]] = {
+    "uname": {"ttl": 3600},
+    "arch": {"ttl": 3600},
+    "whoami": {"ttl": 3600},
+    "id": {"ttl": 600},
+    "groups": {"ttl": 600},
+    "hostname": {"ttl": 3600, "max_operands": 0, "deny_flags": {"-F", "--file", "-b", "--boot"}},
+    "hostnamectl": {"ttl": 600, "subcommands": {"status"}},
+    "lsb_release": {"ttl": 3600},
+    "sw_vers": {"ttl": 3600},
+    "nproc": {"ttl": 3600},
+    "lscpu": {"ttl": 3600},
+    "lsblk": {"ttl": 60},
+    "lspci": {"ttl": 600},
+    "lsusb": {"ttl": 60},
+    "lsmod": {"ttl": 60},
+    "locale": {"ttl": 3600},
+    "getconf": {"ttl": 3600},
+    "printenv": {"ttl": 60},
+    "which": {"ttl": 300, "reads": "filesystem"},
+    "df": {"ttl": 30, "reads": "filesystem"},
+    "du": {"ttl": 30, "reads": "operands"},
+    "free": {"ttl": 5, "deny_flags": {"-s", "--seconds", "-c", "--count"}},
+    "ls": {"ttl": 5, "reads": "operands"},
+    "cat": {"ttl": 5, "reads": "operands"},
+    "ip": {"ttl": 30, "subcommands": {"a", "addr", "address", "l", "link", "r", "route", "n", "neigh", "neighbour"},
+           "actions": {"show", "list", "ls"}},
+    "ifconfig": {"ttl": 30, "max_operands": 1},
+    "ss": {"ttl": 5, "deny_flags": {"-K", "--kill"}},
+    "netstat": {"ttl": 5, "deny_flags": {"-c", "--continuous"}},
+    "route": {"ttl": 30, "max_operands": 0},
+    "systeminfo": {"ttl": 600},
+}
+
+# Read-only but never idempotent (or unbounded): always executed
+VOLATILE_COMMANDS = {
+    "date", "uptime", "ps", "top", "htop", "w", "who", "last", "lastlog", "tail", "head", "watch",
+    "journalctl", "dmesg", "sensors", "vmstat", "iostat", "mpstat", "sar", "time", "sleep", "yes",
+    "ping", "traceroute", "dig", "nslookup", "curl", "wget", "find", "locate", "env", "grep", "less", "more",
+}
+
+# Commands that only filter their input, allowed as later pipeline stages (same rule keys, no ttl)
+FILTER_COMMANDS: Dict[str, Dict[str, Any]] = {
+    "grep": {}, "egrep": {}, "fgrep": {}, "head": {}, "tail": {"deny_flags": {"-f", "-F", "--follow"}},
+    "sort": {"deny_flags": {"-o", "--output"}}, "uniq": {"max_operands": 0}, "wc": {}, "cut": {}, "tr": {},
+    "column": {}, "awk": {},
+}
+
+# Uncacheable programs that change nothing a cached command prints
+READ_ONLY_COMMANDS = {
+    "date", "uptime", "ps", "top", "w", "who", "last", "lastlog", "tail", "head", "sensors", "vmstat", "iostat",
+    "mpstat", "sleep", "ping", "traceroute", "dig", "nslookup", "grep", "egrep", "fgrep", "less", "more", "echo",
+    "printf", "pwd", "cd", "true", "false", "test", "stat", "file", "wc", "type",
+}
+
+# Programs whose writes are confined to the paths they name (the working directory if none)
+FILE_WRITERS = {"touch", "mkdir", "rmdir", "rm", "unlink", "mv", "cp", "ln", "install", "chmod", "chown",
+                "chgrp", "truncate", "tee", "shred", "sed"}
+
+# Leading words that run the rest of the line as a command
+COMMAND_WRAPPERS = {"sudo", "doas", "nohup", "nice", "command"}
+
+# Leading words of tldr descriptions that only read state
+READ_ONLY_VERBS = {"display", "displays", "show", "shows", "list", "lists", "print", "prints", "get", "view",
+                   "check", "count", "query", "report", "output", "search", "find", "describe"}
+
+TLDR_DESCRIPTION = re.compile(r"^Description:\s*(.*)$", re.MULTILINE)
+TLDR_EXAMPLE = re.compile(r"^  - (.*)$", re.MULTILINE)
+
+
+class CommandPolicy:
+    """Decides which command lines are cacheable, and for how long."""
+
+    def __init__(self, policies: Optional[Dict[str, Dict[str, Any]]] = None, tldr_ttl: float = 10,
+                 memo_size: int = 1024):
+        """
+        Args:
+            policies: Program rules, overriding COMMAND_POLICIES
+            tldr_ttl: TTL for programs learned from tldr pages
+            memo_size: Classified command lines remembered
+        """
+        self.policies = dict(COMMAND_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        self.tldr_ttl = tldr_ttl
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, Optional[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seed_from_tldr(self, vectordb, collection: str = "os_commands", platforms: Iterable[str] = ()) -> int:
+        """
+        Learn read-only programs from the tldr pages in a vector collection
+
+        Args:
+            vectordb: rag.vectordb.VectorDB holding the ingested tldr pages
+            collection: Collection name
+            platforms: tldr platforms to accept besides "common"
+
+        Returns:
+            Number of programs added to the policy table
+        """
+        pages = vectordb.get_collection(collection).get(include=["documents", "metadatas"])
+        accepted = {"common", *platforms}
+        learned = {}
+        for text, metadata in zip(pages.get("documents") or [], pages.get("metadatas") or []):
+            metadata = metadata or {}
+            name = metadata.get("command", "")
+            if metadata.get("platform") not in accepted or not name or name in VOLATILE_COMMANDS:
+                continue
+            if _is_read_only_page(text or ""):
+                learned[name] = {"ttl": self.tldr_ttl, "reads": "filesystem"}  # Could read any file
+        with self._lock:
+            added = {name: rules for name, rules in learned.items() if name not in self.policies}
+            self.policies.update(added)
+            self._memo.clear()
+        return len(added)
+
+    def ttl_for(self, command: str) -> Optional[float]:
+        """Seconds the command's result may be reused, or None if it must always run"""
+        with self._lock:
+            if command in self._memo:
+                self._memo.move_to_end(command)
+                return self._memo[command]
+        ttl = self._classify(command)
+        with self._lock:
+            self._memo[command] = ttl
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return ttl
+
+    def read_paths(self, command: str, cwd: Optional[str]) -> Tuple[str, ...]:
+        """
+        Paths a cacheable command's result depends on
+
+        Returns:
+            Absolute paths ("/" for the whole filesystem); empty if it only reports system state
+        """
+        paths = []
+        for position, stage in enumerate(command.split("|")):
+            argv = shlex.split(stage)
+            operands = [arg for arg in argv[1:] if not arg.startswith("-")]
+            if position > 0 and argv[0] in FILTER_COMMANDS:
+                reads = "operands" if operands else None  # `| grep x FILE` reads FILE too
+            else:
+                reads = self.policies.get(os.path.basename(argv[0]), {}).get("reads")
+            if reads == "filesystem":
+                return ("/",)
+            if reads == "operands":
+                paths.extend(_resolve(operand, cwd) for operand in operands or ["."])
+        return tuple(paths)
+
+    def write_paths(self, command: str, cwd: Optional[str]) -> Optional[List[str]]:
+        """
+        Paths an uncacheable command may change
+
+        Returns:
+            Absolute paths (empty for a read-only command), or None if its effects can't be bounded
+        """
+        if "$" in command or "`" in command:
+            return None
+        try:
+            lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+            lexer.whitespace_split = True
+            tokens = list(lexer) + [";"]  # Ends the last stage
+        except ValueError:
+            return None
+        paths: List[str] = []
+        stage: List[str] = []
+        redirect = None  # The operator whose target is the next word
+        for token in tokens:
+            if token and set(token) <= set(";&|()<>"):
+                if "<" in token or ">" in token:
+                    if ">" in token and stage and stage[-1].isdigit():
+                        stage.pop()  # fd number of e.g. 2>/dev/null
+                    redirect = None if token.endswith("&") else token  # 2>&1 names an fd, not a file
+                    continue
+                if stage and not self._stage_writes(stage, cwd, paths):
+                    return None
+                stage = []
+            elif redirect is not None:
+                if ">" in redirect and not token.startswith("/dev/"):
+                    paths.append(_resolve(token, cwd))
+                redirect = None
+            else:
+                stage.append(token)
+        return paths
+
+    def _stage_writes(self, argv: List[str], cwd: Optional[str], paths: List[str]) -> bool:
+        """Add the paths one simple command may change to paths; False if that can't be bounded"""
+        while argv and (argv[0] in COMMAND_WRAPPERS or argv[0].startswith("-")):
+            argv = argv[1:]
+        if not argv:
+            return True
+        program = os.path.basename(argv[0])
+        rules = self.policies.get(program) or FILTER_COMMANDS.get(program)
+        if program in READ_ONLY_COMMANDS or (rules is not None and _allowed(argv, rules)):
+            return True
+        if program in FILE_WRITERS:
+            operands = [arg for arg in argv[1:] if not arg.startswith("-")]
+            paths.extend(_resolve(operand, cwd) for operand in operands or ["."])
+            return True
+        return False
+
+    def _classify(self, command: str) -> Optional[float]:
+        if any(c in UNCACHEABLE_SYNTAX for c in command) or "||" in command:
+            return None
+        ttl = None
+        for position, stage in enumerate(command.split("|")):
+            try:
+                argv = shlex.split(stage)
+            except ValueError:
+                return None
+            if not argv:
+                return None
+            if position > 0 and argv[0] in FILTER_COMMANDS:
+                if not _allowed(argv, FILTER_COMMANDS[argv[0]]):
+                    return None
+                continue
+            stage_ttl = self._stage_ttl(argv)
+            if stage_ttl is None:
+                return None
+            ttl = stage_ttl if ttl is None else min(ttl, stage_ttl)
+        return ttl
+
+    def _stage_ttl(self, argv) -> Optional[float]:
+        program = argv[0]
+        if "=" in program or (os.sep in program and os.path.dirname(program) not in ("/bin", "/usr/bin", "/sbin", "/usr/sbin")):
+            return None
+        rules = self.policies.get(os.path.basename(program))
+        if rules is None or not _allowed(argv, rules):
+            return None
+        return rules["ttl"]
+
+
+def _resolve(path: str, cwd: Optional[str]) -> str:
+    return os.path.normpath(os.path.join(cwd or os.getcwd(), os.path.expanduser(path)))
+
+
+def _overlaps(paths: Iterable[str], others: Iterable[str]) -> bool:
+    """True if any path equals, contains or lies inside any of others"""
+    for path in paths:
+        for other in others:
+            if path == other or path.startswith(other.rstrip("/") + "/") or other.startswith(path.rstrip("/") + "/"):
+                return True
+    return False
+
+
+def _allowed(argv, rules: Dict[str, Any]) -> bool:
+    """True if an invocation stays within a program's rules"""
+    flags = [arg for arg in argv[1:] if arg.startswith("-") and arg != "-"]
+    operands = [arg for arg in argv[1:] if not arg.startswith("-") or arg == "-"]
+    deny = rules.get("deny_flags", ())
+    short_deny = {flag[1] for flag in deny if len(flag) == 2}
+    for flag in flags:
+        if flag.split("=", 1)[0] in deny:
+            return False
+        if not flag.startswith("--") and short_deny.intersection(flag[1:]):
+            return False  # Clustered short flags such as `sort -ro out`
+    subcommands = rules.get("subcommands")
+    if subcommands is not None:
+        if operands and operands[0] not in subcommands:
+            return False
+        actions = rules.get("actions")
+        if actions is not None and len(operands) > 1 and operands[1] not in actions:
+            return False
+    max_operands = rules.get("max_operands")
+    return max_operands is None or len(operands) <= max_operands
+
+
+def _is_read_only_page(text: str) -> bool:
+    """True if a tldr page's description and every example only read state"""
+    description = TLDR_DESCRIPTION.search(text)
+    examples = TLDR_EXAMPLE.findall(text)
+    phrases = ([description.group(1)] if description else []) + examples
+    if not phrases or not examples:
+        return False
+    return all(phrase.split(" ", 1)[0].lower().strip(":,") in READ_ONLY_VERBS for phrase in phrases)
+
+
+class _Flight:
+    """One in-progress execution that other callers can wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Tuple[str, str] = ("", "")
+
+
+class _Entry:
+    """A cached result with its expiry, size and the paths it was read from."""
+
+    __slots__ = ("expires", "result", "chars", "paths")
+
+    def __init__(self, expires: float, result: Tuple[str, str], paths: Tuple[str, ...]):
+        self.expires = expires
+        self.result = result
+        self.chars = len(result[0]) + len(result[1])
+        self.paths = paths
+
+
+class CommandCache:
+    """TTL cache of command results with single-flight execution."""
+
+    def __init__(self, policy: Optional[CommandPolicy] = None, max_entries: int = 256,
+                 max_total_chars: int = 4 * 1024 * 1024, max_result_chars: int = 64 * 1024):
+        """
+        Args:
+            policy: Decides cacheability and TTLs (default: CommandPolicy())
+            max_entries: Cached results kept (least recently used dropped first)
+            max_total_chars: Characters of output kept across all entries (least recently used dropped first)
+            max_result_chars: Larger results are returned but not cached
+        """
+        self.policy = policy or CommandPolicy()
+        self.max_entries = max_entries
+        self.max_total_chars = max_total_chars
+        self.max_result_chars = max_result_chars
+        self._entries: "OrderedDict[Tuple[str, Optional[str]], _Entry]" = OrderedDict()
+        self._chars = 0
+        self._inflight: Dict[Tuple[str, Optional[str]], _Flight] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "collapsed": 0, "bypassed": 0, "invalidations": 0, "too_large": 0}
+
+    def run(self, command: str, cwd: Optional[str], runner: Callable[[], Tuple[str, str]]) -> Tuple[str, str]:
+        """
+        Return a fresh cached result for command, or run it
+
+        Args:
+            command: Command line (the cache key, with cwd)
+            cwd: Working directory the command runs in
+            runner: Executes the command, returning (output, error)
+
+        Returns:
+            Tuple of (output, error_message)
+        """
+        ttl = self.policy.ttl_for(command.strip())
+        if ttl is None:
+            with self._lock:
+                self.stats["bypassed"] += 1
+            result = runner()
+            # It may have changed what cached commands would print
+            self.invalidate(self.policy.write_paths(command.strip(), cwd))
+            return result
+
+        key = (command.strip(), cwd)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.result
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["collapsed"] += 1
+
+        if not leader:
+            flight.done.wait()
+            output, error = flight.result
+            if error in ("Command cancelled", "Command timed out"):
+                return runner()  # The leader's cancellation or budget isn't ours
+            return flight.result
+
+        try:
+            flight.result = runner()
+            if not flight.result[1]:
+                self._store(key, _Entry(time.monotonic() + ttl, flight.result, self.policy.read_paths(key[0], cwd)))
+            return flight.result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def _store(self, key: Tuple[str, Optional[str]], entry: _Entry):
+        with self._lock:
+            if entry.chars > self.max_result_chars:
+                self.stats["too_large"] += 1
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._chars -= previous.chars
+            self._entries[key] = entry
+            self._chars += entry.chars
+            while len(self._entries) > self.max_entries or self._chars > self.max_total_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= evicted.chars
+
+    def invalidate(self, paths: Optional[Iterable[str]] = None):
+        """
+        Drop cached results
+
+        Args:
+            paths: Drop only results read from these paths (or inside or above them); None drops every result
+        """
+        with self._lock:
+            if paths is None:
+                stale = list(self._entries)
+            else:
+                paths = list(paths)
+                stale = [key for key, entry in self._entries.items()
+                         if paths and entry.paths and _overlaps(entry.paths, paths)]
+            for key in stale:
+                self._chars -= self._entries.pop(key).chars
+            if stale:
+                self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counters plus current size and hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+            stats["chars"] = self._chars
+        lookups = stats["hits"] + stats["misses"] + stats["collapsed"]
+        stats["hit_rate"] = (stats["hits"] + stats["collapsed"]) / lookups if lookups else 0.0
+        return stats
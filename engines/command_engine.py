@@ -1,34 +1,258 @@
+import codecs
+import os
+import signal
 import subprocess
 import platform
-from typing import Tuple
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from engines.builtins import run_builtin
+from engines.command_cache import CommandCache
+from engines.output_buffer import OutputBuffer
+from engines.resource_limits import (ResourceLimits, COMMAND_LIMITS, CHILD_SLOTS, LIMIT_LEDGER,
+                                     classify_exit, limit_error)
+from engines.shell_session import ShellSession, ShellSessionError
+
+# Output retained per command; beyond this only the head and tail are kept
+DEFAULT_MAX_OUTPUT_CHARS = 1024 * 1024
+MAX_STDERR_CHARS = 64 * 1024
+
+TOO_MANY_CHILDREN = "Too many commands and queries are running at once; try again shortly"
 
 class CommandEngine:
-    def __init__(self):
+    def __init__(self, timeout: float = 30, persistent_shell: bool = False, builtins: bool = True,
+                 max_output_chars: int = DEFAULT_MAX_OUTPUT_CHARS, cache: Optional[CommandCache] = None,
+                 result_cache: bool = True, limits: Optional[ResourceLimits] = None):
+        """
+        Args:
+            timeout: Default budget when the caller doesn't give one
+            persistent_shell: Run commands in one long-lived shell so `cd` and
+                exported variables persist (not available on Windows)
+            builtins: Answer common read-only commands (pwd, ls, df -h, ...) in-process
+            max_output_chars: Output characters retained per command (head + tail)
+            cache: Result cache for read-only commands; pass one instance to
+                share it (and its single-flight execution) between engines
+            result_cache: Create a private cache when none is given
+            limits: Per-command resource limits (defaults to COMMAND_LIMITS)
+        """
         self.os_type = platform.system().lower()  # windows / linux / darwin (mac)
-    
-    def execute_command(self, command: str) -> Tuple[str, str]:
+        self.timeout = timeout
+        self.builtins = builtins
+        self.max_output_chars = max_output_chars
+        self.limits = limits or COMMAND_LIMITS
+        self.cache = cache if cache is not None else (CommandCache() if result_cache else None)
+        self.session: Optional[ShellSession] = None
+        if persistent_shell and self.os_type != "windows":
+            self.session = ShellSession(limits=self.limits)
+
+    @property
+    def cwd(self) -> Optional[str]:
+        """Working directory of the persistent session (None without one)"""
+        return self.session.cwd if self.session is not None else None
+
+    def new_buffer(self) -> OutputBuffer:
+        """An output buffer with this engine's cap"""
+        return OutputBuffer(self.max_output_chars)
+
+    def execute_command(self, command: str, timeout: Optional[float] = None,
+                        on_output: Optional[Callable[[str], None]] = None,
+                        cancel_event: Optional[threading.Event] = None) -> Tuple[str, str]:
         """
         Execute an OS command and return results
-        
+
+        Output is streamed through a bounded buffer: on_output sees every chunk
+        as it arrives, while the returned text keeps only the head and tail of
+        very large output. Read-only commands are answered from the result
+        cache while their result is fresh.
+
+        Args:
+            command: Command line to run
+            timeout: Budget in seconds (defaults to self.timeout)
+            on_output: Called with each chunk of stdout as it arrives
+            cancel_event: Set to abort the command
+
+        Returns:
+            Tuple of (output, error_message)
+        """
+        if self.cache is None:
+            return self._execute(command, timeout, on_output, cancel_event)
+
+        ran = []
+
+        def runner():
+            ran.append(True)
+            return self._execute(command, timeout, on_output, cancel_event)
+
+        output, error = self.cache.run(command, self.cwd, runner)
+        if not ran and on_output and not error:
+            on_output(output)  # Served from the cache: hand it over in one piece
+        return output, error
+
+    def cache_stats(self) -> dict:
+        """Result cache counters (empty without a cache)"""
+        return self.cache.get_stats() if self.cache is not None else {}
+
+    def _execute(self, command: str, timeout: Optional[float],
+                 on_output: Optional[Callable[[str], None]],
+                 cancel_event: Optional[threading.Event]) -> Tuple[str, str]:
+        if self.builtins:
+            builtin = run_builtin(command, self.cwd)
+            if builtin is not None:
+                output, stderr, status = builtin
+                if status == 0:
+                    if on_output and output:
+                        on_output(output)
+                    return output.strip() if output.strip() else "Done.", ""
+                return "", stderr.strip()
+
+        # A second caller (e.g. a background job) doesn't wait for a busy session
+        if self.session is not None and not self.session.busy:
+            timeout = timeout or self.timeout
+            if not CHILD_SLOTS.acquire(timeout=timeout):
+                return "", TOO_MANY_CHILDREN
+            started = time.monotonic()
+            try:
+                output, stderr, status = self.session.run(command, timeout, on_output,
+                                                          cancel_event, self.new_buffer())
+            except ShellSessionError as e:
+                return "", f"Execution error: {str(e)}"
+            finally:
+                CHILD_SLOTS.release()
+            kind = self.session.last_limit or ("wall_clock" if stderr == "Command timed out" else None)
+            if kind:
+                self._report(kind, command, started, timeout)
+                if kind != "wall_clock" and status is not None:
+                    return output, limit_error(kind, self.limits)
+            if status is None:
+                return output, stderr
+            if status == 0:
+                return output if output else "Done.", ""
+            return "", stderr
+
+        return self.execute_streaming(command, timeout, on_output, cancel_event)
+
+    def execute_streaming(self, command: str, timeout: Optional[float] = None,
+                          on_output: Optional[Callable[[str], None]] = None,
+                          cancel_event: Optional[threading.Event] = None) -> Tuple[str, str]:
+        """
+        Execute an OS command in its own process, passing stdout to on_output
+        as it arrives
+
+        Used for background jobs and whenever the persistent session is busy
+        or disabled: the command can be cancelled through cancel_event and is
+        killed once its budget is spent.
+
         Returns:
             Tuple of (output, error_message)
         """
+        timeout = timeout or self.timeout
+        started = time.monotonic()
+        if not CHILD_SLOTS.acquire(timeout=timeout):
+            return "", TOO_MANY_CHILDREN
         try:
-            # Execute the command
-            result = subprocess.run(
+            return self._run_process(command, started + timeout, on_output, cancel_event, started)
+        finally:
+            CHILD_SLOTS.release()
+
+    def _run_process(self, command: str, deadline: float, on_output: Optional[Callable[[str], None]],
+                     cancel_event: Optional[threading.Event], started: float) -> Tuple[str, str]:
+        try:
+            proc = subprocess.Popen(
                 command,
                 shell=True,
-                capture_output=True,
-                text=True,
-                timeout=30  # 30 second timeout
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.cwd,  # Follow the session's `cd`
+                start_new_session=self.os_type != "windows",  # So the whole pipeline can be killed
+                preexec_fn=self.limits.preexec_fn() if self.os_type != "windows" else None
             )
-            
-            if result.returncode == 0:
-                return result.stdout.strip() if result.stdout else "Done.", ""
-            else:
-                return "", result.stderr.strip()
-                
-        except subprocess.TimeoutExpired:
-            return "", "Command timed out"
         except Exception as e:
-            return "", f"Execution error: {str(e)}"
\ No newline at end of file
+            return "", f"Execution error: {str(e)}"
+
+        stdout_buffer = self.new_buffer()
+        stderr_buffer = OutputBuffer(MAX_STDERR_CHARS)
+
+        readers = [threading.Thread(target=_pump, args=(proc.stdout, stdout_buffer, on_output), daemon=True),
+                   threading.Thread(target=_pump, args=(proc.stderr, stderr_buffer, None), daemon=True)]
+        for reader in readers:
+            reader.start()
+
+        output_cap = self.limits.output_bytes
+        error = ""
+        kind = None
+        while proc.poll() is None:
+            if cancel_event is not None and cancel_event.is_set():
+                error = "Command cancelled"
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                error = "Command timed out"
+                kind = "wall_clock"
+                break
+            if output_cap and stdout_buffer.total_bytes > output_cap:
+                kind = "output"
+                error = limit_error(kind, self.limits)
+                break
+            try:
+                proc.wait(timeout=min(remaining, 0.1))
+            except subprocess.TimeoutExpired:
+                pass
+
+        if error:
+            self._kill(proc)
+        proc.wait()
+        for reader in readers:
+            reader.join(timeout=1)
+
+        output = stdout_buffer.text().strip()
+        stderr = stderr_buffer.text().strip()
+        if not error:
+            kind = classify_exit(proc.returncode, stderr)
+            if kind:
+                error = limit_error(kind, self.limits)
+        if kind:
+            self._report(kind, command, started, deadline - started)
+        if error:
+            return output, error
+        if proc.returncode == 0:
+            return output if output else "Done.", ""
+        return "", stderr
+
+    def _report(self, kind: str, command: str, started: float, budget: float):
+        """Record which limit ended a run"""
+        limit = f"{budget:g}s" if kind == "wall_clock" else self.limits.describe(kind)
+        LIMIT_LEDGER.record(kind, "command", command, limit, time.monotonic() - started)
+
+    def close(self):
+        """Stop the persistent shell, if any"""
+        if self.session is not None:
+            self.session.close()
+
+    def _kill(self, proc: subprocess.Popen):
+        """Kill a command together with any children it spawned"""
+        try:
+            if self.os_type != "windows":
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def _pump(stream, buffer: OutputBuffer, on_output: Optional[Callable[[str], None]]):
+    """Copy a pipe into a buffer in chunks until EOF"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        data = stream.read1(65536) if hasattr(stream, "read1") else stream.read(65536)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            buffer.append(text)
+            if on_output:
+                on_output(text)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        buffer.append(tail)
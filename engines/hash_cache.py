@@ -0,0 +1,343 @@
+"""
+Persistent, incremental file hash cache for osquery's `hash` table.
+
+Hashes are keyed by (path, inode, size, mtime, ctime), so a file is only
+re-hashed when its stat changes and a repeated integrity sweep costs about
+one stat per file. ctime is what makes this sound for integrity checks: an
+in-place edit of the same length can have its mtime put back with `touch`,
+but the change time can't be set from user space. Misses are hashed in
+parallel.
+
+The cache answers in-process, outside the child-process slots and resource
+limits osqueryi runs under, so it keeps to the caller's budget: the time
+limit and cancel event are checked between directory entries, files and
+read chunks, and a directory sweep bigger than max_files is left to osqueryi.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+HASH_COLUMNS = ("path", "directory", "md5", "sha1", "sha256")
+
+# SELECT <columns> FROM hash [alias] WHERE <predicates> [LIMIT n]
+HASH_QUERY_PATTERN = re.compile(
+    r"^select\s+(?P<columns>.+?)\s+from\s+hash(?:\s+(?:as\s+)?(?P<alias>\w+))?\s+"
+    r"where\s+(?P<where>.+?)(?:\s+limit\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+COLUMN_PATTERN = re.compile(r"^(?:(?P<prefix>\w+)\.)?(?P<name>\w+)(?:\s+as\s+(?P<alias>\w+))?$", re.IGNORECASE)
+STRING = r"'((?:[^']|'')*)'"
+EQUALS_PATTERN = re.compile(rf"^(?:\w+\.)?(?P<column>\w+)\s*=\s*{STRING}$", re.IGNORECASE)
+IN_PATTERN = re.compile(rf"^(?:\w+\.)?(?P<column>\w+)\s+in\s*\((?P<values>\s*{STRING}(?:\s*,\s*{STRING})*\s*)\)$", re.IGNORECASE)
+LIKE_PATTERN = re.compile(rf"^(?:\w+\.)?path\s+like\s+{STRING}$", re.IGNORECASE)
+
+
+class QueryInterrupted(Exception):
+    """Raised when a cache answer runs out of time or is cancelled"""
+
+
+class _Budget:
+    """Deadline and cancel event of one query"""
+
+    def __init__(self, timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.cancel_event = cancel_event
+
+    def interrupted(self) -> Optional[str]:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return "Query cancelled"
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            return "Query timed out"
+        return None
+
+    def check(self):
+        reason = self.interrupted()
+        if reason:
+            raise QueryInterrupted(reason)
+
+
+UNLIMITED = _Budget()
+
+
+class HashCache:
+    """SQLite-backed cache of file hashes validated against stat results."""
+
+    def __init__(self, db_path: str = "data/hash_cache.sqlite3", max_workers: Optional[int] = None,
+                 chunk_size: int = 1024 * 1024, max_files: int = 20000):
+        """
+        Args:
+            db_path: SQLite file holding the cache
+            max_workers: Threads used to hash cache misses (defaults to CPU count)
+            chunk_size: Read size used while hashing
+            max_files: Largest directory listing answered from the cache
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            "path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, mtime_ns INTEGER, "
+            "md5 TEXT, sha1 TEXT, sha256 TEXT, ctime_ns INTEGER)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(file_hashes)")}
+        if "ctime_ns" not in columns:
+            # Caches written before ctime was part of the key; their rows miss once and are re-hashed
+            self.conn.execute("ALTER TABLE file_hashes ADD COLUMN ctime_ns INTEGER")
+        self.conn.commit()
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self.chunk_size = chunk_size
+        self.max_files = max_files
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def get_hashes(self, paths: List[str], timeout: Optional[float] = None,
+                   cancel_event: Optional[threading.Event] = None) -> List[Dict[str, str]]:
+        """
+        Return hash rows for the given paths, re-hashing only changed files
+
+        Args:
+            paths: File paths to hash; unreadable or non-regular files are skipped
+            timeout: Budget in seconds (None: unlimited)
+            cancel_event: Optional event that aborts hashing when set
+
+        Returns:
+            List of dictionaries with the HASH_COLUMNS keys, in input order
+
+        Raises:
+            QueryInterrupted: The budget ran out or cancel_event was set
+        """
+        return self._get_hashes(paths, _Budget(timeout, cancel_event))
+
+    def _get_hashes(self, paths: List[str], budget: _Budget) -> List[Dict[str, str]]:
+        stats = {}
+        for i, path in enumerate(paths):
+            if i % 1000 == 0:
+                budget.check()
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                stats[path] = (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+        cached = self._lookup(list(stats))
+        rows: Dict[str, Dict[str, str]] = {}
+        misses = []
+        for path, key in stats.items():
+            entry = cached.get(path)
+            if entry is not None and entry[0] == key:
+                rows[path] = entry[1]
+            else:
+                misses.append(path)
+
+        if misses:
+            batch_size = self.max_workers * 4
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for start in range(0, len(misses), batch_size):
+                    budget.check()
+                    batch = misses[start:start + batch_size]
+                    hashed = list(pool.map(lambda path: self._hash_file(path, budget), batch))
+                    updates = []
+                    for path, digests in zip(batch, hashed):
+                        if digests is None:
+                            continue
+                        rows[path] = digests
+                        updates.append((path, *stats[path], digests["md5"], digests["sha1"], digests["sha256"]))
+                    # Committed per batch, so an interrupted sweep still warms the cache
+                    with self._lock:
+                        self.conn.executemany(
+                            "INSERT OR REPLACE INTO file_hashes (path, inode, size, mtime_ns, ctime_ns, md5, sha1, sha256) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", updates
+                        )
+                        self.conn.commit()
+            budget.check()  # A file may have been cut short
+
+        with self._lock:
+            self.stats["hits"] += len(stats) - len(misses)
+            self.stats["misses"] += len(misses)
+
+        return [
+            {"path": path, "directory": os.path.dirname(path), **rows[path]}
+            for path in stats if path in rows
+        ]
+
+    def _lookup(self, paths: List[str]) -> Dict[str, Tuple[Tuple[int, int, int, int], Dict[str, str]]]:
+        """Fetch cached entries in batches (SQLite caps bound parameters)"""
+        found = {}
+        with self._lock:
+            for start in range(0, len(paths), 500):
+                batch = paths[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row in self.conn.execute(
+                    f"SELECT path, inode, size, mtime_ns, ctime_ns, md5, sha1, sha256 FROM file_hashes "
+                    f"WHERE path IN ({placeholders})",
+                    batch
+                ):
+                    found[row[0]] = ((row[1], row[2], row[3], row[4]),
+                                     {"md5": row[5], "sha1": row[6], "sha256": row[7]})
+        return found
+
+    def _hash_file(self, path: str, budget: _Budget = UNLIMITED) -> Optional[Dict[str, str]]:
+        """Compute md5/sha1/sha256 in a single read of the file (None if interrupted)"""
+        md5, sha1, sha256 = hashlib.md5(), hashlib.sha1(), hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    if budget.interrupted():
+                        return None
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    md5.update(chunk)
+                    sha1.update(chunk)
+                    sha256.update(chunk)
+        except OSError:
+            return None
+        return {"md5": md5.hexdigest(), "sha1": sha1.hexdigest(), "sha256": sha256.hexdigest()}
+
+    def answer_query(self, sql: str, timeout: Optional[float] = None,
+                     cancel_event: Optional[threading.Event] = None) -> Optional[List[Dict[str, str]]]:
+        """
+        Answer a simple `hash` table query from the cache
+
+        Supported: SELECT of path/directory/md5/sha1/sha256 (with aliases)
+        FROM hash WHERE one path predicate (path = / path IN / directory = /
+        path LIKE 'dir/%' or 'dir/%%'), optionally AND-ed with equality or IN
+        filters on hash columns, plus an optional LIMIT.
+
+        Args:
+            sql: The query
+            timeout: Budget in seconds (None: unlimited)
+            cancel_event: Optional event that aborts the answer when set
+
+        Returns:
+            Rows formatted like osqueryi --json output, or None when the
+            query is not one the cache can answer (run it through osquery),
+            including directory sweeps of more than max_files files
+
+        Raises:
+            QueryInterrupted: The budget ran out or cancel_event was set
+        """
+        budget = _Budget(timeout, cancel_event)
+        match = HASH_QUERY_PATTERN.match(sql.strip())
+        if not match:
+            return None
+
+        columns = []
+        for column in match.group("columns").split(","):
+            column_match = COLUMN_PATTERN.match(column.strip())
+            if not column_match or column_match.group("name").lower() not in HASH_COLUMNS:
+                return None
+            name = column_match.group("name").lower()
+            columns.append((name, column_match.group("alias") or name))
+
+        paths = None
+        filters = []
+        for predicate in re.split(r"\s+and\s+", match.group("where").strip(), flags=re.IGNORECASE):
+            predicate = predicate.strip()
+            if predicate.startswith("(") and predicate.endswith(")"):
+                predicate = predicate[1:-1].strip()
+            selected, hash_filter = self._parse_predicate(predicate, budget)
+            if selected is not None:
+                if paths is not None:
+                    return None  # Only one path predicate is supported
+                paths = selected
+            elif hash_filter is not None:
+                filters.append(hash_filter)
+            else:
+                return None
+        if paths is None:
+            return None
+
+        limit = int(match.group("limit")) if match.group("limit") else None
+        if limit is not None and not filters:
+            # Without hash filters the first `limit` readable files are the answer
+            rows = []
+            for start in range(0, len(paths), max(limit, 1)):
+                rows.extend(self._get_hashes(paths[start:start + max(limit, 1)], budget))
+                if len(rows) >= limit:
+                    break
+        else:
+            rows = self._get_hashes(paths, budget)
+            for column, values in filters:
+                rows = [row for row in rows if row[column] in values]
+        if limit is not None:
+            rows = rows[:limit]
+
+        return [{alias: row[name] for name, alias in columns} for row in rows]
+
+    def _parse_predicate(self, predicate: str,
+                         budget: _Budget = UNLIMITED) -> Tuple[Optional[List[str]], Optional[Tuple[str, set]]]:
+        """
+        Returns:
+            Tuple of (paths selected by the predicate, hash column filter);
+            both None when the predicate is not supported
+        """
+        equals = EQUALS_PATTERN.match(predicate)
+        if equals:
+            column = equals.group("column").lower()
+            value = equals.group(2).replace("''", "'")
+            if column == "path":
+                return [value], None
+            if column == "directory":
+                return self._list_directory(value, recursive=False, budget=budget), None
+            if column in ("md5", "sha1", "sha256"):
+                return None, (column, {value.lower()})
+            return None, None
+
+        in_match = IN_PATTERN.match(predicate)
+        if in_match:
+            column = in_match.group("column").lower()
+            values = [v.replace("''", "'") for v in re.findall(STRING, in_match.group("values"))]
+            if column == "path":
+                return values, None
+            if column in ("md5", "sha1", "sha256"):
+                return None, (column, {v.lower() for v in values})
+            return None, None
+
+        like = LIKE_PATTERN.match(predicate)
+        if like:
+            pattern = like.group(1)
+            # osquery globbing: 'dir/%' lists a directory, 'dir/%%' recurses
+            if pattern.endswith("/%%") and "%" not in pattern[:-3]:
+                return self._list_directory(pattern[:-3], recursive=True, budget=budget), None
+            if pattern.endswith("/%") and "%" not in pattern[:-2]:
+                return self._list_directory(pattern[:-2], recursive=False, budget=budget), None
+        return None, None
+
+    def _list_directory(self, directory: str, recursive: bool,
+                        budget: _Budget = UNLIMITED) -> Optional[List[str]]:
+        """List regular files under a directory (None if there are more than max_files)"""
+        directory = directory or "/"
+        if not recursive:
+            try:
+                with os.scandir(directory) as entries:
+                    paths = []
+                    for entry in entries:
+                        if entry.is_file():
+                            paths.append(entry.path)
+                            if len(paths) > self.max_files:
+                                return None
+                    return sorted(paths)
+            except OSError:
+                return []
+        paths = []
+        for root, _, files in os.walk(directory):
+            budget.check()
+            paths.extend(os.path.join(root, name) for name in files)
+            if len(paths) > self.max_files:
+                return None
+        return sorted(paths)
+
+    def clear(self):
+        """Drop every cached hash"""
+        with self._lock:
+            self.conn.execute("DELETE FROM file_hashes")
+            self.conn.commit()
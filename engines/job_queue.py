@@ -0,0 +1,206 @@
+"""
+Background job queue for long-running commands and osquery queries.
+
+Jobs get sequential ids, run on a worker pool, expose progress and partial
+output while running, can be cancelled, and keep their results so they can
+be retrieved later in the conversation.
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+from engines.output_buffer import OutputBuffer
+
+# Partial output kept per job (head + tail)
+MAX_PARTIAL_OUTPUT = 256 * 1024
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    TIMED_OUT = "timed out"
+
+
+class Job:
+    """A unit of background work and its (partial) results."""
+
+    def __init__(self, job_id: int, kind: str, target: str, timeout: float, user_input: str = ""):
+        """
+        Args:
+            job_id: Sequential job id shown to the user
+            kind: "command" or "osquery"
+            target: The command line or SQL statement being run
+            timeout: Wall-clock budget for this job in seconds
+            user_input: The request that created the job
+        """
+        self.id = job_id
+        self.kind = kind
+        self.target = target
+        self.timeout = timeout
+        self.user_input = user_input
+        self.status = JobStatus.QUEUED
+        self.result: Any = None
+        self.error = ""
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.recorded = False  # Result written to conversation memory
+        self._output = OutputBuffer(MAX_PARTIAL_OUTPUT)
+        self._future = None
+
+    def append_output(self, chunk: str):
+        """Record a chunk of partial output (called from the worker)"""
+        self._output.append(chunk)
+
+    @property
+    def partial_output(self) -> str:
+        return self._output.text()
+
+    def output_tail(self, lines: int = 20) -> str:
+        """Last few lines of partial output"""
+        return self._output.tail(lines)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status not in (JobStatus.QUEUED, JobStatus.RUNNING)
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def progress(self) -> str:
+        """Human-readable progress line"""
+        if self.status == JobStatus.QUEUED:
+            return "waiting for a worker"
+        if self.status == JobStatus.RUNNING:
+            lines = self._output.total_lines
+            return f"{self.elapsed:.1f}s of {self.timeout:.0f}s budget, {lines} lines of output so far"
+        return f"{self.status.value} after {self.elapsed:.1f}s"
+
+
+class JobQueue:
+    """Runs jobs on a bounded worker pool and keeps them addressable by id."""
+
+    def __init__(self, max_workers: int = 2, max_jobs: int = 100):
+        """
+        Args:
+            max_workers: Number of jobs that may run concurrently
+            max_jobs: Number of finished jobs to keep for later retrieval
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lia-job")
+        self.max_jobs = max_jobs
+        self.jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, target: str, runner: Callable[[Job], Any],
+               timeout: float, user_input: str = "") -> Job:
+        """
+        Submit a job.
+
+        Args:
+            kind: "command" or "osquery"
+            target: Command line or SQL statement (for display)
+            runner: Callable receiving the Job; must return (result, error)
+                and should honour job.cancel_event and job.timeout
+            timeout: Per-job budget in seconds
+            user_input: The request that created the job
+
+        Returns:
+            The queued Job
+        """
+        with self._lock:
+            job = Job(next(self._ids), kind, target, timeout, user_input)
+            # Published only once it has its future, so cancel() and shutdown() always find one
+            job._future = self.executor.submit(self._run, job, runner)
+            self.jobs[job.id] = job
+            self._prune()
+        return job
+
+    def _run(self, job: Job, runner: Callable[[Job], Any]):
+        if job.cancel_event.is_set():
+            job.status = JobStatus.CANCELLED
+            return
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        try:
+            job.result, job.error = runner(job)
+            if job.cancel_event.is_set():
+                job.status = JobStatus.CANCELLED
+            elif job.error and "timed out" in job.error.lower():
+                job.status = JobStatus.TIMED_OUT
+            elif job.error:
+                job.status = JobStatus.FAILED
+            else:
+                job.status = JobStatus.DONE
+        except Exception as e:
+            job.error = f"Job error: {str(e)}"
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_jobs"""
+        if len(self.jobs) <= self.max_jobs:
+            return
+        for job_id in sorted(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].is_finished:
+                del self.jobs[job_id]
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued or running job.
+
+        Returns:
+            True if the job existed and was still cancellable
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.is_finished:
+                return False
+            job.cancel_event.set()
+            if job._future.cancel():
+                job.status = JobStatus.CANCELLED  # Never started
+                job.finished_at = time.time()
+            return True
+
+    def list_jobs(self) -> List[Job]:
+        with self._lock:
+            return [self.jobs[job_id] for job_id in sorted(self.jobs)]
+
+    def shutdown(self, cancel: bool = True, wait: bool = False):
+        """
+        Stop the worker pool
+
+        Args:
+            cancel: Cancel queued and running jobs; the pool's threads are not
+                daemons, so without this the interpreter waits at exit for
+                running jobs to use up their budgets
+            wait: Block until running jobs have stopped
+        """
+        with self._lock:
+            jobs = list(self.jobs.values())
+        if cancel:
+            for job in jobs:
+                job.cancel_event.set()
+        self.executor.shutdown(wait=wait, cancel_futures=cancel)
+        for job in jobs:
+            if job._future.cancelled() and not job.is_finished:
+                job.status = JobStatus.CANCELLED  # Dropped from the queue before it started
+                job.finished_at = time.time()
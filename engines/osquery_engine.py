@@ -1,52 +1,251 @@
 import subprocess
 import json
-from typing import List, Dict, Any, Tuple
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from engines.hash_cache import HashCache, QueryInterrupted
+from engines.resource_limits import (ResourceLimits, OSQUERY_LIMITS, CHILD_SLOTS, LIMIT_LEDGER,
+                                     classify_exit, limit_error)
+
+# Column name of the marker rows separating statements in a batch session
+BATCH_MARKER = "lia_batch_marker"
 
 class OsqueryEngine:
-    def __init__(self, osqueryi_path: str = "osqueryi"):
+    def __init__(self, osqueryi_path: str = "osqueryi", timeout: float = 30,
+                 hash_cache: Optional[HashCache] = None, limits: Optional[ResourceLimits] = None):
         self.osqueryi_path = osqueryi_path
-    
-    def execute_query(self, sql_query: str) -> Tuple[List[Dict[str, Any]], str]:
+        self.timeout = timeout  # Default budget when the caller doesn't give one
+        self.hash_cache = hash_cache  # Answers simple `hash` table queries without osquery
+        self.limits = limits or OSQUERY_LIMITS  # CPU, memory, open files, output size, priority
+
+    def execute_query(self, sql_query: str, timeout: Optional[float] = None,
+                      cancel_event: Optional[threading.Event] = None) -> Tuple[List[Dict[str, Any]], str]:
         """
         Execute an osquery SQL statement and return results
-        
+
+        Args:
+            sql_query: SQL statement to run
+            timeout: Budget in seconds (defaults to self.timeout)
+            cancel_event: Optional event that aborts the query when set
+
         Returns:
             Tuple of (results, error_message)
         """
+        timeout = timeout or self.timeout
+        started = time.monotonic()
+
+        if self.hash_cache is not None:
+            try:
+                cached = self.hash_cache.answer_query(sql_query, timeout=timeout, cancel_event=cancel_event)
+                if cached is not None:
+                    return cached, ""
+            except QueryInterrupted as e:
+                if str(e) == "Query timed out":
+                    self._report("wall_clock", sql_query, started, f"{timeout:g}s")
+                return [], str(e)
+            except Exception as e:
+                print(f"Warning: Hash cache failed, falling back to osquery: {e}")
+
+        # Whatever the cache spent comes out of osqueryi's budget
+        if not CHILD_SLOTS.acquire(timeout=max(started + timeout - time.monotonic(), 0.1)):
+            return [], "Too many commands and queries are running at once; try again shortly"
         try:
-            # Format the query for osqueryi
-            cmd = [
-                self.osqueryi_path,
-                "--json",
-                sql_query
-            ]
-            
-            # Execute the query
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30  # 30 second timeout
-            )
-            
-            if result.returncode != 0:
-                return [], f"Osquery error: {result.stderr}"
-            
+            stdout, stderr, returncode, error = self._run(["--json", sql_query], sql_query, started, timeout,
+                                                          cancel_event)
+            if error:
+                return [], error
+            kind = classify_exit(returncode, stderr)
+            if kind:
+                self._report(kind, sql_query, started)
+                return [], limit_error(kind, self.limits, "Query")
+            if returncode != 0:
+                return [], f"Osquery error: {stderr}"
+
             # Parse JSON output
-            if result.stdout.strip():
+            if stdout.strip():
                 try:
-                    data = json.loads(result.stdout)
+                    data = json.loads(stdout)
                     return data, ""
                 except json.JSONDecodeError:
                     return [], "Failed to parse osquery output"
             else:
                 return [], ""
-                
-        except subprocess.TimeoutExpired:
-            return [], "Query timed out"
+
         except Exception as e:
             return [], f"Execution error: {str(e)}"
-    
+        finally:
+            CHILD_SLOTS.release()
+
+    def _run(self, args: List[str], label: str, started: float, timeout: float,
+             cancel_event: Optional[threading.Event], stdin: Optional[bytes] = None) -> Tuple[str, str, int, str]:
+        """
+        Run osqueryi under the resource limits, polling so it can be cancelled mid-run
+
+        Args:
+            args: Arguments after the osqueryi path
+            label: What is being run, for the limit ledger
+            started: When the caller's budget started (time.monotonic())
+            timeout: Budget in seconds from started
+            cancel_event: Optional event that kills the process when set
+            stdin: Input fed to the process (None: no input)
+
+        Returns:
+            Tuple of (stdout, stderr, returncode, error); error is set when the
+            run was cut short by cancellation, the budget or the output cap
+        """
+        proc = subprocess.Popen(
+            [self.osqueryi_path, *args],
+            stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            preexec_fn=self._preexec_fn()
+        )
+        stdout_chunks, stderr_chunks = [], []
+        threads = [threading.Thread(target=_collect, args=(proc.stdout, stdout_chunks), daemon=True),
+                   threading.Thread(target=_collect, args=(proc.stderr, stderr_chunks), daemon=True)]
+        if stdin is not None:
+            threads.append(threading.Thread(target=_feed, args=(proc.stdin, stdin), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        deadline = started + timeout
+        output_cap = self.limits.output_bytes
+        error = ""
+        while proc.poll() is None:
+            if cancel_event is not None and cancel_event.is_set():
+                error = "Query cancelled"
+            elif time.monotonic() > deadline:
+                error = "Query timed out"
+                self._report("wall_clock", label, started, f"{timeout:g}s")
+            elif output_cap and sum(map(len, stdout_chunks)) > output_cap:
+                error = limit_error("output", self.limits, "Query")
+                self._report("output", label, started)
+            if error:
+                proc.kill()
+                break
+            try:
+                proc.wait(timeout=0.2)
+            except subprocess.TimeoutExpired:
+                pass
+        proc.wait()
+        for thread in threads:
+            thread.join(timeout=1)
+        if not error and output_cap and sum(map(len, stdout_chunks)) > output_cap:
+            error = limit_error("output", self.limits, "Query")  # Finished between polls
+            self._report("output", label, started)
+        stdout = b"".join(stdout_chunks).decode("utf-8", errors="replace")
+        stderr = b"".join(stderr_chunks).decode("utf-8", errors="replace")
+        return stdout, stderr, proc.returncode, error
+
+    def _preexec_fn(self):
+        return self.limits.preexec_fn() if platform.system() != "Windows" else None
+
+    def _report(self, kind: str, sql_query: str, started: float, limit: Optional[str] = None):
+        """Record which limit ended a query"""
+        LIMIT_LEDGER.record(kind, "osquery", sql_query, limit or self.limits.describe(kind),
+                            time.monotonic() - started)
+
+    def execute_batch(self, queries: List[str], timeout: Optional[float] = None, max_parallel: int = 4,
+                      cancel_event: Optional[threading.Event] = None) -> List[Tuple[List[Dict[str, Any]], str]]:
+        """
+        Execute several statements in a single osqueryi session
+
+        Statements are fed through stdin, each followed by a marker query so
+        the concatenated JSON output can be split back per statement. If the
+        session output can't be split reliably, the statements are run
+        concurrently instead. osqueryi reports a failing statement on stderr,
+        which can't be matched to statements, and prints nothing for it on
+        stdout; such a statement is run again on its own to get its error.
+        The session runs under the same slots, limits, output cap and
+        cancellation as execute_query.
+
+        Args:
+            queries: SQL statements
+            timeout: Budget in seconds for the whole batch
+            max_parallel: Concurrency of the fallback path
+            cancel_event: Optional event that aborts the batch when set
+
+        Returns:
+            List of (results, error_message) tuples, one per statement
+        """
+        if not queries:
+            return []
+        timeout = timeout or self.timeout
+
+        script = []
+        for i, sql in enumerate(queries):
+            script.append(" ".join(sql.split()).rstrip(";") + ";")
+            script.append(f"SELECT {i} AS {BATCH_MARKER};")
+        label = "; ".join(queries)
+        started = time.monotonic()
+        batch = None
+        if not CHILD_SLOTS.acquire(timeout=timeout):
+            return [([], "Too many commands and queries are running at once; try again shortly")] * len(queries)
+        try:
+            stdout, stderr, returncode, error = self._run(["--json"], label, started, timeout, cancel_event,
+                                                          stdin=("\n".join(script) + "\n").encode("utf-8"))
+            if error:
+                return [([], error)] * len(queries)
+            kind = classify_exit(returncode, stderr)
+            if kind:
+                self._report(kind, label, started)
+                return [([], limit_error(kind, self.limits, "Query"))] * len(queries)
+            batch = self._split_batch_output(stdout, len(queries))
+        except Exception:
+            pass
+        finally:
+            CHILD_SLOTS.release()
+
+        results = batch or [None] * len(queries)
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            remaining = max(started + timeout - time.monotonic(), 0.1)
+            with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+                reruns = pool.map(lambda i: self.execute_query(queries[i], timeout=remaining,
+                                                               cancel_event=cancel_event), pending)
+                for i, result in zip(pending, reruns):
+                    results[i] = result
+        return results
+
+    def _split_batch_output(self, stdout: str,
+                            count: int) -> Optional[List[Optional[Tuple[List[Dict[str, Any]], str]]]]:
+        """
+        Split concatenated JSON arrays at the marker rows
+
+        Returns:
+            One (results, "") per statement, None for a statement that printed nothing
+            (it failed); None overall if the markers don't line up
+        """
+        decoder = json.JSONDecoder()
+        results: List[Optional[Tuple[List[Dict[str, Any]], str]]] = []
+        current: List[Dict[str, Any]] = []
+        printed = False
+        position = 0
+        while True:
+            while position < len(stdout) and stdout[position].isspace():
+                position += 1
+            if position >= len(stdout):
+                break
+            try:
+                document, position = decoder.raw_decode(stdout, position)
+            except json.JSONDecodeError:
+                return None
+            if not isinstance(document, list):
+                return None
+            if len(document) == 1 and isinstance(document[0], dict) and BATCH_MARKER in document[0]:
+                if str(document[0][BATCH_MARKER]) != str(len(results)):
+                    return None
+                results.append((current, "") if printed else None)
+                current, printed = [], False
+            else:
+                current.extend(document)
+                printed = True
+        if len(results) != count or current:
+            return None
+        return results
+
     def is_osquery_installed(self) -> bool:
         """Check if osquery is installed and accessible"""
         try:
@@ -58,4 +257,19 @@ class OsqueryEngine:
             )
             return result.returncode == 0
         except:
-            return False
\ No newline at end of file
+            return False
+
+
+def _collect(stream, chunks: List[bytes]):
+    """Read a pipe to EOF in chunks"""
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        chunks.append(chunk)
+
+
+def _feed(stream, data: bytes):
+    """Write a process's stdin and close it"""
+    try:
+        stream.write(data)
+        stream.close()
+    except (BrokenPipeError, OSError):
+        pass  # The process exited (or was killed) before reading everything
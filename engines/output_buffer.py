@@ -0,0 +1,94 @@
+"""
+Bounded buffer for command output.
+
+Keeps the first `head_chars` and the last `max_chars - head_chars`
+characters of a stream and counts what was dropped in between, so memory
+per command is fixed no matter how much a `cat` or `find` prints. The
+total is also tracked in UTF-8 bytes (`total_bytes`), which is what the
+byte-denominated output limits are compared against.
+"""
+import threading
+from collections import deque
+
+
+class OutputBuffer:
+    """Head + tail ring buffer with a character cap."""
+
+    def __init__(self, max_chars: int = 1024 * 1024, head_chars: int = None):
+        """
+        Args:
+            max_chars: Total characters retained (head + tail)
+            head_chars: Characters kept from the start (default: a quarter of max_chars)
+        """
+        self.max_chars = max_chars
+        self.head_chars = head_chars if head_chars is not None else max_chars // 4
+        self.tail_chars = max(0, max_chars - self.head_chars)
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self.total_chars = 0
+        self.total_bytes = 0  # UTF-8 size of everything appended
+        self.total_lines = 0
+        self._lock = threading.Lock()
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_chars > self._head_size + self._tail_size
+
+    @property
+    def dropped_chars(self) -> int:
+        return self.total_chars - self._head_size - self._tail_size
+
+    def append(self, chunk: str):
+        if not chunk:
+            return
+        with self._lock:
+            self.total_chars += len(chunk)
+            self.total_bytes += len(chunk) if chunk.isascii() else len(chunk.encode("utf-8", "surrogatepass"))
+            self.total_lines += chunk.count("\n")
+            if self._head_size < self.head_chars:
+                take = chunk[:self.head_chars - self._head_size]
+                self._head.append(take)
+                self._head_size += len(take)
+                chunk = chunk[len(take):]
+                if not chunk:
+                    return
+            if self.tail_chars == 0:
+                return
+            if len(chunk) >= self.tail_chars:
+                self._tail.clear()
+                chunk = chunk[-self.tail_chars:]
+                self._tail_size = 0
+            self._tail.append(chunk)
+            self._tail_size += len(chunk)
+            while self._tail_size > self.tail_chars:
+                excess = self._tail_size - self.tail_chars
+                first = self._tail[0]
+                if len(first) <= excess:
+                    self._tail.popleft()
+                    self._tail_size -= len(first)
+                else:
+                    self._tail[0] = first[excess:]
+                    self._tail_size -= excess
+
+    def tail(self, lines: int = 20) -> str:
+        """Last few lines seen so far (for live display)"""
+        with self._lock:
+            text = "".join(self._tail) if self._tail else "".join(self._head)
+        return "\n".join(text.rstrip("\n").splitlines()[-lines:])
+
+    def text(self) -> str:
+        """Retained output, with a marker where the middle was dropped"""
+        with self._lock:
+            head = "".join(self._head)
+            tail = "".join(self._tail)
+            dropped = self.total_chars - self._head_size - self._tail_size
+        if dropped <= 0:
+            return head + tail
+        # Cut at line boundaries so the marker sits between whole lines
+        head_cut = head.rfind("\n")
+        head = head[:head_cut + 1] if head_cut >= 0 else head
+        tail_cut = tail.find("\n")
+        tail = tail[tail_cut + 1:] if tail_cut >= 0 else tail
+        return f"{head}\n... [{dropped:,} characters of output omitted] ...\n\n{tail}"
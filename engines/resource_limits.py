@@ -0,0 +1,316 @@
+"""
+Resource governance for commands and osquery queries.
+
+Every child process runs under ResourceLimits: CPU time, address space and
+open files are capped with setrlimit in a preexec_fn, the process is
+reniced and given a low I/O priority, and the engines kill it once its
+output passes a byte cap. In the persistent shell session the limits are
+applied per command with `ulimit -S` instead, so one command's budget
+doesn't accumulate into the next. A global ChildSlots semaphore bounds how
+many children run at once across all engines.
+
+When a limit ends a run, it is recorded in LIMIT_LEDGER (in memory and
+as a JSON line in data/limit_events.jsonl), so budgets can be tuned from
+what actually got killed.
+"""
+import ctypes
+import json
+import os
+import platform
+import re
+import signal
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ioprio_set syscall numbers (there is no libc wrapper)
+IOPRIO_SYSCALLS = {"x86_64": 251, "amd64": 251, "aarch64": 30, "arm64": 30, "i386": 289, "i686": 289}
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+# stderr text that means an allocation or open() hit its limit
+MEMORY_ERRORS = re.compile(r"cannot allocate memory|memoryerror|bad_alloc|out of memory|memory exhausted", re.IGNORECASE)
+OPEN_FILE_ERRORS = re.compile(r"too many open files", re.IGNORECASE)
+
+LIMIT_LABELS = {
+    "cpu": "CPU time",
+    "memory": "memory (address space)",
+    "open_files": "open files",
+    "output": "output size",
+    "wall_clock": "wall-clock budget",
+}
+
+
+class ResourceLimits:
+    """Per-execution limits for a child process. None disables a limit."""
+
+    def __init__(self, cpu_seconds: Optional[int] = 60, memory_bytes: Optional[int] = 2 * 1024 ** 3,
+                 open_files: Optional[int] = 1024, output_bytes: Optional[int] = 64 * 1024 ** 2,
+                 nice: Optional[int] = 10, ionice_class: Optional[str] = "best-effort", ionice_level: int = 7):
+        """
+        Args:
+            cpu_seconds: CPU time (SIGXCPU at the limit, SIGKILL 5s later)
+            memory_bytes: Address space (allocations fail beyond it)
+            open_files: File descriptors
+            output_bytes: Output after which the run is killed
+            nice: Niceness added to the child
+            ionice_class: "idle", "best-effort" or "realtime" (Linux only)
+            ionice_level: Priority within the class, 0 (high) to 7 (low)
+        """
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.open_files = open_files
+        self.output_bytes = output_bytes
+        self.nice = nice
+        self.ionice_class = ionice_class
+        self.ionice_level = ionice_level
+
+    def describe(self, kind: str) -> str:
+        """Human-readable limit, e.g. "CPU time limit (60s)" """
+        values = {
+            "cpu": f"{self.cpu_seconds}s",
+            "memory": _size(self.memory_bytes),
+            "open_files": str(self.open_files),
+            "output": _size(self.output_bytes),
+        }
+        value = values.get(kind)
+        return f"{LIMIT_LABELS.get(kind, kind)} limit" + (f" ({value})" if value else "")
+
+    def preexec_fn(self, rlimits: bool = True) -> Optional[Callable[[], None]]:
+        """
+        Function for Popen(preexec_fn=...) applying these limits in the child
+
+        Everything is computed up front; the returned function only makes
+        system calls, as required between fork and exec.
+
+        Args:
+            rlimits: Also apply the setrlimit limits (the shell session only
+                wants priorities and applies limits per command)
+        """
+        if resource is None:
+            return None
+        settings = []
+        if rlimits:
+            settings = [(limit, (soft, hard)) for limit, soft, hard in self._rlimits()]
+        nice = self.nice
+        ioprio = self._ioprio()
+
+        def apply():
+            for limit, values in settings:
+                try:
+                    resource.setrlimit(limit, values)
+                except (ValueError, OSError):
+                    pass
+            if nice:
+                try:
+                    os.nice(nice)
+                except OSError:
+                    pass
+            if ioprio is not None:
+                ioprio()
+        return apply
+
+    def _rlimits(self):
+        """(resource, soft, hard) triples, never raising an existing hard limit"""
+        wanted = []
+        if self.cpu_seconds:
+            wanted.append((resource.RLIMIT_CPU, self.cpu_seconds, self.cpu_seconds + 5))
+        if self.memory_bytes and hasattr(resource, "RLIMIT_AS"):
+            wanted.append((resource.RLIMIT_AS, self.memory_bytes, self.memory_bytes))
+        if self.open_files:
+            wanted.append((resource.RLIMIT_NOFILE, self.open_files, self.open_files))
+        limits = []
+        for limit, soft, hard in wanted:
+            _, current_hard = resource.getrlimit(limit)
+            if current_hard != resource.RLIM_INFINITY:
+                soft, hard = min(soft, current_hard), min(hard, current_hard)
+            limits.append((limit, soft, hard))
+        return limits
+
+    def _ioprio(self) -> Optional[Callable[[], None]]:
+        if platform.system() != "Linux" or self.ionice_class not in IOPRIO_CLASSES:
+            return None
+        number = IOPRIO_SYSCALLS.get(platform.machine().lower())
+        if number is None:
+            return None
+        try:
+            syscall = ctypes.CDLL(None, use_errno=True).syscall
+        except (OSError, AttributeError):
+            return None
+        value = (IOPRIO_CLASSES[self.ionice_class] << 13) | max(0, min(7, self.ionice_level))
+        # ioprio_set(IOPRIO_WHO_PROCESS, 0 = calling process, value)
+        return lambda: syscall(number, 1, 0, value)
+
+    def ulimit_script(self, shell_pid: Optional[int] = None) -> str:
+        """
+        `ulimit -S` lines applying the limits inside a running shell
+
+        RLIMIT_CPU counts the shell's own CPU time too, so the CPU limit is
+        set relative to what the shell has used so far.
+        """
+        if resource is None:
+            return ""
+        lines = []
+        for limit, soft, _ in self._rlimits():
+            if limit == resource.RLIMIT_CPU:
+                soft += _process_cpu_seconds(shell_pid)
+            lines.append(f"ulimit -S {_ULIMIT_FLAGS[limit]} {_ulimit_value(limit, soft)} 2>/dev/null")
+        return "\n".join(lines)
+
+    def ulimit_reset_script(self) -> str:
+        """`ulimit -S` lines restoring the soft limits this process runs with"""
+        if resource is None:
+            return ""
+        lines = []
+        for limit, _, _ in self._rlimits():
+            soft, _ = resource.getrlimit(limit)
+            lines.append(f"ulimit -S {_ULIMIT_FLAGS[limit]} {_ulimit_value(limit, soft)} 2>/dev/null")
+        return "\n".join(lines)
+
+
+_ULIMIT_FLAGS = {}
+if resource is not None:
+    _ULIMIT_FLAGS = {resource.RLIMIT_CPU: "-t", resource.RLIMIT_NOFILE: "-n"}
+    if hasattr(resource, "RLIMIT_AS"):
+        _ULIMIT_FLAGS[resource.RLIMIT_AS] = "-v"
+
+
+def _ulimit_value(limit, value) -> str:
+    if value == resource.RLIM_INFINITY:
+        return "unlimited"
+    if limit == getattr(resource, "RLIMIT_AS", None):
+        return str(value // 1024)  # ulimit -v takes KiB
+    return str(int(value))
+
+
+def _process_cpu_seconds(pid: Optional[int]) -> int:
+    """CPU seconds a process has used so far (0 when unknown)"""
+    if pid is None:
+        return 0
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        return -(-ticks // os.sysconf("SC_CLK_TCK"))
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _size(value: Optional[int]) -> str:
+    if not value:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:g}{unit}" if unit == "B" else f"{value:.0f}{unit}"
+        value /= 1024
+
+
+def classify_exit(returncode: Optional[int], stderr: str = "") -> Optional[str]:
+    """
+    Which limit (if any) ended a run, from its exit status and stderr
+
+    Both a signal death (negative returncode) and a shell's 128+signal status
+    are recognised.
+
+    Returns:
+        "cpu", "memory" or "open_files", or None
+    """
+    if returncode is None or returncode == 0:
+        return None
+    signum = -returncode if returncode < 0 else returncode - 128 if returncode > 128 else None
+    if signum == getattr(signal, "SIGXCPU", None):
+        return "cpu"
+    if stderr and MEMORY_ERRORS.search(stderr):
+        return "memory"
+    if stderr and OPEN_FILE_ERRORS.search(stderr):
+        return "open_files"
+    return None
+
+
+class ChildSlots:
+    """Global cap on concurrently running child processes."""
+
+    def __init__(self, limit: int = 8):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waits = 0
+        self.rejections = 0
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take a slot, waiting up to timeout seconds; False if none freed up"""
+        if self._semaphore.acquire(blocking=False):
+            acquired = True
+        else:
+            with self._lock:
+                self.waits += 1
+            acquired = self._semaphore.acquire(timeout=timeout)
+        with self._lock:
+            if acquired:
+                self.running += 1
+            else:
+                self.rejections += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.running -= 1
+        self._semaphore.release()
+
+
+class LimitLedger:
+    """Record of runs that were ended by a limit."""
+
+    def __init__(self, log_path: Optional[str] = "data/limit_events.jsonl", keep: int = 500):
+        """
+        Args:
+            log_path: JSON-lines file events are appended to (None: memory only)
+            keep: Events kept in memory
+        """
+        self.log_path = log_path
+        self.events: deque = deque(maxlen=keep)
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, engine: str, target: str, limit: str, elapsed: float):
+        event = {"time": time.time(), "kind": kind, "engine": engine, "target": target[:500],
+                 "limit": limit, "elapsed": round(elapsed, 3)}
+        with self._lock:
+            self.events.append(event)
+            self.counts[(engine, kind)] += 1
+            if self.log_path:
+                try:
+                    directory = os.path.dirname(self.log_path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    with open(self.log_path, "a") as f:
+                        f.write(json.dumps(event) + "\n")
+                except OSError as e:
+                    print(f"Warning: Could not log resource limit event: {e}")
+
+    def summary(self) -> Dict[str, Any]:
+        """Kill counts per (engine, limit) and the most recent events"""
+        with self._lock:
+            return {
+                "counts": {f"{engine}/{kind}": count for (engine, kind), count in self.counts.most_common()},
+                "recent": list(self.events)[-10:],
+            }
+
+
+# Defaults per engine; osquery scans (hash, file) legitimately need more
+COMMAND_LIMITS = ResourceLimits()
+OSQUERY_LIMITS = ResourceLimits(cpu_seconds=300, memory_bytes=4 * 1024 ** 3, open_files=4096)
+
+CHILD_SLOTS = ChildSlots()
+LIMIT_LEDGER = LimitLedger()
+
+
+def limit_error(kind: str, limits: ResourceLimits, noun: str = "Command") -> str:
+    """Error message naming the limit that ended a run"""
+    return f"{noun} stopped: {limits.describe(kind)} exceeded"
@@ -0,0 +1,241 @@
+"""
+Persistent shell session for CommandEngine.
+
+One long-lived shell runs per conversation, so `cd`, exported variables and
+aliases carry over between commands and each command skips shell startup.
+Commands are written to the shell's stdin followed by a sentinel line that
+carries the exit status and working directory; output is read in chunks up
+to that sentinel into a bounded OutputBuffer. A command that overruns its
+budget (or is cancelled) takes the shell down with it, and the next command
+starts a fresh one in the last known directory. Resource limits are set with
+`ulimit -S` around each command and restored afterwards; the shell itself
+only runs at reduced CPU and I/O priority.
+"""
+import codecs
+import os
+import queue
+import re
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from engines.output_buffer import OutputBuffer
+from engines.resource_limits import ResourceLimits, classify_exit, limit_error
+
+# Environment variables never passed to the session (API keys and the like)
+SECRET_ENV_PATTERN = re.compile(r"KEY|TOKEN|SECRET|PASSWORD|PASSWD|CREDENTIAL|COHERE", re.IGNORECASE)
+
+
+class ShellSessionError(Exception):
+    """The session shell could not be started or died mid-command."""
+
+
+class ShellSession:
+    """A sentinel-delimited shell driven through pipes."""
+
+    def __init__(self, shell: Optional[str] = None, cwd: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None, limits: Optional[ResourceLimits] = None):
+        """
+        Args:
+            shell: Shell binary (defaults to bash, then sh)
+            cwd: Initial working directory (defaults to the current one)
+            env: Environment (defaults to os.environ without secrets)
+            limits: Per-command resource limits (None: unlimited)
+        """
+        self.shell = shell or shutil.which("bash") or "/bin/sh"
+        self.cwd = cwd or os.getcwd()
+        self.env = env if env is not None else scrubbed_environment()
+        self.proc: Optional[subprocess.Popen] = None
+        self.limits = limits
+        self.restarts = 0
+        self.last_limit: Optional[str] = None  # Limit that ended the last command, if any
+        self._chunks: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._tmpdir = tempfile.mkdtemp(prefix="lia-shell-")
+        self._stderr_path = os.path.join(self._tmpdir, "stderr")
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def start(self):
+        """Start the shell (again) in the last known working directory"""
+        if self.alive:
+            return
+        if self.proc is not None:
+            self.restarts += 1
+        cwd = self.cwd if os.path.isdir(self.cwd) else os.path.expanduser("~")
+        args = [self.shell, "--noprofile", "--norc"] if os.path.basename(self.shell) == "bash" else [self.shell]
+        try:
+            self.proc = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,  # Shell-level errors (e.g. syntax) show up as output
+                bufsize=0,
+                cwd=cwd,
+                env=self.env,
+                start_new_session=True,  # Own process group, so a runaway command can be killed with it
+                preexec_fn=self.limits.preexec_fn(rlimits=False) if self.limits else None
+            )
+        except OSError as e:
+            self.proc = None
+            raise ShellSessionError(f"Could not start {self.shell}: {e}")
+
+        self._chunks = queue.Queue(maxsize=64)  # Back-pressure: a flood blocks the reader, not memory
+        threading.Thread(target=self._read, args=(self.proc, self._chunks), daemon=True).start()
+
+    @staticmethod
+    def _read(proc: subprocess.Popen, chunks: "queue.Queue[Optional[str]]"):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        fd = proc.stdout.fileno()
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                chunks.put(text)
+        chunks.put(None)  # EOF: the shell exited
+
+    def run(self, command: str, timeout: float, on_output: Optional[Callable[[str], None]] = None,
+            cancel_event: Optional[threading.Event] = None,
+            buffer: Optional[OutputBuffer] = None) -> Tuple[str, str, Optional[int]]:
+        """
+        Run one command in the session
+
+        Args:
+            command: Command line
+            timeout: Budget in seconds
+            on_output: Called with each chunk of output as it arrives
+            cancel_event: Set to abort the command
+            buffer: Where output is retained (default: a 1 MB OutputBuffer)
+
+        Returns:
+            Tuple of (stdout, stderr, exit status); the status is None when the
+            command timed out, was cancelled or ended the shell, in which case
+            stderr says which
+        """
+        with self._lock:
+            self.start()
+            self.last_limit = None
+            token = f"__LIA_DONE_{uuid.uuid4().hex}__"
+            stderr_path = shlex.quote(self._stderr_path)
+            apply_limits = reset_limits = ""
+            if self.limits is not None:
+                apply_limits = self.limits.ulimit_script(self.proc.pid) + "\n"
+                reset_limits = self.limits.ulimit_reset_script() + "\n"
+            # stdin comes from /dev/null so commands can't eat the rest of the protocol
+            script = (f"{apply_limits}{{ {command}\n}} < /dev/null 2> {stderr_path}\n"
+                      f"__lia_status=$?\n{reset_limits}"
+                      f"printf '\\n{token} %d %s\\n' \"$__lia_status\" \"$PWD\"\n")
+            try:
+                self.proc.stdin.write(script.encode())
+                self.proc.stdin.flush()
+            except (OSError, ValueError):
+                self.stop()
+                return "", "Shell session exited", None
+
+            output = buffer if buffer is not None else OutputBuffer()
+            marker = "\n" + token + " "
+            pending = ""  # Unemitted text that might hold the start of the sentinel
+            status_line = None
+            deadline = time.monotonic() + timeout
+            while status_line is None:
+                if cancel_event is not None and cancel_event.is_set():
+                    self.stop()
+                    self._emit(output, pending, on_output)
+                    return output.text().strip(), "Command cancelled", None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stop()
+                    self._emit(output, pending, on_output)
+                    return output.text().strip(), "Command timed out", None
+                try:
+                    chunk = self._chunks.get(timeout=min(remaining, 0.2))
+                except queue.Empty:
+                    continue
+                if chunk is None:
+                    self.stop()
+                    self._emit(output, pending, on_output)
+                    self.last_limit = classify_exit(self.proc.returncode)  # e.g. SIGXCPU in a shell loop
+                    if self.last_limit:
+                        return output.text().strip(), limit_error(self.last_limit, self.limits), None
+                    return output.text().strip(), "Shell session exited", None
+
+                pending += chunk
+                index = pending.find(marker)
+                if index >= 0:
+                    end = pending.find("\n", index + len(marker))
+                    if end < 0:
+                        continue  # Wait for the rest of the status line
+                    self._emit(output, pending[:index], on_output)
+                    status_line = pending[index + len(marker):end]
+                else:
+                    keep = len(marker) - 1
+                    self._emit(output, pending[:-keep], on_output)
+                    pending = pending[-keep:]
+
+                if self.limits is not None and self.limits.output_bytes and output.total_bytes > self.limits.output_bytes:
+                    self.stop()
+                    self.last_limit = "output"
+                    return output.text().strip(), limit_error("output", self.limits), None
+
+            status, cwd = status_line.split(" ", 1)
+            self.cwd = cwd
+            try:
+                with open(self._stderr_path, "r", errors="replace") as f:
+                    stderr = f.read(64 * 1024)
+            except OSError:
+                stderr = ""
+            self.last_limit = classify_exit(int(status), stderr)
+            return output.text().strip(), stderr.strip(), int(status)
+
+    @staticmethod
+    def _emit(output: OutputBuffer, text: str, on_output: Optional[Callable[[str], None]]):
+        if text:
+            output.append(text)
+            if on_output:
+                on_output(text)
+
+    def stop(self):
+        """Kill the shell and everything it started"""
+        proc = self.proc  # The dead handle stays so the next start() counts as a restart
+        if proc is None or proc.poll() is not None:
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            proc.stdin.close()
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+def scrubbed_environment() -> Dict[str, str]:
+    """os.environ without secrets, with shell history disabled"""
+    env = {name: value for name, value in os.environ.items() if not SECRET_ENV_PATTERN.search(name)}
+    env["HISTFILE"] = "/dev/null"
+    return env
@@ -1,39 +1,252 @@
 """
 Text embedding utilities for RAG implementation.
+
+Embedder wraps a sentence-transformers model (loaded on first use) and
+serves repeated texts from caches: an in-memory LRU, then an optional SQLite
+cache on disk keyed by (model, SHA-1 of the text). Only the misses are
+encoded, in batches of batch_size. Vectors are L2-normalised, so they can be
+handed out as float32 or shrunk to float16, or to int8 scaled by 127, for
+storage; the cosine ranking survives both.
+
+get_embedder() returns one shared Embedder per model, so every component
+that needs the embedding of a text in a turn gets it from the same cache.
 """
-from sentence_transformers import SentenceTransformer
-from typing import List, Union
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+
 import numpy as np
 
+OUTPUT_DTYPES = ("float32", "float16", "int8")
+INT8_SCALE = 127.0
+
+
 class Embedder:
-    """Text embedder using sentence-transformers."""
-    
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    """Text embedder using sentence-transformers, with batching and caching."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 64,
+                 num_threads: Optional[int] = None, cache_size: int = 4096,
+                 cache_path: Optional[str] = None, dtype: str = "float32"):
         """
         Initialize the embedder.
-        
+
         Args:
             model_name: Name of the sentence transformer model to use
+            batch_size: Texts encoded per model call
+            num_threads: Torch intra-op threads (None: torch's default)
+            cache_size: Embeddings kept in memory
+            cache_path: SQLite file for the on-disk cache (None: memory only)
+            dtype: Default output dtype: "float32", "float16" or "int8"
         """
-        self.model = SentenceTransformer(model_name)
-    
+        if dtype not in OUTPUT_DTYPES:
+            raise ValueError(f"dtype must be one of {', '.join(OUTPUT_DTYPES)}")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.cache_size = cache_size
+        self.cache_path = cache_path
+        self.dtype = dtype
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "encoded": 0, "model_calls": 0}
+        self._model = None
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()  # The model isn't safe to call from several threads
+        self._conn: Optional[sqlite3.Connection] = None
+        if cache_path:
+            self._open_cache(cache_path)
+
+    @property
+    def model(self):
+        """The sentence-transformers model, loaded on first access"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    if self.num_threads:
+                        import torch
+                        torch.set_num_threads(self.num_threads)
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _open_cache(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, text_hash BLOB NOT NULL, "
+                "vector BLOB NOT NULL, PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+        except sqlite3.Error as e:
+            print(f"Warning: Embedding cache disabled: {e}")
+            self._conn = None
+
     def encode(self, texts: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
         """
         Encode text(s) into embeddings.
-        
+
         Args:
             texts: Single text string or list of text strings
-            
+
         Returns:
             Embedding vector(s)
         """
         if isinstance(texts, str):
             texts = [texts]
-            
-        embeddings = self.model.encode(texts)
-        
+
+        embeddings = self.embed(texts, dtype="float32")
+
         # If single text, return single embedding
         if len(embeddings) == 1:
             return embeddings[0].tolist()
-        
-        return [embedding.tolist() for embedding in embeddings]
\ No newline at end of file
+
+        return [embedding.tolist() for embedding in embeddings]
+
+    def embed(self, texts: List[str], dtype: Optional[str] = None) -> np.ndarray:
+        """
+        Embed texts, encoding only those not already cached
+
+        Args:
+            texts: Texts to embed
+            dtype: Output dtype (default: the embedder's)
+
+        Returns:
+            (len(texts), dim) array of L2-normalised embeddings
+        """
+        dtype = dtype or self.dtype
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [self._key(text) for text in texts]
+        vectors: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[key] = vector
+                    self.stats["memory_hits"] += 1
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing and self._conn is not None:
+            found = self._read_disk(missing)
+            vectors.update(found)
+            missing = [key for key in missing if key not in found]
+            self._remember(found)
+
+        if missing:
+            texts_by_key = dict(zip(keys, texts))
+            encoded = self._encode([texts_by_key[key] for key in missing])
+            computed = dict(zip(missing, encoded))
+            vectors.update(computed)
+            self._remember(computed)
+            self._write_disk(computed)
+
+        return quantize(np.stack([vectors[key] for key in keys]), dtype)
+
+    def embed_query(self, text: str, dtype: Optional[str] = None) -> np.ndarray:
+        """Embedding of a single text as a 1-D array"""
+        return self.embed([text], dtype=dtype)[0]
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        model = self.model
+        with self._model_lock:
+            vectors = model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                   convert_to_numpy=True, show_progress_bar=False)
+        with self._lock:
+            self.stats["encoded"] += len(texts)
+            self.stats["model_calls"] += 1
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+    def _remember(self, vectors: Dict[bytes, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
+
+    def _read_disk(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        try:
+            with self._lock:
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN "
+                        f"({','.join('?' * len(chunk))})", [self.model_name, *chunk]
+                    ).fetchall()
+                    for key, data in rows:
+                        found[key] = np.frombuffer(data, dtype=np.float16).astype(np.float32)
+                self.stats["disk_hits"] += len(found)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not read embedding cache: {e}")
+        return found
+
+    def _write_disk(self, vectors: Dict[bytes, np.ndarray]):
+        if self._conn is None or not vectors:
+            return
+        try:
+            with self._lock, self._conn:
+                # float16 on disk: half the size, well within the model's own precision
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    [(self.model_name, key, vector.astype(np.float16).tobytes()) for key, vector in vectors.items()]
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: Could not write embedding cache: {e}")
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        return stats
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> np.ndarray:
+    """
+    Convert normalised float vectors to the given dtype
+
+    int8 maps [-1, 1] onto [-127, 127]; use dequantize() to get floats back.
+    """
+    if dtype == "float32":
+        return vectors.astype(np.float32, copy=False)
+    if dtype == "float16":
+        return vectors.astype(np.float16)
+    if dtype == "int8":
+        return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+    raise ValueError(f"dtype must be one of {', '.join(OUTPUT_DTYPES)}")
+
+
+def dequantize(vectors: np.ndarray) -> np.ndarray:
+    """float32 vectors back from any quantize() output"""
+    if vectors.dtype == np.int8:
+        return vectors.astype(np.float32) / INT8_SCALE
+    return vectors.astype(np.float32, copy=False)
+
+
+_EMBEDDERS: Dict[str, Embedder] = {}
+_EMBEDDERS_LOCK = threading.Lock()
+
+
+def get_embedder(model_name: str = "all-MiniLM-L6-v2",
+                 cache_path: Optional[str] = "data/embedding_cache.sqlite3") -> Embedder:
+    """
+    The process-wide Embedder for a model (its model loads on first use)
+
+    Args:
+        model_name: Sentence transformer model
+        cache_path: On-disk cache used when the embedder is first created
+    """
+    with _EMBEDDERS_LOCK:
+        embedder = _EMBEDDERS.get(model_name)
+        if embedder is None:
+            embedder = _EMBEDDERS[model_name] = Embedder(model_name, cache_path=cache_path)
+        return embedder
@@ -7,12 +7,13 @@ REPLACE: rag/ingestion/ingest_commands.py
 import json
 import requests
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import sys
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from rag.embedder import Embedder
 from rag.vectordb import VectorDB
 
 
@@ -26,8 +27,9 @@ class TLDRIngester:
     # Platform directories to ingest
     PLATFORMS = ["common", "linux", "osx", "windows"]
     
-    def __init__(self, vectordb: VectorDB):
+    def __init__(self, vectordb: VectorDB, embedder: Optional[Embedder] = None):
         self.vectordb = vectordb
+        self.embedder = embedder  # None: Chroma embeds the documents itself
         self.session = requests.Session()
         
     def fetch_command_list(self, platform: str) -> List[Dict[str, str]]:
@@ -231,7 +233,9 @@ class TLDRIngester:
                     collection_name="os_commands",
                     documents=documents,
                     metadatas=metadatas,
-                    ids=ids
+                    ids=ids,
+                    embeddings=self.embedder.embed(documents) if self.embedder else None,
+                    backend="chroma"
                 )
                 print(f"  ✅ Ingested {len(documents)} commands from {platform}")
                 return len(documents)
@@ -275,15 +279,16 @@ class TLDRIngester:
         return results
 
 
-def ingest_command_docs(vectordb: VectorDB):
+def ingest_command_docs(vectordb: VectorDB, embedder: Optional[Embedder] = None):
     """
     Main function to ingest TLDR documentation.
     Replaces the old hardcoded command ingestion.
     
     Args:
         vectordb: VectorDB instance
+        embedder: Embedder for the documents (None: Chroma's default)
     """
-    ingester = TLDRIngester(vectordb)
+    ingester = TLDRIngester(vectordb, embedder)
     
     # Ingest all platforms
     # Set limit_per_platform=50 to limit for testing
@@ -306,5 +311,15 @@ if __name__ == "__main__":
     except Exception:
         print("⚠️  Collection already exists, will add to it")
     
+    # Same model and cache the retriever uses, batched for throughput
+    embedder = Embedder(batch_size=128, cache_path="data/embedding_cache.sqlite3")
+    
     # Ingest TLDR commands
-    ingest_command_docs(db)
\ No newline at end of file
+    ingest_command_docs(db, embedder)
+    
+    # Small enough to serve from the in-process memory-mapped index
+    try:
+        count = db.export_to_index("os_commands")
+        print(f"Exported {count} documents to the vector index ({db.index.directory})")
+    except Exception as e:
+        print(f"Could not export to the vector index: {e}")
@@ -5,7 +5,7 @@ specs/windows/, specs/posix/, specs/utility/, etc.)
 """
 import json
 import requests
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import sys
 import os
 import re
@@ -13,6 +13,7 @@ import re
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from rag.embedder import Embedder
 from rag.vectordb import VectorDB
 
 # All spec directories to fetch from
@@ -199,7 +200,9 @@ def create_documents(tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             "table": table['name'],
             "platform": table.get('platform', 'Unknown'),
             "source": "osquery_schema",
-            "num_columns": len(table['columns'])
+            "num_columns": len(table['columns']),
+            # Comma-separated, for the keyword index (metadata values must be scalars)
+            "columns": ",".join(col['name'] for col in table['columns'])
         }
         
         if table.get('specified_platform'):
@@ -212,12 +215,13 @@ def create_documents(tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     
     return documents
 
-def ingest_complete_schema(vectordb: VectorDB):
+def ingest_complete_schema(vectordb: VectorDB, embedder: Optional[Embedder] = None):
     """
     Ingest complete osquery schema into vector database.
     
     Args:
         vectordb: VectorDB instance
+        embedder: Embedder for the documents (None: Chroma's default)
     """
     print("="*60)
     print("Fetching COMPLETE osquery schema from GitHub")
@@ -257,7 +261,9 @@ def ingest_complete_schema(vectordb: VectorDB):
             collection_name="osquery_docs",
             documents=doc_texts,
             metadatas=doc_metadatas,
-            ids=doc_ids
+            ids=doc_ids,
+            embeddings=embedder.embed(doc_texts) if embedder else None,
+            backend="chroma"
         )
         print(f"\n{'='*60}")
         print(f"✓ Ingestion complete! {len(documents)} documents added")
@@ -276,5 +282,15 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Collection already exists or error: {e}")
     
+    # Same model and cache the retriever uses, batched for throughput
+    embedder = Embedder(batch_size=128, cache_path="data/embedding_cache.sqlite3")
+    
     # Ingest complete schema
-    ingest_complete_schema(db)
\ No newline at end of file
+    ingest_complete_schema(db, embedder)
+    
+    # Small enough to serve from the in-process memory-mapped index
+    try:
+        count = db.export_to_index("osquery_docs")
+        print(f"Exported {count} documents to the vector index ({db.index.directory})")
+    except Exception as e:
+        print(f"Could not export to the vector index: {e}")
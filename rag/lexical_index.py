@@ -0,0 +1,231 @@
+"""
+Lexical side of hybrid retrieval: exact names and BM25.
+
+Built from a collection's documents and the metadata the ingestion scripts
+attach (`table` for osquery_docs, `command` for os_commands, plus `columns`
+when present, else the column list parsed from the document text):
+
+- A name index maps table and command names to their documents. When the
+  user literally names one (`listening_ports`, `netstat`), Retriever returns
+  those documents without running an embedding search at all.
+- BM25 over the document text, with names and column names added as extra
+  terms, ranks documents by the words the user actually typed; its ranking
+  is fused with the vector ranking by reciprocal rank fusion.
+
+Identifiers are split too, so `listening_ports` also matches "listening"
+and "ports".
+
+The index is built when a collection is exported to the mmap index (during
+ingestion) and saved next to it as lexical.npz, so serving it only loads
+the postings; Retriever rebuilds its copy whenever VectorDB reports that a
+collection changed.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9_.+-]*[a-z0-9+]|[a-z0-9]")
+BACKTICK_PATTERN = re.compile(r"`([^`]+)`")
+COLUMN_LINE = re.compile(r"^\s+-\s+([A-Za-z0-9_]+)\s+\(", re.MULTILINE)
+
+# Function words, ignored by both the name lookup and BM25
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "if", "in", "is", "it", "its", "me", "my", "of", "on", "or", "please", "so", "that", "the", "them",
+    "then", "this", "to", "up", "us", "was", "we", "what", "when", "where", "which", "who", "why", "will",
+    "with", "you", "your", "table", "tables", "column", "columns", "command", "commands",
+}
+
+# Ordinary English words that are also command or table names; in a request
+# they only count as a name when quoted in backticks, so "what users are
+# logged in" is still searched rather than answered with the `users` table
+AMBIGUOUS_NAMES = {
+    "all", "file", "find", "get", "give", "go", "head", "help", "join", "last", "less", "link", "list",
+    "look", "make", "more", "new", "open", "print", "read", "say", "see", "set", "show", "split", "tail",
+    "tell", "test", "time", "top", "true", "false", "type", "wait", "want", "watch", "write", "yes",
+    # osquery tables
+    "apps", "battery", "certificates", "connectivity", "drivers", "groups", "hash", "magic", "memory",
+    "mounts", "patches", "preferences", "processes", "programs", "registry", "routes", "services", "shares",
+    "signature", "users",
+    # tldr commands
+    "clear", "column", "cut", "date", "expand", "format", "free", "history", "host", "jobs", "kill",
+    "login", "logout", "mount", "paste", "reset", "route", "sleep", "sort", "touch", "tree", "units", "wall",
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 3  # Name terms count as this many occurrences
+RRF_K = 60
+
+
+def terms(text: str) -> List[str]:
+    """Lowercase words; identifiers also yield their parts (a_b -> a_b, a, b)"""
+    result = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        result.append(word)
+        parts = re.split(r"[_.+-]", word)
+        if len(parts) > 1:
+            result.extend(part for part in parts if part)
+    return result
+
+
+class LexicalIndex:
+    """Name lookup and BM25 over one collection."""
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Optional[Dict[str, Any]]]):
+        self.ids = list(ids)
+        self.documents = [document or "" for document in documents]
+        self.metadatas = [metadata or {} for metadata in metadatas]
+        self.names: Dict[str, List[int]] = defaultdict(list)  # table/command name -> rows
+        postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths = np.zeros(len(self.ids), dtype=np.float32)
+
+        for row, (document, metadata) in enumerate(zip(self.documents, self.metadatas)):
+            counts = Counter(terms(document))
+            for key in ("table", "command"):
+                name = str(metadata.get(key) or "").lower()
+                if name:
+                    self.names[name].append(row)
+                    for term in terms(name):
+                        counts[term] += NAME_WEIGHT
+            columns = metadata.get("columns")
+            column_names = columns.split(",") if isinstance(columns, str) else COLUMN_LINE.findall(document)
+            for column in column_names:
+                for term in terms(column):
+                    counts[term] += 1
+            lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                postings[term][row] = count
+
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+        self._masks: Dict[Tuple[str, Tuple[str, ...]], np.ndarray] = {}
+        self._lengths = lengths
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            term: (np.fromiter(rows.keys(), dtype=np.int64, count=len(rows)),
+                   np.fromiter(rows.values(), dtype=np.float32, count=len(rows)))
+            for term, rows in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def save(self, path: str):
+        """Write the names, postings and lengths (not the documents) as an .npz file"""
+        terms_list = list(self._postings)
+        rows = [self._postings[term][0] for term in terms_list]
+        names = list(self.names)
+        np.savez(
+            path,
+            size=np.array([len(self.ids)]),
+            terms=np.array(terms_list, dtype=str),
+            offsets=np.cumsum([0] + [len(r) for r in rows]).astype(np.int64),
+            rows=np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+            counts=(np.concatenate([self._postings[term][1] for term in terms_list]) if rows
+                    else np.zeros(0, dtype=np.float32)),
+            lengths=self._lengths,
+            names=np.array(names, dtype=str),
+            name_offsets=np.cumsum([0] + [len(self.names[name]) for name in names]).astype(np.int64),
+            name_rows=np.array([row for name in names for row in self.names[name]], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path: str, ids: List[str], documents: List[str],
+             metadatas: List[Optional[Dict[str, Any]]]) -> "LexicalIndex":
+        """
+        An index saved with save(), for the same documents in the same order
+
+        Raises:
+            ValueError: The file was saved for a different number of documents
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["size"][0]) != len(ids):
+                raise ValueError(f"{path} is out of date")
+            index = cls.__new__(cls)
+            index.ids = list(ids)
+            index.documents = [document or "" for document in documents]
+            index.metadatas = [metadata or {} for metadata in metadatas]
+            offsets, rows, counts = data["offsets"], data["rows"], data["counts"]
+            index._postings = {str(term): (rows[offsets[i]:offsets[i + 1]], counts[offsets[i]:offsets[i + 1]])
+                               for i, term in enumerate(data["terms"])}
+            name_offsets, name_rows = data["name_offsets"], data["name_rows"]
+            index.names = defaultdict(list, {
+                str(name): name_rows[name_offsets[i]:name_offsets[i + 1]].tolist()
+                for i, name in enumerate(data["names"])
+            })
+            index._lengths = data["lengths"]
+        index.average_length = float(index._lengths.mean()) if len(index._lengths) else 0.0
+        index._masks = {}
+        return index
+
+    @classmethod
+    def from_collection(cls, collection) -> "LexicalIndex":
+        """Build from a Chroma or mmap collection"""
+        data = collection.get(include=["documents", "metadatas"])
+        return cls(data.get("ids") or [], data.get("documents") or [], data.get("metadatas") or [])
+
+    def allowed(self, field: str, values: Sequence[Any]) -> np.ndarray:
+        """Row mask of documents whose metadata field is one of values (cached)"""
+        key = (field, tuple(sorted(map(str, values))))
+        mask = self._masks.get(key)
+        if mask is None:
+            wanted = set(values)
+            mask = self._masks[key] = np.fromiter((metadata.get(field) in wanted for metadata in self.metadatas),
+                                                  dtype=bool, count=len(self.metadatas))
+        return mask
+
+    def exact_matches(self, query: str, allowed: Optional[np.ndarray] = None) -> List[int]:
+        """
+        Rows whose table or command name the query spells out, in order of mention
+
+        A name counts if it is quoted in backticks or is not an ordinary
+        English word (STOPWORDS, AMBIGUOUS_NAMES).
+        """
+        candidates = [span.strip().lower() for span in BACKTICK_PATTERN.findall(query)]
+        for word in WORD_PATTERN.findall(query.lower()):
+            if word in STOPWORDS or word in AMBIGUOUS_NAMES:
+                continue
+            candidates.append(word)
+        rows: List[int] = []
+        for name in dict.fromkeys(candidates):
+            for row in self.names.get(name, ()):
+                if (allowed is None or allowed[row]) and row not in rows:
+                    rows.append(row)
+        return rows
+
+    def bm25(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """The k best rows by BM25 as (row, score), best first; rows scoring 0 are left out"""
+        if not self.ids or k <= 0:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        normaliser = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths / max(self.average_length, 1e-9))
+        for term in set(terms(query)) - STOPWORDS:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            rows, counts = posting
+            idf = math.log(1 + (len(self.ids) - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * counts * (BM25_K1 + 1) / (counts + normaliser[rows])
+        if allowed is not None:
+            scores[~allowed] = 0
+        matching = np.flatnonzero(scores > 0)
+        if len(matching) > k:
+            matching = matching[np.argpartition(-scores[matching], k - 1)[:k]]
+        matching = matching[np.argsort(-scores[matching])]
+        return [(int(row), float(scores[row])) for row in matching]
+
+    def document(self, row: int, **extra) -> Dict[str, Any]:
+        """A row in Retriever's result format"""
+        return dict({"id": self.ids[row], "text": self.documents[row], "metadata": self.metadatas[row],
+                     "distance": None}, **extra)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)); best first"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -0,0 +1,351 @@
+"""
+In-process vector index for small collections, backed by a memory-mapped
+NumPy file.
+
+`osquery_docs` (a few hundred tables) and `os_commands` (a few thousand
+tldr pages) are small enough that a brute-force scan beats Chroma's client,
+SQLite and HNSW layers. Each collection is a directory holding:
+
+    vectors.npy    L2-normalised embeddings, one row per document (float32
+                   or float16), opened with np.load(mmap_mode="r")
+    sidecar.json   ids, documents and metadatas in row order, plus the
+                   embedding model and dtype
+    lexical.npz    the collection's rag.lexical_index.LexicalIndex, built
+                   whenever the collection is written
+
+Opening a collection is one mmap plus reading the sidecar; the OS pages
+vectors in on demand. A query is one matrix-vector product over the rows
+that pass the metadata pre-filter, followed by argpartition for the top k.
+
+MmapClient and MmapCollection implement the subset of Chroma's client and
+collection API that VectorDB uses (add, get, query, count), so VectorDB can
+serve a collection from either store.
+"""
+import json
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .lexical_index import LexicalIndex
+
+VECTORS_FILE = "vectors.npy"
+SIDECAR_FILE = "sidecar.json"
+LEXICAL_FILE = "lexical.npz"
+
+
+class MmapCollection:
+    """One collection: memory-mapped vectors plus a JSON metadata sidecar."""
+
+    def __init__(self, directory: str, name: str, embedder_factory: Optional[Callable[[], Any]] = None,
+                 dtype: str = "float32"):
+        """
+        Args:
+            directory: Collection directory
+            name: Collection name
+            embedder_factory: Returns the rag.embedder.Embedder used for texts
+                (documents added without embeddings, and query_texts)
+            dtype: Storage dtype for new collections, "float32" or "float16"
+        """
+        self.directory = directory
+        self.name = name
+        self.embedder_factory = embedder_factory
+        self.dtype = dtype
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._model: Optional[str] = None
+        self._columns: Dict[str, np.ndarray] = {}  # metadata key -> values in row order
+        self._masks: Dict[str, np.ndarray] = {}  # where clause (as JSON) -> row mask
+        self._lexical: Optional[LexicalIndex] = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._vectors is not None:
+            return
+        with self._lock:
+            if self._vectors is not None:
+                return
+            with open(os.path.join(self.directory, SIDECAR_FILE)) as f:
+                sidecar = json.load(f)
+            vectors = np.load(os.path.join(self.directory, VECTORS_FILE), mmap_mode="r")
+            if len(vectors) != len(sidecar["ids"]):
+                raise ValueError(f"Vector index for {self.name} is inconsistent; re-export it")
+            self._ids = sidecar["ids"]
+            self._documents = sidecar["documents"]
+            self._metadatas = sidecar["metadatas"]
+            self._model = sidecar.get("model")
+            self.dtype = str(vectors.dtype)
+            self._columns, self._masks = {}, {}
+            self._lexical = None
+            self._vectors = vectors
+
+    def count(self) -> int:
+        self._load()
+        return len(self._ids)
+
+    def add(self, documents: List[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+            ids: Optional[List[str]] = None, embeddings: Optional[Sequence[Sequence[float]]] = None,
+            model: Optional[str] = None):
+        """
+        Add (or replace, by id) documents; the files are rewritten atomically
+
+        Args:
+            documents: Document texts
+            metadatas: Metadata per document
+            ids: Document ids
+            embeddings: Document embeddings (None: embedded with the embedder)
+            model: Embedding model of the given embeddings, recorded in the sidecar
+        """
+        ids = ids or [f"doc_{i}" for i in range(len(documents))]
+        metadatas = metadatas or [{} for _ in documents]
+        if embeddings is None:
+            embedder = self._embedder()
+            new_vectors = embedder.embed(documents, dtype="float32")
+            model = embedder.model_name
+        else:
+            new_vectors = _normalise(np.asarray(embeddings, dtype=np.float32))
+
+        if os.path.exists(os.path.join(self.directory, SIDECAR_FILE)):
+            self._load()
+            model = model or self._model
+            replaced = set(ids)
+            keep = [row for row, doc_id in enumerate(self._ids) if doc_id not in replaced]
+            vectors = np.concatenate([np.asarray(self._vectors[keep], dtype=np.float32), new_vectors])
+            all_ids = [self._ids[row] for row in keep] + list(ids)
+            all_documents = [self._documents[row] for row in keep] + list(documents)
+            all_metadatas = [self._metadatas[row] for row in keep] + list(metadatas)
+        else:
+            vectors, all_ids, all_documents, all_metadatas = new_vectors, list(ids), list(documents), list(metadatas)
+
+        os.makedirs(self.directory, exist_ok=True)
+        vectors_tmp = os.path.join(self.directory, f"{VECTORS_FILE}.{os.getpid()}.tmp")
+        sidecar_tmp = os.path.join(self.directory, f"{SIDECAR_FILE}.{os.getpid()}.tmp")
+        lexical_tmp = os.path.join(self.directory, f"{LEXICAL_FILE}.{os.getpid()}.tmp")
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, vectors.astype(self.dtype))
+        with open(sidecar_tmp, "w") as f:
+            json.dump({"name": self.name, "model": model, "dtype": self.dtype, "dim": int(vectors.shape[1]),
+                       "ids": all_ids, "documents": all_documents, "metadatas": all_metadatas}, f)
+        with open(lexical_tmp, "wb") as f:
+            LexicalIndex(all_ids, all_documents, all_metadatas).save(f)
+        with self._lock:
+            os.replace(vectors_tmp, os.path.join(self.directory, VECTORS_FILE))
+            os.replace(lexical_tmp, os.path.join(self.directory, LEXICAL_FILE))
+            os.replace(sidecar_tmp, os.path.join(self.directory, SIDECAR_FILE))
+            self._vectors = None  # Reopen the new files on next use
+
+    def lexical_index(self) -> LexicalIndex:
+        """The saved name/BM25 index (rebuilt in memory if the file is missing or stale)"""
+        self._load()
+        if self._lexical is None:
+            with self._lock:
+                if self._lexical is None:
+                    try:
+                        self._lexical = LexicalIndex.load(os.path.join(self.directory, LEXICAL_FILE),
+                                                          self._ids, self._documents, self._metadatas)
+                    except (OSError, ValueError, KeyError):
+                        self._lexical = LexicalIndex(self._ids, self._documents, self._metadatas)
+        return self._lexical
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("documents", "metadatas"), **_) -> Dict[str, Any]:
+        """Documents by id and/or metadata filter, shaped like Chroma's get()"""
+        self._load()
+        rows = np.arange(len(self._ids)) if where is None else np.flatnonzero(self._mask(where))
+        if ids is not None:
+            wanted = set(ids)
+            rows = [row for row in rows if self._ids[row] in wanted]
+        return self._rows(list(rows), include)
+
+    def query(self, query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+              query_texts: Optional[List[str]] = None, n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances"), **_) -> Dict[str, Any]:
+        """
+        Top-k by cosine similarity, shaped like Chroma's query()
+
+        Distances are cosine distances (1 - similarity).
+        """
+        self._load()
+        if query_embeddings is None:
+            embedder = self._embedder()
+            if self._model and embedder.model_name != self._model:
+                print(f"Warning: {self.name} was embedded with {self._model}, querying with {embedder.model_name}")
+            query_embeddings = embedder.embed(list(query_texts or []), dtype="float32")
+        queries = _normalise(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self._vectors.shape[1]))
+
+        rows = None if where is None else np.flatnonzero(self._mask(where))
+        if rows is not None and len(rows) * 8 < len(self._ids):
+            matrix = self._vectors[rows]  # Selective filter: scan only the matching rows
+        else:
+            matrix = self._vectors  # Cheaper to score everything and pick the matches
+        if matrix.dtype != np.float32:
+            matrix = matrix.astype(np.float32)
+        subset = rows is not None and len(matrix) == len(rows)
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        candidates = len(self._ids) if rows is None else len(rows)
+        k = min(n_results, candidates)
+        for query in queries:
+            scores = matrix @ query if k > 0 else np.zeros(0, dtype=np.float32)
+            if rows is not None and not subset:
+                scores = scores[rows]
+            if k <= 0:
+                top = np.zeros(0, dtype=np.int64)
+            else:
+                top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+                top = top[np.argsort(-scores[top])]
+            found = self._rows([int(rows[i]) if rows is not None else int(i) for i in top], include)
+            for key in ("ids", "documents", "metadatas"):
+                result[key].append(found.get(key, []))
+            result["distances"].append([float(1.0 - scores[i]) for i in top])
+        return result
+
+    def _rows(self, rows: List[int], include: Sequence[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {"ids": [self._ids[row] for row in rows]}
+        if "documents" in include:
+            found["documents"] = [self._documents[row] for row in rows]
+        if "metadatas" in include:
+            found["metadatas"] = [self._metadatas[row] for row in rows]
+        if "embeddings" in include:
+            found["embeddings"] = np.asarray(self._vectors[rows], dtype=np.float32)
+        return found
+
+    def _embedder(self):
+        if self.embedder_factory is None:
+            raise ValueError(f"Collection {self.name} needs embeddings: no embedder configured")
+        return self.embedder_factory()
+
+    def _mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Boolean row mask for a Chroma-style where clause (cached)"""
+        key = json.dumps(where, sort_keys=True, default=str)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._masks[key] = self._evaluate(where)
+        return mask
+
+    def _evaluate(self, where: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(len(self._ids), dtype=bool)
+        for field, condition in where.items():
+            if field == "$and":
+                for clause in condition:
+                    mask &= self._evaluate(clause)
+            elif field == "$or":
+                alternatives = np.zeros(len(self._ids), dtype=bool)
+                for clause in condition:
+                    alternatives |= self._evaluate(clause)
+                mask &= alternatives
+            else:
+                mask &= self._match(field, condition)
+        return mask
+
+    def _match(self, field: str, condition: Any) -> np.ndarray:
+        column = self._columns.get(field)
+        if column is None:
+            column = np.empty(len(self._metadatas), dtype=object)
+            column[:] = [(metadata or {}).get(field) for metadata in self._metadatas]
+            self._columns[field] = column
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(len(column), dtype=bool)
+        for operator, value in condition.items():
+            if operator == "$eq":
+                mask &= column == value
+            elif operator == "$ne":
+                mask &= column != value
+            elif operator == "$in":
+                mask &= np.isin(column, list(value))
+            elif operator == "$nin":
+                mask &= ~np.isin(column, list(value))
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                present = np.array([isinstance(v, (int, float)) for v in column], dtype=bool)
+                numbers = np.where(present, column, 0).astype(float)
+                compare = {"$gt": np.greater, "$gte": np.greater_equal,
+                           "$lt": np.less, "$lte": np.less_equal}[operator]
+                mask &= present & compare(numbers, value)
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+        return mask
+
+
+class MmapClient:
+    """Directory of MmapCollections, with the client methods VectorDB uses."""
+
+    def __init__(self, directory: str = "data/vector_index", embedder_factory: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            directory: Root directory; one subdirectory per collection
+            embedder_factory: Returns the Embedder for texts without embeddings
+        """
+        self.directory = directory
+        self.embedder_factory = embedder_factory
+        self._collections: Dict[str, MmapCollection] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def has_collection(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self._path(name), SIDECAR_FILE))
+
+    def list_collections(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if self.has_collection(name))
+
+    def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None, dtype: str = "float32"):
+        if self.has_collection(name):
+            raise ValueError(f"Collection {name} already exists")
+        with self._lock:
+            collection = self._collections[name] = MmapCollection(self._path(name), name, self.embedder_factory, dtype)
+        return collection
+
+    def get_collection(self, name: str) -> MmapCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                if not self.has_collection(name):
+                    raise ValueError(f"Collection {name} does not exist")
+                collection = self._collections[name] = MmapCollection(self._path(name), name, self.embedder_factory)
+            return collection
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+        shutil.rmtree(self._path(name), ignore_errors=True)
+
+
+def export_collection(source, target: MmapClient, name: str, model: Optional[str] = None,
+                      dtype: str = "float32") -> int:
+    """
+    Copy a Chroma collection, embeddings included, into an mmap index
+
+    Args:
+        source: Chroma collection
+        target: Index to write to (an existing collection of that name is replaced)
+        name: Collection name in the index
+        model: Embedding model the source was built with
+        dtype: Storage dtype, "float32" or "float16"
+
+    Returns:
+        Number of documents exported
+    """
+    data = source.get(include=["embeddings", "documents", "metadatas"])
+    embeddings = data.get("embeddings")
+    if embeddings is None or len(embeddings) == 0:
+        return 0
+    target.delete_collection(name)
+    collection = target.create_collection(name, dtype=dtype)
+    collection.add(documents=data["documents"], metadatas=data["metadatas"], ids=data["ids"],
+                   embeddings=embeddings, model=model)
+    return len(data["ids"])
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
@@ -1,40 +1,179 @@
 """
 Document retrieval component for RAG implementation.
+
+Search is hybrid: a table or command the user names outright is returned
+straight from the lexical name index, topped up with BM25 hits and, only
+if those fall short of n_results, with vector hits; otherwise the vector
+ranking is fused with a BM25 ranking of the words in the request (see
+rag.lexical_index).
+
+Searches are planned around what the prompt will use. A platform
+preference is pushed down as a `where` filter (so documents for other
+platforms are never scored), the same page ingested for several platforms
+is collapsed to the preferred one, and candidates are over-fetched only
+as far as deduplication requires to return exactly n_results documents.
 """
-from typing import List, Dict, Any, Optional
+import math
+import threading
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from .embedder import Embedder
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
 from .vectordb import VectorDB
 
 class Retriever:
-    """Retriever for finding relevant documents using vector search."""
-    
-    def __init__(self, vectordb: VectorDB):
+    """Retriever for finding relevant documents using vector and lexical search."""
+
+    def __init__(self, vectordb: VectorDB, embedder: Optional[Embedder] = None, hybrid: bool = True):
         """
         Initialize the retriever.
-        
+
         Args:
             vectordb: VectorDB instance for document storage and retrieval
+            embedder: Embeds queries (None: Chroma's own embedding function)
+            hybrid: Use the exact-name index and BM25 alongside vector search
         """
         self.vectordb = vectordb
-    
-    def search(self, query: str, collection: str, n_results: int = 5) -> List[Dict[str, Any]]:
+        self.embedder = embedder
+        self.hybrid = hybrid
+        self._lexical: Dict[str, Tuple[int, Optional[LexicalIndex]]] = {}  # name -> (generation, index)
+        self._lock = threading.Lock()
+
+    def embed(self, query: str) -> Optional[Sequence[float]]:
+        """
+        Query embedding from the (cached) embedder
+
+        Returns:
+            The embedding, or None if no embedder is usable (Chroma embeds the text)
+        """
+        if self.embedder is None:
+            return None
+        try:
+            return self.embedder.embed_query(query)
+        except Exception as e:
+            print(f"Warning: Embedder unavailable, using the vector store's own: {e}")
+            self.embedder = None
+            return None
+
+    def embedding_from(self, turn, query: str) -> Optional[Sequence[float]]:
+        """
+        A turn's input embedding, if it is query's and from this retriever's model
+
+        Args:
+            turn: core.turn_context.TurnContext of the current turn (or None)
+            query: Text about to be searched
+        """
+        if turn is None or self.embedder is None or turn.user_input != query:
+            return None
+        return turn.embedding_for(self.embedder.model_name)
+
+    def lexical_index(self, collection: str) -> Optional[LexicalIndex]:
+        """
+        The collection's name/BM25 index (None if unavailable)
+
+        Loaded from the mmap index, where ingestion saves it, or built from a
+        Chroma collection; reloaded once the collection has been re-ingested,
+        re-exported or deleted, so its ids always match the vector side.
+        """
+        generation = self.vectordb.generation(collection)
+        cached = self._lexical.get(collection)
+        if cached is None or cached[0] != generation:
+            with self._lock:
+                cached = self._lexical.get(collection)
+                if cached is None or cached[0] != generation:
+                    try:
+                        handle = self.vectordb.get_collection(collection)
+                        if hasattr(handle, "lexical_index"):
+                            index = handle.lexical_index()
+                        else:
+                            index = LexicalIndex.from_collection(handle)
+                    except Exception as e:
+                        print(f"Warning: Keyword search unavailable for {collection}: {e}")
+                        index = None
+                    cached = self._lexical[collection] = (generation, index)
+        return cached[1]
+
+    def search(self, query: str, collection: str, n_results: int = 5,
+               query_embedding: Optional[Sequence[float]] = None, turn=None,
+               platforms: Optional[Sequence[str]] = None, dedupe_by: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Search for relevant documents.
-        
+
         Args:
             query: Query text
             collection: Collection name to search in
             n_results: Number of results to return
-            
+            query_embedding: Precomputed embedding of query (computed here when needed)
+            turn: TurnContext whose input embedding is used if a vector search is needed
+            platforms: Only documents whose "platform" metadata is one of these,
+                most preferred first
+            dedupe_by: Metadata key naming the same document across platforms
+                (e.g. "command"); only the most preferred platform's copy is kept
+
         Returns:
-            List of relevant documents with metadata
+            n_results documents with metadata (fewer only if the collection, after
+            filtering and deduplication, has fewer), best first; exact-name hits
+            carry "match": "exact" and no distance
         """
+        where = None
+        if platforms:
+            where = {"platform": platforms[0]} if len(platforms) == 1 else {"platform": {"$in": list(platforms)}}
+        lexical = self.lexical_index(collection) if self.hybrid else None
+        allowed = lexical.allowed("platform", platforms) if lexical is not None and platforms else None
+
+        named: List[Dict[str, Any]] = []
+        if lexical is not None:
+            exact = lexical.exact_matches(query, allowed)
+            if exact:
+                ranked = [lexical.document(row, match="exact") for row in exact]
+                ranked += [lexical.document(row, match="keyword")
+                           for row, _ in lexical.bm25(query, 2 * n_results + len(exact), allowed)
+                           if row not in exact]
+                named = _dedupe(ranked, dedupe_by, platforms)[:n_results]
+                if len(named) == n_results:
+                    return named  # Named outright: no embedding, no vector search
+
+        # Each page exists at most once per platform, so that bounds the over-fetch
+        copies = len(platforms) if dedupe_by and platforms else 1
+        wanted = n_results - len(named)
+        fetch = n_results if copies == 1 else n_results + math.ceil(n_results / 2)
+        while True:
+            candidates = 2 * fetch if lexical is not None else fetch
+            if query_embedding is None:
+                query_embedding = self.embedding_from(turn, query)
+                if query_embedding is None:
+                    query_embedding = self.embed(query)
+            documents = self._vector_search(query, collection, candidates, query_embedding, where)
+            exhausted = len(documents) < candidates  # Nothing more matches the filter
+            if lexical is not None and not named:
+                documents = self._fuse(query, documents, lexical, candidates, allowed)
+            unique = _without(_dedupe(documents, dedupe_by, platforms), named, dedupe_by)
+            if len(unique) >= wanted or exhausted or fetch >= n_results * copies:
+                return named + unique[:wanted]
+            fetch = min(2 * fetch, n_results * copies)
+
+    def _fuse(self, query: str, documents: List[Dict[str, Any]], lexical: LexicalIndex, candidates: int,
+              allowed) -> List[Dict[str, Any]]:
+        """Vector ranking fused with the BM25 ranking by reciprocal rank fusion"""
+        keyword = lexical.bm25(query, candidates, allowed)
+        if not keyword:
+            return documents
+        by_id = {document['id']: document for document in documents}
+        rows = {lexical.ids[row]: row for row, _ in keyword}
+        fused = reciprocal_rank_fusion([[document['id'] for document in documents], list(rows)])
+        return [by_id.get(doc_id) or lexical.document(rows[doc_id], match="keyword") for doc_id, _ in fused]
+
+    def _vector_search(self, query: str, collection: str, n_results: int,
+                       query_embedding: Optional[Sequence[float]],
+                       where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         try:
             results = self.vectordb.search(
                 collection_name=collection,
                 query=query,
-                n_results=n_results
+                n_results=n_results,
+                query_embedding=query_embedding,
+                where=where
             )
-            
+
             # Format results
             documents = []
             for i in range(len(results['ids'][0])):
@@ -44,8 +183,48 @@ class Retriever:
                     'metadata': results['metadatas'][0][i],
                     'distance': results['distances'][0][i]
                 })
-            
+
             return documents
         except Exception as e:
             print(f"Search error: {e}")
-            return []
\ No newline at end of file
+            return []
+
+
+def _without(documents: List[Dict[str, Any]], returned: List[Dict[str, Any]],
+             key: Optional[str]) -> List[Dict[str, Any]]:
+    """documents minus those already returned (by id, and by metadata[key] when deduplicating)"""
+    if not returned:
+        return documents
+    ids = {document['id'] for document in returned}
+    values = {(document.get('metadata') or {}).get(key) for document in returned} - {None} if key else set()
+    return [document for document in documents
+            if document['id'] not in ids and (document.get('metadata') or {}).get(key) not in values]
+
+
+def _dedupe(documents: List[Dict[str, Any]], key: Optional[str],
+            platforms: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+    """
+    Collapse documents sharing metadata[key] into one
+
+    The group keeps the position of its best-ranked member and the copy
+    from the most preferred platform.
+    """
+    if not key:
+        return documents
+    preference = {platform: rank for rank, platform in enumerate(platforms or ())}
+
+    def rank(document):
+        return preference.get((document.get('metadata') or {}).get('platform'), len(preference))
+
+    result: List[Dict[str, Any]] = []
+    positions: Dict[Any, int] = {}
+    for document in documents:
+        value = (document.get('metadata') or {}).get(key)
+        if value is None:
+            result.append(document)
+        elif value not in positions:
+            positions[value] = len(result)
+            result.append(document)
+        elif rank(document) < rank(result[positions[value]]):
+            result[positions[value]] = document
+    return result
@@ -1,92 +1,238 @@
 """
 ChromaDB wrapper for vector storage and retrieval.
+
+The Chroma client is opened lazily on first use (importing chromadb and
+opening the SQLite store is the expensive part of startup), and collection
+handles are cached so a search doesn't look its collection up again. Use
+get_vectordb() to share one instance per database directory across the
+process; opening the same persist directory with two PersistentClients
+doubles memory for no benefit.
+
+Small collections can also be exported into an in-process, memory-mapped
+index (rag.mmap_index) with export_to_index(); from then on they are served
+from it, and Chroma isn't opened at all unless another collection needs it.
 """
-import chromadb
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from .embedder import dequantize, get_embedder
+from .mmap_index import MmapClient, export_collection
+
 
 class VectorDB:
     """Wrapper for ChromaDB vector database operations."""
-    
-    def __init__(self, persist_directory: str = "data/chroma_db"):
+
+    def __init__(self, persist_directory: str = "data/chroma_db", index_directory: Optional[str] = "data/vector_index"):
         """
-        Initialize the vector database.
-        
+        Initialize the vector database (the client is opened on first use).
+
         Args:
             persist_directory: Path to store the persistent database
+            index_directory: Memory-mapped index consulted first (None: Chroma only)
         """
-        # Create persist directory if it doesn't exist
-        os.makedirs(persist_directory, exist_ok=True)
-        
-        # Initialize Chroma client with persistence
-        self.client = chromadb.PersistentClient(
-            path=persist_directory
-        )
-        
-    def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        self.persist_directory = persist_directory
+        self.index = MmapClient(index_directory, embedder_factory=get_embedder) if index_directory else None
+        self._client = None
+        self._collections: Dict[str, Any] = {}
+        self._generations: Dict[str, int] = {}  # Bumped whenever a collection's contents may change
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The Chroma client, opened on first access"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+
+                    # Create persist directory if it doesn't exist
+                    os.makedirs(self.persist_directory, exist_ok=True)
+                    self._client = chromadb.PersistentClient(
+                        path=self.persist_directory
+                    )
+        return self._client
+
+    def create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None, backend: str = "chroma"):
         """
         Create a new collection in the database.
-        
+
         Args:
             name: Name of the collection
             metadata: Optional metadata for the collection
+            backend: "chroma", or "mmap" for the in-process index
         """
-        return self.client.create_collection(name=name, metadata=metadata)
-    
-    def get_collection(self, name: str):
+        if backend == "mmap":
+            if self.index is None:
+                raise ValueError("No index directory configured")
+            collection = self.index.create_collection(name=name, metadata=metadata)
+        else:
+            collection = self.client.create_collection(name=name, metadata=metadata)
+            if self.index is not None and self.index.has_collection(name):
+                return collection  # Searches keep using the index copy
+        with self._lock:
+            self._collections[name] = collection
+        return collection
+
+    def get_collection(self, name: str, backend: Optional[str] = None):
         """
-        Get an existing collection.
-        
+        Get an existing collection (cached after the first lookup), from the
+        mmap index when it has one of that name.
+
         Args:
             name: Name of the collection
-            
+            backend: "chroma" to bypass the index (ingestion writes to Chroma,
+                then exports); None: the index copy if there is one
+
         Returns:
             Collection object
         """
-        return self.client.get_collection(name=name)
-    
-    def add_documents(self, collection_name: str, documents: List[str], 
-                     metadatas: Optional[List[Dict[str, Any]]] = None, 
-                     ids: Optional[List[str]] = None):
+        if backend == "chroma":
+            return self.client.get_collection(name=name)
+        collection = self._collections.get(name)
+        if collection is None:
+            in_index = self.index is not None and self.index.has_collection(name)
+            client = self.index if in_index else self.client
+            with self._lock:  # Concurrent first searches share one lookup
+                collection = self._collections.get(name)
+                if collection is None:
+                    collection = self._collections[name] = client.get_collection(name=name)
+        return collection
+
+    def generation(self, name: str) -> int:
+        """Changes whenever the collection is written, replaced or deleted (for derived caches)"""
+        return self._generations.get(name, 0)
+
+    def _forget_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def add_documents(self, collection_name: str, documents: List[str],
+                     metadatas: Optional[List[Dict[str, Any]]] = None,
+                     ids: Optional[List[str]] = None,
+                     embeddings: Optional[Sequence[Sequence[float]]] = None,
+                     backend: Optional[str] = None):
         """
         Add documents to a collection.
-        
+
         Args:
             collection_name: Name of the collection
             documents: List of document texts
             metadatas: Optional list of metadata dictionaries
             ids: Optional list of document IDs
+            embeddings: Precomputed document embeddings (None: Chroma embeds the texts)
+            backend: As for get_collection; ingestion passes "chroma" so a later
+                export_to_index doesn't overwrite what it added
         """
-        collection = self.get_collection(collection_name)
+        collection = self.get_collection(collection_name, backend=backend)
         collection.add(
             documents=documents,
             metadatas=metadatas,
-            ids=ids or [f"doc_{i}" for i in range(len(documents))]
+            ids=ids or [f"doc_{i}" for i in range(len(documents))],
+            embeddings=_as_lists(embeddings)
         )
-    
-    def search(self, collection_name: str, query: str, n_results: int = 5):
+        with self._lock:
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+
+    def search(self, collection_name: str, query: str, n_results: int = 5,
+               query_embedding: Optional[Sequence[float]] = None, where: Optional[Dict[str, Any]] = None):
         """
         Search for relevant documents.
-        
+
         Args:
             collection_name: Name of the collection to search
             query: Query text
             n_results: Number of results to return
-            
+            query_embedding: Precomputed embedding of the query (None: Chroma embeds the text)
+            where: Metadata filter applied before ranking, e.g. {"platform": {"$in": [...]}}
+
         Returns:
             Search results
         """
+        if query_embedding is not None:
+            arguments = {"query_embeddings": _as_lists([query_embedding])}
+        else:
+            arguments = {"query_texts": [query]}
+        if where:
+            arguments["where"] = where
         collection = self.get_collection(collection_name)
-        return collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
-    
+        try:
+            return collection.query(n_results=n_results, **arguments)
+        except Exception:
+            # The cached handle may be stale (collection re-created by an ingestion run)
+            self._forget_collection(collection_name)
+            return self.get_collection(collection_name).query(n_results=n_results, **arguments)
+
     def delete_collection(self, name: str):
         """
         Delete a collection.
-        
+
         Args:
             name: Name of the collection to delete
         """
-        self.client.delete_collection(name=name)
\ No newline at end of file
+        self._forget_collection(name)
+        if self.index is not None and self.index.has_collection(name):
+            self.index.delete_collection(name)
+            try:
+                self.client.delete_collection(name=name)
+            except Exception:
+                pass  # Only existed in the index
+        else:
+            self.client.delete_collection(name=name)
+
+    def export_to_index(self, name: str, dtype: str = "float32") -> int:
+        """
+        Copy a Chroma collection into the mmap index, which serves it from then on
+
+        Args:
+            name: Collection name
+            dtype: Storage dtype, "float32" or "float16" (half the size)
+
+        Returns:
+            Number of documents exported
+        """
+        if self.index is None:
+            raise ValueError("No index directory configured")
+        # Chroma's default embedding function and our Embedder use the same model
+        count = export_collection(self.client.get_collection(name=name), self.index, name,
+                                  model=get_embedder().model_name, dtype=dtype)
+        self._forget_collection(name)
+        return count
+
+
+def _as_lists(vectors) -> Optional[List[List[float]]]:
+    """Float lists for Chroma from arrays of any dtype (int8 vectors are dequantized)"""
+    if vectors is None:
+        return None
+    rows = []
+    for vector in vectors:
+        vector = np.asarray(vector)
+        if vector.dtype == np.int8:
+            vector = dequantize(vector)
+        rows.append(vector.astype(np.float32).tolist())
+    return rows
+
+
+_REGISTRY: Dict[str, VectorDB] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_vectordb(persist_directory: str = "data/chroma_db") -> VectorDB:
+    """
+    The process-wide VectorDB for a database directory
+
+    Args:
+        persist_directory: Path of the persistent database
+
+    Returns:
+        Shared VectorDB instance (its client opens on first use)
+    """
+    key = os.path.abspath(persist_directory)
+    with _REGISTRY_LOCK:
+        vectordb = _REGISTRY.get(key)
+        if vectordb is None:
+            vectordb = _REGISTRY[key] = VectorDB(persist_directory)
+        return vectordb
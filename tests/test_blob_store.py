@@ -0,0 +1,43 @@
+import os
+import time
+
+from core.blob_store import BlobStore
+
+ROWS = [{"pid": "1", "name": "init"}, {"pid": "2", "name": "kthreadd"}]
+
+
+def _age(store: BlobStore, digest: str, seconds: float):
+    old = time.time() - seconds
+    os.utime(store._path(digest), (old, old))
+
+
+def test_identical_values_are_stored_once(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest, size = store.put(ROWS)
+    assert store.put([dict(row) for row in ROWS]) == (digest, size)
+    assert store.get(digest) == ROWS
+    assert len(store.entries()) == 1
+    assert store.get("0" * 64) is None
+
+
+def test_collect_keeps_live_and_recent_blobs(tmp_path):
+    store = BlobStore(str(tmp_path))
+    live, _ = store.put(ROWS)
+    recent, _ = store.put("written just now")
+    stale, stale_size = store.put("unreferenced")
+    for digest in (live, stale):
+        _age(store, digest, 7200)
+
+    assert store.collect([live], grace=3600) == (1, stale_size)
+    assert store.exists(live)
+    assert store.exists(recent)  # Unreferenced, but inside the grace period
+    assert not store.exists(stale)
+
+
+def test_put_refreshes_an_existing_blob(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest, _ = store.put(ROWS)
+    _age(store, digest, 7200)
+    store.put(ROWS)  # Recorded again: no longer old enough to collect
+    assert store.collect([], grace=3600) == (0, 0)
+    assert store.exists(digest)
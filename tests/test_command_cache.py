@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from engines.command_cache import CommandCache, CommandPolicy
+
+CWD = "/home/lia"
+
+
+class Runner:
+    """Counts executions and returns a fixed result."""
+
+    def __init__(self, output: str = "out", error: str = ""):
+        self.calls = 0
+        self.output = output
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        return self.output, self.error
+
+
+@pytest.mark.parametrize("command, cacheable", [
+    ("uname -a", True),
+    ("df -h", True),
+    ("ip addr show", True),
+    ("ls -la | grep conf", True),
+    ("ip link set eth0 down", False),
+    ("hostname newname", False),
+    ("sort -o out.txt data", False),
+    ("ls > listing.txt", False),
+    ("ps aux", False),
+])
+def test_policy_classification(command, cacheable):
+    assert (CommandPolicy().ttl_for(command) is not None) == cacheable
+
+
+def test_results_are_reused_until_they_expire():
+    cache = CommandCache(CommandPolicy({"uname": {"ttl": 0.2}}))
+    runner = Runner("Linux")
+    assert cache.run("uname -a", CWD, runner) == ("Linux", "")
+    assert cache.run("uname -a", CWD, runner) == ("Linux", "")
+    assert runner.calls == 1
+    time.sleep(0.25)
+    cache.run("uname -a", CWD, runner)
+    assert runner.calls == 2
+
+
+def test_errors_and_other_directories_are_not_shared():
+    cache = CommandCache()
+    failing = Runner(error="ls: cannot access")
+    cache.run("ls", CWD, failing)
+    cache.run("ls", CWD, failing)
+    assert failing.calls == 2
+    runner = Runner()
+    cache.run("ls", CWD, runner)
+    cache.run("ls", "/tmp", runner)
+    assert runner.calls == 2
+
+
+def test_concurrent_identical_commands_run_once():
+    cache = CommandCache()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "Linux", ""
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.run("uname -a", CWD, slow))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [("Linux", "")] * 4
+    assert len(calls) == 1
+    assert cache.get_stats()["collapsed"] == 3
+
+
+def test_size_budget_evicts_least_recently_used():
+    cache = CommandCache(max_total_chars=100, max_result_chars=60)
+    cache.run("ls a", CWD, Runner("a" * 50))
+    cache.run("ls b", CWD, Runner("b" * 40))
+    cache.run("ls a", CWD, Runner())  # Hit: a is now the most recently used
+    cache.run("ls c", CWD, Runner("c" * 30))
+    assert [key[0] for key in cache._entries] == ["ls a", "ls c"]
+    cache.run("cat big.log", CWD, Runner("x" * 61))
+    stats = cache.get_stats()
+    assert stats["too_large"] == 1
+    assert stats["chars"] == 80
+
+
+def test_writes_invalidate_only_what_they_touch():
+    cache = CommandCache()
+    cache.run("ls", CWD, Runner())
+    cache.run("ls /etc", CWD, Runner())
+    cache.run("uname -a", CWD, Runner())
+    cache.run("ps aux", CWD, Runner())  # Read-only: drops nothing
+    assert len(cache._entries) == 3
+    cache.run("touch notes.txt", CWD, Runner())
+    assert [key[0] for key in cache._entries] == ["ls /etc", "uname -a"]
+    cache.run("echo x > /etc/motd", CWD, Runner())
+    assert [key[0] for key in cache._entries] == ["uname -a"]
+    cache.run("systemctl restart networking", CWD, Runner())  # Effects unknown: drops everything
+    assert len(cache._entries) == 0
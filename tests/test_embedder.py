@@ -0,0 +1,64 @@
+import hashlib
+
+import numpy as np
+
+from rag.embedder import Embedder, dequantize
+
+
+class HashModel:
+    """Deterministic stand-in for a sentence-transformers model (no weights to download)."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy, show_progress_bar):
+        self.calls.append(list(texts))
+        vectors = np.array([np.frombuffer(hashlib.sha256(text.encode()).digest(), dtype=np.uint8)[:8]
+                            for text in texts], dtype=np.float32) - 127.5
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _embedder(cache_path=None) -> Embedder:
+    embedder = Embedder("test-model", cache_path=cache_path)
+    embedder._model = HashModel()
+    return embedder
+
+
+def test_only_misses_are_encoded():
+    embedder = _embedder()
+    first = embedder.embed(["ls", "df -h", "ls"])
+    assert embedder._model.calls == [["ls", "df -h"]]
+    np.testing.assert_array_equal(first[0], first[2])
+    embedder.embed(["df -h", "uname -a"])
+    assert embedder._model.calls[-1] == ["uname -a"]
+    assert embedder.get_stats()["memory_hits"] == 1
+
+
+def test_disk_cache_round_trip(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    original = _embedder(path).embed(["list processes", "disk usage"])
+
+    reopened = _embedder(path)
+    cached = reopened.embed(["list processes", "disk usage"])
+    assert reopened._model.calls == []
+    assert reopened.get_stats()["disk_hits"] == 2
+    np.testing.assert_allclose(cached, original, atol=1e-3)  # Stored as float16
+
+
+def test_disk_cache_is_per_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    _embedder(path).embed(["list processes"])
+    other = Embedder("other-model", cache_path=path)
+    other._model = HashModel()
+    other.embed(["list processes"])
+    assert other._model.calls == [["list processes"]]
+
+
+def test_quantised_outputs_keep_the_ranking():
+    embedder = _embedder()
+    texts = ["a", "b", "c", "d"]
+    full = embedder.embed(texts, dtype="float32")
+    scores = full @ full[0]
+    for dtype in ("float16", "int8"):
+        quantised = dequantize(embedder.embed(texts, dtype=dtype))
+        assert list(np.argsort(quantised @ quantised[0])) == list(np.argsort(scores))
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+from engines.hash_cache import HashCache, QueryInterrupted
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HashCache(str(tmp_path / "hashes.sqlite3"), max_workers=2)
+
+
+def test_unchanged_files_are_hits(cache, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    first = cache.get_hashes([str(path)])
+    second = cache.get_hashes([str(path)])
+    assert first == second
+    assert first[0]["sha256"] == _sha256(b"hello")
+    assert first[0]["directory"] == str(tmp_path)
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+
+def test_same_length_edit_with_restored_mtime_is_rehashed(cache, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"aaaa")
+    cache.get_hashes([str(path)])
+    mtime = os.stat(path).st_mtime_ns
+    path.write_bytes(b"bbbb")
+    os.utime(path, ns=(mtime, mtime))  # `touch -d`: size and mtime as before, ctime moves on
+    assert cache.get_hashes([str(path)])[0]["sha256"] == _sha256(b"bbbb")
+    assert cache.stats["misses"] == 2
+
+
+def test_hashes_persist_across_instances(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    HashCache(str(tmp_path / "hashes.sqlite3")).get_hashes([str(path)])
+    reopened = HashCache(str(tmp_path / "hashes.sqlite3"))
+    reopened.get_hashes([str(path)])
+    assert reopened.stats == {"hits": 1, "misses": 0}
+
+
+def test_directory_query_is_answered_from_the_cache(cache, tmp_path):
+    directory = tmp_path / "files"
+    (directory / "sub").mkdir(parents=True)
+    for name in ("a.txt", "b.txt"):
+        (directory / name).write_bytes(name.encode())
+    rows = cache.answer_query(f"SELECT path, sha256 AS digest FROM hash WHERE directory = '{directory}'")
+    assert sorted(row["path"] for row in rows) == [str(directory / "a.txt"), str(directory / "b.txt")]
+    assert {row["digest"] for row in rows} == {_sha256(b"a.txt"), _sha256(b"b.txt")}
+    assert cache.answer_query("SELECT * FROM processes") is None
+
+
+def test_cancelled_sweep_raises(cache, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(QueryInterrupted):
+        cache.get_hashes([str(path)], cancel_event=cancel)
@@ -0,0 +1,75 @@
+import threading
+
+from engines.job_queue import JobQueue, JobStatus
+
+
+def _wait_for_cancel(job):
+    job.cancel_event.wait(5)
+    return None, "Command cancelled"
+
+
+def test_finished_job_keeps_its_result_and_output():
+    queue = JobQueue(max_workers=1)
+
+    def runner(job):
+        job.append_output("line 1\nline 2\n")
+        return "done", ""
+
+    job = queue.submit("command", "echo", runner, timeout=5)
+    job._future.result(timeout=5)
+    assert job.status == JobStatus.DONE
+    assert job.result == "done"
+    assert job.output_tail(1) == "line 2"
+    assert queue.get(job.id) is job
+    queue.shutdown(wait=True)
+
+
+def test_cancel_stops_running_and_queued_jobs():
+    queue = JobQueue(max_workers=1)
+    started = threading.Event()
+
+    def blocking(job):
+        started.set()
+        return _wait_for_cancel(job)
+
+    running = queue.submit("command", "sleep", blocking, timeout=5)
+    queued = queue.submit("command", "sleep", blocking, timeout=5)
+    assert started.wait(5)
+    assert queued.status == JobStatus.QUEUED
+
+    assert queue.cancel(queued.id)
+    assert queued.status == JobStatus.CANCELLED  # Taken off the queue, never ran
+    assert queue.cancel(running.id)
+    running._future.result(timeout=5)
+    assert running.status == JobStatus.CANCELLED
+    assert not queue.cancel(running.id)  # Already finished
+    queue.shutdown(wait=True)
+
+
+def test_failing_runner_marks_the_job_failed():
+    queue = JobQueue(max_workers=1)
+    job = queue.submit("osquery", "SELECT 1", lambda job: ([], "Query timed out"), timeout=5)
+    job._future.result(timeout=5)
+    assert job.status == JobStatus.TIMED_OUT
+    job = queue.submit("osquery", "SELECT 1", lambda job: 1 / 0, timeout=5)
+    job._future.result(timeout=5)
+    assert job.status == JobStatus.FAILED
+    assert job.error.startswith("Job error:")
+    queue.shutdown(wait=True)
+
+
+def test_shutdown_cancels_everything_without_waiting():
+    queue = JobQueue(max_workers=1)
+    started = threading.Event()
+
+    def blocking(job):
+        started.set()
+        return _wait_for_cancel(job)
+
+    running = queue.submit("command", "sleep", blocking, timeout=60)
+    queued = [queue.submit("command", "sleep", blocking, timeout=60) for _ in range(3)]
+    assert started.wait(5)
+    queue.shutdown(cancel=True)
+    running._future.result(timeout=5)
+    assert running.status == JobStatus.CANCELLED
+    assert all(job.status == JobStatus.CANCELLED for job in queued)
@@ -0,0 +1,26 @@
+from rag.lexical_index import LexicalIndex
+
+IDS = ["users", "logged_in_users", "processes"]
+DOCUMENTS = [
+    "Table: users\nLocal user accounts\n  - uid (BIGINT)",
+    "Table: logged_in_users\nUsers with an active shell\n  - user (TEXT)",
+    "Table: processes\nAll running processes\n  - pid (BIGINT)",
+]
+METADATAS = [{"table": name} for name in IDS]
+
+
+def test_everyday_words_are_not_exact_names():
+    index = LexicalIndex(IDS, DOCUMENTS, METADATAS)
+    assert index.exact_matches("what users are logged in") == []
+    assert index.exact_matches("list `users`") == [0]
+    assert index.exact_matches("rows of logged_in_users") == [1]
+
+
+def test_saved_index_matches_a_rebuilt_one(tmp_path):
+    index = LexicalIndex(IDS, DOCUMENTS, METADATAS)
+    path = tmp_path / "lexical.npz"
+    with open(path, "wb") as f:
+        index.save(f)
+    loaded = LexicalIndex.load(str(path), IDS, DOCUMENTS, METADATAS)
+    assert dict(loaded.names) == dict(index.names)
+    assert loaded.bm25("active user shell", 3) == index.bm25("active user shell", 3)
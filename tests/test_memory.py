@@ -0,0 +1,74 @@
+import json
+import time
+
+from core.memory import MemoryManager, RetentionPolicy
+
+LEGACY = {
+    "conversations": [{"user": "hi", "lia": "hello"}, {"user": "uptime?", "lia": "up 3 days"}],
+    "queries": [{"query": "SELECT * FROM users", "result": "[{'uid': '0'}]"}],
+    "personal_info": {"name": "Sam"},
+    "tasks": [],
+}
+
+
+def _memory(tmp_path, **kwargs) -> MemoryManager:
+    return MemoryManager(str(tmp_path / "lia_memory.json"), db_path=str(tmp_path / "memory.sqlite3"),
+                         blob_dir=str(tmp_path / "blobs"), semantic=False, **kwargs)
+
+
+def test_legacy_json_is_imported_once(tmp_path):
+    (tmp_path / "lia_memory.json").write_text(json.dumps(LEGACY))
+    memory = _memory(tmp_path)
+    conversations = memory.get_recent_conversations()
+    assert [(turn["user"], turn["lia"]) for turn in conversations] == [("hi", "hello"), ("uptime?", "up 3 days")]
+    assert memory.get_personal_info() == {"name": "Sam"}
+    query = memory.get_recent_queries()[0]
+    assert query["query"] == "SELECT * FROM users"
+    assert memory.get_query_result(query["id"]) == "[{'uid': '0'}]"
+    memory.close()
+
+    reopened = _memory(tmp_path)  # Same session and file: not imported again
+    assert len(reopened.get_recent_conversations(count=10)) == 2
+    reopened.close()
+
+
+def test_query_results_round_trip_through_the_blob_store(tmp_path):
+    memory = _memory(tmp_path)
+    rows = [{"pid": "1", "name": "init"}, {"pid": "2", "name": "kthreadd"}]
+    query_id = memory.add_query("SELECT pid, name FROM processes", rows)
+    assert memory.get_query(query_id)["summary"] == "2 row(s); columns: pid, name"
+    assert memory.get_query_result(query_id) == rows
+    memory.close()
+
+
+def test_retention_keeps_the_newest_rows(tmp_path):
+    memory = _memory(tmp_path, retention={"conversations": RetentionPolicy(max_rows=3)}, prune_every=1000)
+    for i in range(5):
+        memory.add_conversation(f"question {i}", f"answer {i}")
+    memory.prune()
+    assert [turn["user"] for turn in memory.get_recent_conversations(count=10)] == [
+        "question 2", "question 3", "question 4"]
+    memory.close()
+
+
+def test_retention_drops_old_rows(tmp_path):
+    memory = _memory(tmp_path, retention={"conversations": RetentionPolicy(max_age_days=1)}, prune_every=1000)
+    old_id = memory.add_conversation("old", "answer")
+    memory.add_conversation("new", "answer")
+    with memory.conn:
+        memory.conn.execute("UPDATE conversations SET created_at = ? WHERE id = ?", (time.time() - 2 * 86400, old_id))
+    memory.prune()
+    assert [turn["user"] for turn in memory.get_recent_conversations()] == ["new"]
+    memory.close()
+
+
+def test_sessions_keep_separate_histories(tmp_path):
+    cli = _memory(tmp_path)
+    tui = MemoryManager(str(tmp_path / "Hound_memory.json"), db_path=str(tmp_path / "memory.sqlite3"),
+                        blob_dir=str(tmp_path / "blobs"), semantic=False)
+    cli.add_conversation("from the cli", "ok")
+    tui.add_conversation("from the tui", "ok")
+    assert [turn["user"] for turn in cli.get_recent_conversations()] == ["from the cli"]
+    assert [turn["user"] for turn in tui.get_recent_conversations()] == ["from the tui"]
+    cli.close()
+    tui.close()
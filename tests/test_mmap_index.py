@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from rag.mmap_index import MmapClient
+
+DIM = 4
+
+
+def _collection(tmp_path, dtype="float32"):
+    """Twenty documents on two platforms; row i points mostly along axis i % DIM."""
+    collection = MmapClient(str(tmp_path)).create_collection("osquery_docs", dtype=dtype)
+    embeddings = np.full((20, DIM), 0.1, dtype=np.float32)
+    embeddings[np.arange(20), np.arange(20) % DIM] = 1.0 + np.arange(20) / 100
+    collection.add(documents=[f"table {i}" for i in range(20)],
+                   metadatas=[{"platform": "linux" if i % 2 else "darwin", "rank": i} for i in range(20)],
+                   ids=[f"t{i}" for i in range(20)], embeddings=embeddings)
+    return collection
+
+
+def _axis(i):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i] = 1.0
+    return [vector]
+
+
+def test_query_ranks_by_cosine_similarity(tmp_path):
+    result = _collection(tmp_path).query(query_embeddings=_axis(1), n_results=5)
+    assert result["ids"][0] == ["t17", "t13", "t9", "t5", "t1"]
+    assert result["distances"][0] == sorted(result["distances"][0])
+
+
+@pytest.mark.parametrize("axis, where, expected", [
+    # Matches half the rows: scores everything, then applies the mask
+    (1, {"platform": "linux"}, ["t17", "t13", "t9"]),
+    # Matches one row: scans only that row
+    (1, {"rank": {"$in": [4]}}, ["t4"]),
+    (0, {"$and": [{"platform": "darwin"}, {"rank": {"$lt": 10}}]}, ["t8", "t4", "t0"]),
+    (1, {"$or": [{"rank": 1}, {"rank": {"$gte": 18}}]}, ["t1", "t18", "t19"]),
+    (1, {"platform": "windows"}, []),
+])
+def test_where_masks_filter_before_top_k(tmp_path, axis, where, expected):
+    result = _collection(tmp_path).query(query_embeddings=_axis(axis), n_results=3, where=where)
+    assert result["ids"][0] == expected
+    assert len(result["metadatas"][0]) == len(expected)
+
+
+def test_get_and_float16_storage_reopen(tmp_path):
+    _collection(tmp_path, dtype="float16")
+    reopened = MmapClient(str(tmp_path)).get_collection("osquery_docs")
+    assert reopened.count() == 20
+    assert reopened.dtype == "float16"
+    assert reopened.get(where={"rank": {"$gt": 17}})["ids"] == ["t18", "t19"]
+    assert reopened.query(query_embeddings=_axis(1), n_results=1)["ids"][0] == ["t17"]
+
+
+def test_add_replaces_documents_by_id(tmp_path):
+    collection = _collection(tmp_path)
+    collection.add(documents=["replaced"], metadatas=[{"platform": "linux", "rank": 99}], ids=["t0"],
+                   embeddings=_axis(3))
+    assert collection.count() == 20
+    assert collection.get(ids=["t0"])["documents"] == ["replaced"]
+    assert collection.query(query_embeddings=_axis(3), n_results=1, where={"rank": 99})["ids"][0] == ["t0"]
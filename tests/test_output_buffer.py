@@ -0,0 +1,38 @@
+from engines.output_buffer import OutputBuffer
+
+
+def test_small_output_is_kept_whole():
+    buffer = OutputBuffer(max_chars=100)
+    buffer.append("one\n")
+    buffer.append("two\n")
+    assert buffer.text() == "one\ntwo\n"
+    assert not buffer.truncated
+    assert (buffer.total_chars, buffer.total_lines) == (8, 2)
+
+
+def test_large_output_keeps_head_and_tail():
+    buffer = OutputBuffer(max_chars=40, head_chars=20)
+    for i in range(100):
+        buffer.append(f"line {i:03d}\n")  # 9 characters per line
+    text = buffer.text()
+    assert buffer.truncated
+    assert buffer.dropped_chars == 900 - 40
+    assert text.startswith("line 000\nline 001\n")
+    assert text.endswith("line 098\nline 099\n")
+    assert "characters of output omitted" in text
+    assert buffer.tail(2) == "line 098\nline 099"
+
+
+def test_one_huge_chunk_is_capped():
+    buffer = OutputBuffer(max_chars=10, head_chars=4)
+    buffer.append("x" * 1000 + "END")
+    assert buffer.dropped_chars == 1003 - 10
+    assert buffer.text().endswith("END")
+
+
+def test_total_bytes_counts_utf8():
+    buffer = OutputBuffer(max_chars=4, head_chars=2)
+    buffer.append("héllo ")
+    buffer.append("日本")
+    assert buffer.total_chars == 8
+    assert buffer.total_bytes == len("héllo 日本".encode("utf-8"))
@@ -0,0 +1,55 @@
+import json
+import shutil
+import signal
+
+import pytest
+
+from engines.resource_limits import ChildSlots, LimitLedger, ResourceLimits, classify_exit, limit_error
+from engines.shell_session import ShellSession
+
+
+@pytest.mark.parametrize("returncode, stderr, kind", [
+    (0, "", None),
+    (None, "", None),
+    (1, "grep: pattern not found", None),
+    (-signal.SIGXCPU, "", "cpu"),
+    (128 + signal.SIGXCPU, "", "cpu"),
+    (1, "python: MemoryError", "memory"),
+    (2, "ls: Too many open files", "open_files"),
+])
+def test_classify_exit(returncode, stderr, kind):
+    assert classify_exit(returncode, stderr) == kind
+
+
+def test_child_slots_wait_then_reject():
+    slots = ChildSlots(limit=1)
+    assert slots.acquire(timeout=0.1)
+    assert not slots.acquire(timeout=0.05)
+    assert (slots.running, slots.waits, slots.rejections) == (1, 1, 1)
+    slots.release()
+    assert slots.acquire(timeout=0.1)
+    slots.release()
+
+
+def test_ledger_counts_and_logs_events(tmp_path):
+    ledger = LimitLedger(str(tmp_path / "events.jsonl"))
+    ledger.record("cpu", "command", "yes > /dev/null", "CPU time limit (60s)", 60.2)
+    ledger.record("cpu", "command", "yes > /dev/null", "CPU time limit (60s)", 60.1)
+    assert ledger.summary()["counts"] == {"command/cpu": 2}
+    lines = (tmp_path / "events.jsonl").read_text().splitlines()
+    assert [json.loads(line)["target"] for line in lines] == ["yes > /dev/null"] * 2
+
+
+@pytest.mark.skipif(shutil.which("sh") is None, reason="needs a POSIX shell")
+def test_session_command_is_stopped_at_the_output_cap(tmp_path):
+    limits = ResourceLimits(cpu_seconds=None, memory_bytes=None, open_files=64, output_bytes=64 * 1024)
+    session = ShellSession(cwd=str(tmp_path), env={"PATH": "/usr/bin:/bin"}, limits=limits)
+    try:
+        output, error, status = session.run("yes", timeout=10)
+        assert status is None
+        assert error == limit_error("output", limits)
+        assert session.last_limit == "output"
+        # Limits apply per command and the session carries on
+        assert session.run("ulimit -n", timeout=10) == ("64", "", 0)
+    finally:
+        session.close()
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from rag.retriever import Retriever
+from rag.vectordb import VectorDB
+
+DIM = 8
+# command -> platforms with a tldr page for it, best vector match first
+COMMANDS = {
+    "tar": ["linux", "osx"],
+    "grep": ["linux", "osx"],
+    "sed": ["linux", "osx"],
+    "awk": ["linux"],
+    "curl": ["osx", "windows"],
+    "robocopy": ["windows"],
+}
+QUERY = np.ones(DIM, dtype=np.float32)
+
+
+class RecordingVectorDB(VectorDB):
+    """Records the vector searches the retriever runs."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.searches = []
+
+    def search(self, collection_name, query, n_results=5, query_embedding=None, where=None):
+        self.searches.append((n_results, where))
+        return super().search(collection_name, query, n_results, query_embedding, where)
+
+
+@pytest.fixture
+def vectordb(tmp_path):
+    vectordb = RecordingVectorDB(str(tmp_path / "chroma"), str(tmp_path / "index"))
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for rank, (command, platforms) in enumerate(COMMANDS.items()):
+        for copy, platform in enumerate(platforms):
+            # Similarity to QUERY falls with the command's rank, then with the copy
+            vector = np.ones(DIM, dtype=np.float32)
+            vector[0] -= 0.4 * rank + 0.1 * copy
+            ids.append(f"{platform}/{command}")
+            documents.append(f"# {command}\nA tool for {platform}.")
+            metadatas.append({"command": command, "platform": platform})
+            embeddings.append(vector)
+    vectordb.create_collection("os_commands", backend="mmap")
+    vectordb.add_documents("os_commands", documents, metadatas, ids, embeddings)
+    return vectordb
+
+
+def test_platform_filter_is_pushed_down(vectordb):
+    retriever = Retriever(vectordb, hybrid=False)
+    found = retriever.search("archive files", "os_commands", n_results=3, query_embedding=QUERY,
+                             platforms=["linux"])
+    assert [document["id"] for document in found] == ["linux/tar", "linux/grep", "linux/sed"]
+    assert vectordb.searches == [(3, {"platform": "linux"})]
+
+
+def test_copies_collapse_to_the_preferred_platform(vectordb):
+    retriever = Retriever(vectordb, hybrid=False)
+    found = retriever.search("archive files", "os_commands", n_results=4, query_embedding=QUERY,
+                             platforms=["osx", "linux"], dedupe_by="command")
+    assert [document["id"] for document in found] == ["osx/tar", "osx/grep", "osx/sed", "linux/awk"]
+    # Three copies short after the first fetch; the second stops at one copy per platform
+    assert vectordb.searches == [(6, {"platform": {"$in": ["osx", "linux"]}}),
+                                 (8, {"platform": {"$in": ["osx", "linux"]}})]
+
+
+def test_search_stops_when_the_filter_runs_out(vectordb):
+    retriever = Retriever(vectordb, hybrid=False)
+    found = retriever.search("archive files", "os_commands", n_results=10, query_embedding=QUERY,
+                             platforms=["linux"], dedupe_by="command")
+    assert [document["id"] for document in found] == ["linux/tar", "linux/grep", "linux/sed", "linux/awk"]
+    assert len(vectordb.searches) == 1
+
+
+def test_named_command_skips_the_vector_search(vectordb):
+    retriever = Retriever(vectordb)
+    found = retriever.search("how do I use `grep`", "os_commands", n_results=1, platforms=["osx"])
+    assert [(document["id"], document["match"]) for document in found] == [("osx/grep", "exact")]
+    assert vectordb.searches == []
@@ -0,0 +1,60 @@
+import shutil
+
+import pytest
+
+from engines.shell_session import ShellSession, scrubbed_environment
+
+pytestmark = pytest.mark.skipif(shutil.which("sh") is None, reason="needs a POSIX shell")
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = ShellSession(cwd=str(tmp_path), env={"PATH": "/usr/bin:/bin"})
+    yield session
+    session.close()
+
+
+def test_state_carries_over_between_commands(session, tmp_path):
+    (tmp_path / "sub").mkdir()
+    assert session.run("cd sub && export GREETING=hi", timeout=10)[2] == 0
+    assert session.run("pwd; echo $GREETING", timeout=10) == (f"{tmp_path / 'sub'}\nhi", "", 0)
+    assert session.cwd == str(tmp_path / "sub")
+
+
+def test_status_and_stderr_are_reported(session):
+    assert session.run("echo out; echo err >&2; false", timeout=10) == ("out", "err", 1)
+
+
+def test_sentinel_lookalikes_and_missing_newlines_are_output(session):
+    output, _, status = session.run("printf '__LIA_DONE_x__ 0 /\\n'; printf 'no newline'", timeout=10)
+    assert output == "__LIA_DONE_x__ 0 /\nno newline"
+    assert status == 0
+
+
+def test_exit_restarts_the_shell_in_the_last_directory(session, tmp_path):
+    (tmp_path / "sub").mkdir()
+    session.run("cd sub", timeout=10)
+    assert session.run("exit 3", timeout=10) == ("", "Shell session exited", None)
+    assert session.run("pwd", timeout=10) == (str(tmp_path / "sub"), "", 0)
+    assert session.restarts == 1
+
+
+def test_timeout_kills_the_command_but_not_the_session(session):
+    output, error, status = session.run("echo started; sleep 30", timeout=0.5)
+    assert (output, error, status) == ("started", "Command timed out", None)
+    assert session.run("echo again", timeout=10) == ("again", "", 0)
+
+
+def test_output_is_streamed_as_it_arrives(session):
+    chunks = []
+    session.run("echo one; echo two", timeout=10, on_output=chunks.append)
+    assert "".join(chunks).split() == ["one", "two"]
+
+
+def test_secrets_are_not_passed_to_the_shell(monkeypatch):
+    monkeypatch.setenv("COHERE_API_KEY", "secret")
+    monkeypatch.setenv("LIA_TEST_VALUE", "visible")
+    env = scrubbed_environment()
+    assert "COHERE_API_KEY" not in env
+    assert env["LIA_TEST_VALUE"] == "visible"
+    assert env["HISTFILE"] == "/dev/null"
@@ -0,0 +1,29 @@
+import pytest
+
+from core.sql_analyzer import SQL_ANALYZER
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM shadow;",
+    "SELECT * FROM main.shadow;",
+    'SELECT * FROM "main"."shadow"',
+    "SELECT * FROM `main`.`shadow`",
+    "SELECT * FROM [main].[shadow]",
+    "SELECT * FROM 'shadow'",
+    "SELECT username FROM users, main.shadow",
+    "SELECT * FROM users u JOIN main.keychain_items k ON u.uid = k.uid",
+])
+def test_sensitive_tables_are_blocked(sql):
+    is_safe, reason = SQL_ANALYZER.check(sql)
+    assert not is_safe
+    assert reason.startswith("Table ")
+
+
+@pytest.mark.parametrize("sql, tables", [
+    ("SELECT * FROM main.processes", ["processes"]),
+    ("SELECT p.name FROM processes p JOIN listening_ports l ON p.pid = l.pid", ["processes", "listening_ports"]),
+    ("WITH recent AS (SELECT * FROM processes) SELECT * FROM recent", ["processes"]),
+])
+def test_tables_are_read_from_tokens(sql, tables):
+    assert SQL_ANALYZER.check(sql) == (True, "Safe")
+    assert SQL_ANALYZER.analyze(sql).tables == tables
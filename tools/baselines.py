@@ -0,0 +1,259 @@
+"""
+Streaming per-host anomaly baselines with bounded-memory sketches.
+
+Each observation (one dashboard run) updates:
+
+- exponentially weighted mean/variance of scalar counts
+  (external connections, cron jobs, listening ports, ...)
+- a HyperLogLog of the run's remote addresses, whose cardinality is
+  baselined like any other count, plus a lifetime HyperLogLog
+- exponentially decayed count-min sketches of process names and ports
+
+Memory per metric is constant regardless of history, and the whole state
+is persisted as one small JSON file per host.
+"""
+import array
+import base64
+import hashlib
+import json
+import math
+import os
+import time
+from typing import List, Dict, Any, Iterable, Optional
+
+
+def _hash64(value: str, salt: bytes = b"") -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8, salt=salt).digest(), "big")
+
+
+class HyperLogLog:
+    """Cardinality estimator with 2**p one-byte registers (~1.6% error at p=12)."""
+
+    def __init__(self, p: int = 12, registers: Optional[bytearray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value: str):
+        x = _hash64(value)
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def count(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            return self.m * math.log(self.m / zeros)  # Linear counting for small sets
+        return estimate
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        return cls(data["p"], bytearray(base64.b64decode(data["registers"])))
+
+
+class CountMinSketch:
+    """Count-min sketch with exponentially decayed counters."""
+
+    def __init__(self, width: int = 1024, depth: int = 4, counters: Optional[array.array] = None,
+                 total: float = 0.0):
+        self.width = width
+        self.depth = depth
+        self.counters = counters if counters is not None else array.array("d", [0.0]) * (width * depth)
+        self.total = total
+
+    def _cells(self, item: str) -> List[int]:
+        return [row * self.width + _hash64(item, salt=bytes([row])) % self.width for row in range(self.depth)]
+
+    def add(self, item: str, count: float = 1.0):
+        for cell in self._cells(item):
+            self.counters[cell] += count
+        self.total += count
+
+    def estimate(self, item: str) -> float:
+        return min(self.counters[cell] for cell in self._cells(item))
+
+    def decay(self, factor: float):
+        """Age every counter so old behaviour fades out of the baseline"""
+        for i in range(len(self.counters)):
+            self.counters[i] *= factor
+        self.total *= factor
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "width": self.width, "depth": self.depth, "total": self.total,
+            "counters": base64.b64encode(self.counters.tobytes()).decode()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CountMinSketch":
+        counters = array.array("d")
+        counters.frombytes(base64.b64decode(data["counters"]))
+        return cls(data["width"], data["depth"], counters, data.get("total", 0.0))
+
+
+class DecayedStat:
+    """Exponentially weighted mean and variance of a scalar metric."""
+
+    def __init__(self, alpha: float = 0.1, mean: float = 0.0, var: float = 0.0, n: int = 0):
+        self.alpha = alpha
+        self.mean = mean
+        self.var = var
+        self.n = n
+
+    def zscore(self, value: float) -> float:
+        """Deviation of value from the baseline in standard deviations"""
+        # Floor the deviation so a perfectly flat history doesn't alert on +1
+        std = max(math.sqrt(self.var), 1.0, 0.1 * abs(self.mean))
+        return (value - self.mean) / std
+
+    def update(self, value: float):
+        if self.n == 0:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += self.alpha * delta
+            self.var = (1 - self.alpha) * (self.var + self.alpha * delta * delta)
+        self.n += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"alpha": self.alpha, "mean": self.mean, "var": self.var, "n": self.n}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DecayedStat":
+        return cls(data["alpha"], data["mean"], data["var"], data["n"])
+
+
+class HostBaseline:
+    """Baselines for one host, persisted between runs."""
+
+    def __init__(self, host: str, directory: str = "data/baselines", warmup: int = 5,
+                 z_threshold: float = 3.0, decay: float = 0.98, rare_threshold: float = 0.5):
+        """
+        Args:
+            host: Host identifier (hostname)
+            directory: Where per-host baseline files are kept
+            warmup: Observations needed before a metric can alert
+            z_threshold: Deviation (in standard deviations) that raises an alert
+            decay: Per-observation decay of the sketches (0.98 ~ 35-run half-life)
+            rare_threshold: Decayed occurrences below which a name/port counts as rare
+        """
+        self.host = host
+        self.path = os.path.join(directory, f"{_safe_name(host)}.json")
+        self.warmup = warmup
+        self.z_threshold = z_threshold
+        self.decay = decay
+        self.rare_threshold = rare_threshold
+        self.stats: Dict[str, DecayedStat] = {}
+        self.process_names = CountMinSketch()
+        self.ports = CountMinSketch()
+        self.remote_addresses_seen = HyperLogLog()
+        self.observations = 0
+        self.updated_at = 0.0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.stats = {name: DecayedStat.from_dict(stat) for name, stat in data.get("stats", {}).items()}
+        self.process_names = CountMinSketch.from_dict(data["process_names"])
+        self.ports = CountMinSketch.from_dict(data["ports"])
+        self.remote_addresses_seen = HyperLogLog.from_dict(data["remote_addresses_seen"])
+        self.observations = data.get("observations", 0)
+        self.updated_at = data.get("updated_at", 0.0)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {
+            "host": self.host,
+            "observations": self.observations,
+            "updated_at": self.updated_at,
+            "stats": {name: stat.to_dict() for name, stat in self.stats.items()},
+            "process_names": self.process_names.to_dict(),
+            "ports": self.ports.to_dict(),
+            "remote_addresses_seen": self.remote_addresses_seen.to_dict(),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def is_warm(self, metric: str) -> bool:
+        stat = self.stats.get(metric)
+        return stat is not None and stat.n >= self.warmup
+
+    def observe(self, counts: Dict[str, float], remote_addresses: Iterable[str] = (),
+                process_names: Iterable[str] = (), ports: Iterable[str] = ()) -> List[str]:
+        """
+        Score one observation against the baseline, then fold it in
+
+        Args:
+            counts: Scalar metrics, e.g. {"external_connections": 12}
+            remote_addresses: Remote addresses seen in this run
+            process_names: Process names seen in this run
+            ports: Listening ports seen in this run
+
+        Returns:
+            Deviation alerts (empty during warm-up)
+        """
+        alerts = []
+
+        run_addresses = HyperLogLog()
+        for address in remote_addresses:
+            run_addresses.add(address)
+            self.remote_addresses_seen.add(address)
+        counts = dict(counts)
+        counts["distinct_remote_addresses"] = round(run_addresses.count())
+
+        for metric, value in counts.items():
+            stat = self.stats.setdefault(metric, DecayedStat())
+            if stat.n >= self.warmup:
+                z = stat.zscore(value)
+                if abs(z) >= self.z_threshold:
+                    direction = "above" if z > 0 else "below"
+                    alerts.append(
+                        f"{metric.replace('_', ' ').capitalize()} {value:g} is {direction} baseline "
+                        f"{stat.mean:.1f} ± {math.sqrt(stat.var):.1f} (z={z:.1f})"
+                    )
+            stat.update(value)
+
+        names = set(process_names)
+        port_values = {str(port) for port in ports}
+        if self.observations >= self.warmup:
+            rare_names = sorted(name for name in names if self.process_names.estimate(name) < self.rare_threshold)
+            rare_ports = sorted(port_values - {"0"}, key=lambda p: int(p) if p.isdigit() else 0)
+            rare_ports = [port for port in rare_ports if self.ports.estimate(port) < self.rare_threshold]
+            if rare_names:
+                alerts.append(f"Process names new to this host: {', '.join(rare_names[:10])}"
+                              + (f" (+{len(rare_names) - 10} more)" if len(rare_names) > 10 else ""))
+            if rare_ports:
+                alerts.append(f"Listening ports new to this host: {', '.join(rare_ports[:10])}"
+                              + (f" (+{len(rare_ports) - 10} more)" if len(rare_ports) > 10 else ""))
+
+        self.process_names.decay(self.decay)
+        self.ports.decay(self.decay)
+        for name in names:
+            self.process_names.add(name)
+        for port in port_values:
+            self.ports.add(port)
+
+        self.observations += 1
+        self.updated_at = time.time()
+        return alerts
+
+
+def _safe_name(host: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in host) or "localhost"
@@ -0,0 +1,139 @@
+"""
+Live watch mode for the security dashboard.
+
+A background refresher keeps each dashboard section as a materialised view,
+refreshing every section on its own interval (cheap sections faster than
+expensive ones). Sections that are due together are collected in one
+planned osquery batch. Consumers poll `version` and re-render only the
+sections whose own version changed; alerts are reported as raised/cleared
+transitions instead of being re-listed on every refresh.
+"""
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Optional
+
+# Refresh interval of each section as a multiple of the base interval
+SECTION_INTERVAL_FACTORS = {
+    "system": 30,
+    "users": 3,
+    "network": 1,
+    "processes": 1,
+    "alerts": 3,
+}
+
+
+class SectionView:
+    """Latest rendering of one dashboard section."""
+
+    def __init__(self, key: str, title: str):
+        self.key = key
+        self.title = title
+        self.lines: List[str] = []
+        self.version = 0
+        self.updated_at = 0.0
+        self.next_due = 0.0
+
+
+class DashboardRefresher:
+    """Keeps dashboard sections fresh on a background thread."""
+
+    def __init__(self, dashboard, base_interval: float = 10.0,
+                 intervals: Optional[Dict[str, float]] = None, max_events: int = 50):
+        """
+        Args:
+            dashboard: SecurityDashboard used to collect and render sections
+            base_interval: Interval of the cheapest sections, in seconds
+            intervals: Explicit per-section intervals overriding the defaults
+            max_events: Alert transitions kept for display
+        """
+        self.dashboard = dashboard
+        self.intervals = {
+            key: base_interval * factor for key, factor in SECTION_INTERVAL_FACTORS.items()
+        }
+        if intervals:
+            self.intervals.update(intervals)
+        self.views = {
+            section.key: SectionView(section.key, section.title) for section in dashboard.sections.values()
+        }
+        self.active_alerts: List[str] = []
+        self.events = deque(maxlen=max_events)  # (timestamp, "raised"/"cleared", alert)
+        self.version = 0
+        self.error = ""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="lia-dashboard-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def refresh_now(self):
+        """Mark every section due and wake the refresher"""
+        with self._lock:
+            for view in self.views.values():
+                view.next_due = 0.0
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.time()
+            with self._lock:
+                due = [key for key, view in self.views.items() if view.next_due <= now]
+            if due:
+                self._refresh(due)
+            with self._lock:
+                next_due = min(view.next_due for view in self.views.values())
+            self._wake.wait(timeout=max(0.1, next_due - time.time()))
+            self._wake.clear()
+
+    def _refresh(self, keys: List[str]):
+        try:
+            values, rows = self.dashboard.collect(keys)
+            rendered = {key: self.dashboard.render_section(key, values, rows) for key in keys}
+            self.error = ""
+        except Exception as e:
+            self.error = str(e)
+            rendered = {}
+
+        now = time.time()
+        with self._lock:
+            changed = False
+            for key in keys:
+                view = self.views[key]
+                view.next_due = now + self.intervals.get(key, 10.0)
+                if key in rendered and rendered[key] != view.lines:
+                    view.lines = rendered[key]
+                    view.version += 1
+                    view.updated_at = now
+                    changed = True
+            if "alerts" in rendered:
+                changed = self._record_transitions(self.dashboard.last_alerts, now) or changed
+            if changed:
+                self.version += 1
+
+    def _record_transitions(self, alerts: List[str], now: float) -> bool:
+        previous = set(self.active_alerts)
+        current = set(alerts)
+        for alert in alerts:
+            if alert not in previous:
+                self.events.append((now, "raised", alert))
+        for alert in self.active_alerts:
+            if alert not in current:
+                self.events.append((now, "cleared", alert))
+        self.active_alerts = list(alerts)
+        return previous != current
+
+    def snapshot(self) -> List[SectionView]:
+        """Section views in dashboard order (shared objects; treat as read-only)"""
+        with self._lock:
+            return list(self.views.values())
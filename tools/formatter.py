@@ -7,7 +7,7 @@ class ResultFormatter:
         if not output:
             return f"🛠 Executed: `{command}`\n\nNo output."
         
-        # Show full output without truncation
+        # Output arrives already capped by CommandEngine (head + tail of very large output)
         return f"🛠 Executed: `{command}`\n\nOutput:\n```\n{output}\n```"
     
     @staticmethod
@@ -88,4 +88,154 @@ class ResultFormatter:
     @staticmethod
     def format_error(error_msg: str) -> str:
         """Format error messages"""
-        return f"⚠ Error: {error_msg}"
\ No newline at end of file
+        return f"⚠ Error: {error_msg}"
+
+    @staticmethod
+    def format_ioc_hits(lines: List[str]) -> str:
+        """Format indicator matches found in a result set"""
+        return "🚨 Indicator matches:\n" + "\n".join(f"- {line}" for line in lines)
+
+    @staticmethod
+    def format_process_tree(title: str, nodes: List[Any]) -> str:
+        """
+        Format process lineage as an indented tree
+
+        Args:
+            title: Heading line
+            nodes: List of (depth, node) tuples, node having pid/name/cmdline/subtree_size
+        """
+        if not nodes:
+            return f"🌳 {title}\n\nNo matching processes."
+        lines = []
+        for depth, node in nodes:
+            cmdline = node.cmdline if len(node.cmdline) <= 60 else node.cmdline[:57] + "..."
+            branch = "  " * depth + ("└─ " if depth else "")
+            line = f"{branch}{node.name} (pid {node.pid})"
+            if node.subtree_size > 1:
+                line += f" [{node.subtree_size - 1} descendants]"
+            if cmdline:
+                line += f"  {cmdline}"
+            lines.append(line)
+        tree = "\n".join(lines)
+        return f"🌳 {title}\n\n```\n{tree}\n```"
+
+    @staticmethod
+    def format_job_submitted(job) -> str:
+        """Format the acknowledgement for a newly submitted background job"""
+        return (f"⏳ Started job {job.id} ({job.kind}): `{job.target}`\n\n"
+                f"Budget: {job.timeout:.0f}s. Ask \"show me the result of job {job.id}\" "
+                f"or \"cancel job {job.id}\" at any time.")
+
+    @staticmethod
+    def format_job_status(job, tail_lines: int = 20) -> str:
+        """Format the status of an unfinished job with the tail of its partial output"""
+        text = f"⏳ Job {job.id} ({job.kind}) is {job.status.value}: `{job.target}`\n\nProgress: {job.progress}"
+        tail = job.output_tail(tail_lines).strip()
+        if tail:
+            text += f"\n\nPartial output:\n```\n{tail}\n```"
+        return text
+
+    @staticmethod
+    def format_job_list(jobs: List[Any]) -> str:
+        """Format a one-line-per-job overview"""
+        if not jobs:
+            return "No background jobs."
+        lines = ["Background jobs:", ""]
+        for job in jobs:
+            lines.append(f"- Job {job.id} [{job.status.value}] {job.kind}: `{job.target}` ({job.progress})")
+        return "\n".join(lines)
+
+    @staticmethod
+    def format_cache_stats(stats: Dict[str, Any]) -> str:
+        """Format command result cache counters"""
+        if not stats:
+            return "The command result cache is disabled."
+        return (f"📦 Command cache: {stats['entries']} cached results, "
+                f"{stats['hit_rate']:.0%} hit rate\n\n"
+                f"- Hits: {stats['hits']}\n"
+                f"- Misses: {stats['misses']}\n"
+                f"- Collapsed into a running command: {stats['collapsed']}\n"
+                f"- Not cacheable (always run): {stats['bypassed']}\n"
+                f"- Invalidations: {stats['invalidations']}")
+
+    @staticmethod
+    def format_limit_report(summary: Dict[str, Any], slots) -> str:
+        """Format which resource limits have stopped commands and queries"""
+        text = (f"🧯 Child processes: {slots.running} of {slots.limit} running, "
+                f"{slots.waits} waited for a slot, {slots.rejections} rejected")
+        if not summary["counts"]:
+            return text + "\n\nNo command or query has been stopped by a resource limit."
+        lines = [f"- {name}: {count}" for name, count in summary["counts"].items()]
+        text += "\n\nStopped by a limit (engine/limit):\n" + "\n".join(lines)
+        recent = [f"- {event['engine']}: `{ResultFormatter._clip(event['target'], 60)}` hit the "
+                  f"{event['limit']} after {event['elapsed']:.1f}s" for event in reversed(summary["recent"][-5:])]
+        return text + "\n\nMost recent:\n" + "\n".join(recent)
+
+    # Digests are what later prompts see of a tool turn; the full output stays in memory
+
+    @staticmethod
+    def _clip(value: Any, width: int) -> str:
+        text = " ".join(str(value).split())
+        return text if len(text) <= width else text[:width - 3] + "..."
+
+    @staticmethod
+    def digest_osquery_result(sql: str, results: List[Dict[str, Any]], top_rows: int = 3,
+                              extra_lines: List[str] = ()) -> str:
+        """
+        Compact summary of an osquery result: query, row count, columns, top rows, key stats
+
+        Args:
+            sql: Query that produced the results
+            results: Result rows
+            top_rows: Rows quoted verbatim
+            extra_lines: Additional one-line notes (e.g. indicator matches)
+        """
+        lines = [f"[osquery] `{ResultFormatter._clip(sql, 200)}` returned {len(results)} row(s)"]
+        if results:
+            columns = list(results[0].keys())
+            lines.append("Columns: " + ", ".join(columns[:20]) + (" ..." if len(columns) > 20 else ""))
+            for row in results[:top_rows]:
+                lines.append("  " + " | ".join(f"{column}={ResultFormatter._clip(row.get(column, ''), 30)}"
+                                               for column in columns[:8]))
+            if len(results) > top_rows:
+                stats = []
+                for column in columns[:8]:
+                    values = [str(row.get(column, "")) for row in results]
+                    numbers = []
+                    for value in values:
+                        try:
+                            numbers.append(float(value))
+                        except ValueError:
+                            break
+                    if numbers and len(numbers) == len(values):
+                        stats.append(f"{column} {min(numbers):g}..{max(numbers):g}")
+                    else:
+                        stats.append(f"{column} {len(set(values))} distinct")
+                lines.append("Stats: " + "; ".join(stats))
+        lines.extend(ResultFormatter._clip(line, 160) for line in extra_lines)
+        return "\n".join(lines)
+
+    @staticmethod
+    def digest_command_output(command: str, output: str, error: str = "", head: int = 5, tail: int = 3) -> str:
+        """Compact summary of a command run: command, size, first and last lines"""
+        output = output or ""
+        output_lines = output.splitlines()
+        lines = [f"[command] `{ResultFormatter._clip(command, 200)}` produced "
+                 f"{len(output_lines)} line(s), {len(output)} bytes"]
+        if error:
+            lines.append("Error: " + ResultFormatter._clip(error, 160))
+        if len(output_lines) <= head + tail:
+            shown = output_lines
+        else:
+            shown = output_lines[:head] + [f"... {len(output_lines) - head - tail} more lines ..."] + output_lines[-tail:]
+        lines.extend("  " + ResultFormatter._clip(line, 120) for line in shown)
+        return "\n".join(lines)
+
+    @staticmethod
+    def digest_text(text: str, max_lines: int = 8, width: int = 120) -> str:
+        """First lines of a long formatted response"""
+        text_lines = [line for line in text.splitlines() if line.strip() and line.strip() != "```"]
+        shown = [ResultFormatter._clip(line, width) for line in text_lines[:max_lines]]
+        if len(text_lines) > max_lines:
+            shown.append(f"... {len(text_lines) - max_lines} more lines")
+        return "\n".join(shown)
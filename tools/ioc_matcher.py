@@ -0,0 +1,370 @@
+"""
+Bulk indicator-of-compromise (IOC) matching for osquery result sets.
+
+Indicator lists are plain text files in a source directory, one indicator
+per line ('#' starts a comment):
+
+    ips.txt, cidrs.txt     IPv4/IPv6 addresses and networks
+    domains.txt            domains (sub-domains match too)
+    hashes.txt             md5 / sha1 / sha256 hex digests
+    process_names.txt      process names
+    ports.txt              suspicious ports
+
+They are compiled once into compact sorted binary arrays (merged integer
+ranges for addresses, raw digests for hashes, UTF-8 strings plus an offset
+table for domains and process names) that load in a single read per file
+and are searched with bisect, so millions of indicators stay cheap to load
+and to match. The compiled copy is rebuilt whenever the set of source
+lists, or any list's size or mtime, differs from the one it was built from.
+"""
+import array
+import bisect
+import ipaddress
+import json
+import os
+import socket
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+
+SOURCE_FILES = ("ips.txt", "cidrs.txt", "domains.txt", "hashes.txt", "process_names.txt", "ports.txt")
+COMPILED_VERSION = 2
+
+# Ports the dashboard has always flagged, used when no ports.txt is provided
+DEFAULT_PORTS = {4444, 5555, 6666, 31337}
+
+# Result columns checked for each indicator type
+ADDRESS_COLUMNS = {"remote_address", "local_address", "address", "ip", "source_ip", "destination_ip", "dst_ip", "src_ip"}
+DOMAIN_COLUMNS = {"domain", "hostname", "host", "remote_hostname", "query", "fqdn"}
+HASH_COLUMNS = {"md5", "sha1", "sha256"}
+NAME_COLUMNS = {"name", "process_name", "parent_name"}
+PORT_COLUMNS = {"port", "remote_port", "local_port"}
+
+HASH_WIDTHS = (16, 20, 32)  # md5, sha1, sha256 digests in bytes
+
+
+class FixedWidthRecords:
+    """Read-only sequence view over a blob of sorted fixed-width records (bisect-able)."""
+
+    def __init__(self, blob: bytes, width: int):
+        self.blob = blob
+        self.width = width
+
+    def __len__(self) -> int:
+        return len(self.blob) // self.width
+
+    def __getitem__(self, index: int) -> bytes:
+        start = index * self.width
+        return self.blob[start:start + self.width]
+
+    def __contains__(self, record: bytes) -> bool:
+        i = bisect.bisect_left(self, record)
+        return i < len(self) and self[i] == record
+
+
+class SortedStrings:
+    """Read-only sequence view over sorted UTF-8 strings in one blob, with an offset table."""
+
+    def __init__(self, blob: bytes = b"", offsets: Optional[array.array] = None):
+        self.blob = blob
+        self.offsets = offsets if offsets is not None else array.array("Q", [0])
+
+    @classmethod
+    def build(cls, values: Iterable[str]) -> "SortedStrings":
+        encoded = sorted({value.encode("utf-8") for value in values})
+        offsets = array.array("Q", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> bytes:
+        return self.blob[self.offsets[index]:self.offsets[index + 1]]
+
+    def __contains__(self, value: str) -> bool:
+        key = value.encode("utf-8")
+        i = bisect.bisect_left(self, key)
+        return i < len(self) and self[i] == key
+
+
+class IOCMatcher:
+    """Compact in-memory indicator sets with whole-result-set matching."""
+
+    def __init__(self):
+        self.ipv4_starts = array.array("I")
+        self.ipv4_ends = array.array("I")
+        self.ipv6_starts = FixedWidthRecords(b"", 16)
+        self.ipv6_ends = FixedWidthRecords(b"", 16)
+        self.hashes: Dict[int, FixedWidthRecords] = {width: FixedWidthRecords(b"", width) for width in HASH_WIDTHS}
+        self.domains = SortedStrings()
+        self.process_names = SortedStrings()
+        self.ports: Set[int] = set(DEFAULT_PORTS)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_directory(cls, source_dir: str = "data/ioc", compiled_dir: Optional[str] = None) -> "IOCMatcher":
+        """
+        Load indicators, recompiling only when a source list changed
+
+        Args:
+            source_dir: Directory with the plain text indicator lists
+            compiled_dir: Where the compiled format lives (default: source_dir/compiled)
+
+        Returns:
+            IOCMatcher (only the default ports when no lists exist)
+        """
+        compiled_dir = compiled_dir or os.path.join(source_dir, "compiled")
+        sources = _source_stamps(source_dir)
+        if not sources:
+            return cls()
+
+        manifest_path = os.path.join(compiled_dir, "manifest.json")
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == COMPILED_VERSION and manifest.get("sources") == sources:
+                return cls.load(compiled_dir)
+        except (OSError, ValueError):
+            pass
+
+        return cls.compile(source_dir, compiled_dir)
+
+    @classmethod
+    def compile(cls, source_dir: str, compiled_dir: str) -> "IOCMatcher":
+        """Parse the text lists and write the compiled on-disk format"""
+        v4_ranges: List[Tuple[int, int]] = []
+        v6_ranges: List[Tuple[int, int]] = []
+        hashes: Dict[int, Set[bytes]] = {width: set() for width in HASH_WIDTHS}
+        domains: Set[str] = set()
+        names: Set[str] = set()
+        ports: Set[int] = set()
+        skipped = 0
+
+        for name in SOURCE_FILES:
+            path = os.path.join(source_dir, name)
+            if not os.path.exists(path):
+                continue
+            for indicator in _read_indicators(path):
+                try:
+                    if name in ("ips.txt", "cidrs.txt"):
+                        if "/" not in indicator and ":" not in indicator:
+                            # Fast path for plain IPv4 addresses, the bulk of most feeds
+                            try:
+                                value = int.from_bytes(socket.inet_pton(socket.AF_INET, indicator), "big")
+                                v4_ranges.append((value, value))
+                                continue
+                            except OSError:
+                                pass
+                        network = ipaddress.ip_network(indicator, strict=False)
+                        target = v4_ranges if network.version == 4 else v6_ranges
+                        target.append((int(network.network_address), int(network.broadcast_address)))
+                    elif name == "hashes.txt":
+                        digest = bytes.fromhex(indicator)
+                        if len(digest) not in hashes:
+                            raise ValueError("unsupported digest length")
+                        hashes[len(digest)].add(digest)
+                    elif name == "domains.txt":
+                        domains.add(indicator.lower().strip(".").removeprefix("*."))
+                    elif name == "process_names.txt":
+                        names.add(indicator.lower())
+                    elif name == "ports.txt":
+                        ports.add(int(indicator))
+                except ValueError:
+                    skipped += 1
+
+        os.makedirs(compiled_dir, exist_ok=True)
+        v4_merged = _merge_ranges(v4_ranges)
+        v6_merged = _merge_ranges(v6_ranges)
+        with open(os.path.join(compiled_dir, "ipv4_starts.bin"), "wb") as f:
+            array.array("I", [start for start, _ in v4_merged]).tofile(f)
+        with open(os.path.join(compiled_dir, "ipv4_ends.bin"), "wb") as f:
+            array.array("I", [end for _, end in v4_merged]).tofile(f)
+        with open(os.path.join(compiled_dir, "ipv6_starts.bin"), "wb") as f:
+            f.write(b"".join(start.to_bytes(16, "big") for start, _ in v6_merged))
+        with open(os.path.join(compiled_dir, "ipv6_ends.bin"), "wb") as f:
+            f.write(b"".join(end.to_bytes(16, "big") for _, end in v6_merged))
+        for width, digests in hashes.items():
+            with open(os.path.join(compiled_dir, f"hashes_{width}.bin"), "wb") as f:
+                f.write(b"".join(sorted(digests)))
+        for kind, values in (("domains", domains), ("process_names", names)):
+            strings = SortedStrings.build(values)
+            with open(os.path.join(compiled_dir, f"{kind}.bin"), "wb") as f:
+                f.write(strings.blob)
+            with open(os.path.join(compiled_dir, f"{kind}.idx"), "wb") as f:
+                strings.offsets.tofile(f)
+
+        manifest = {
+            "version": COMPILED_VERSION,
+            "sources": _source_stamps(source_dir),
+            "ports": sorted(ports),
+            "counts": {
+                "ipv4_ranges": len(v4_merged), "ipv6_ranges": len(v6_merged),
+                "hashes": sum(len(d) for d in hashes.values()),
+                "domains": len(domains), "process_names": len(names), "ports": len(ports)
+            },
+            "skipped": skipped
+        }
+        with open(os.path.join(compiled_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+        return cls.load(compiled_dir)
+
+    @classmethod
+    def load(cls, compiled_dir: str) -> "IOCMatcher":
+        """Load the compiled format (one read per file, no parsing of addresses or hashes)"""
+        matcher = cls()
+        with open(os.path.join(compiled_dir, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+
+        def read(name: str) -> bytes:
+            with open(os.path.join(compiled_dir, name), "rb") as f:
+                return f.read()
+
+        matcher.ipv4_starts.frombytes(read("ipv4_starts.bin"))
+        matcher.ipv4_ends.frombytes(read("ipv4_ends.bin"))
+        matcher.ipv6_starts = FixedWidthRecords(read("ipv6_starts.bin"), 16)
+        matcher.ipv6_ends = FixedWidthRecords(read("ipv6_ends.bin"), 16)
+        for width in HASH_WIDTHS:
+            matcher.hashes[width] = FixedWidthRecords(read(f"hashes_{width}.bin"), width)
+        for kind in ("domains", "process_names"):
+            offsets = array.array("Q")
+            offsets.frombytes(read(f"{kind}.idx"))
+            setattr(matcher, kind, SortedStrings(read(f"{kind}.bin"), offsets))
+        if manifest.get("ports"):
+            matcher.ports = set(manifest["ports"])
+        return matcher
+
+    # ------------------------------------------------------------------
+    # Matching
+    # ------------------------------------------------------------------
+
+    def match_ip(self, value: str) -> bool:
+        try:
+            address = ipaddress.ip_address(value.split("%")[0])
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if address.version == 4:
+            i = bisect.bisect_right(self.ipv4_starts, int(address)) - 1
+            return i >= 0 and int(address) <= self.ipv4_ends[i]
+        key = int(address).to_bytes(16, "big")
+        i = bisect.bisect_right(self.ipv6_starts, key) - 1
+        return i >= 0 and key <= self.ipv6_ends[i]
+
+    def match_hash(self, value: str) -> bool:
+        try:
+            digest = bytes.fromhex(value)
+        except ValueError:
+            return False
+        records = self.hashes.get(len(digest))
+        return records is not None and digest in records
+
+    def match_domain(self, value: str) -> bool:
+        labels = value.lower().strip(".").split(".")
+        return any(".".join(labels[i:]) in self.domains for i in range(len(labels) - 1))
+
+    def match_process_name(self, value: str) -> bool:
+        return value.lower() in self.process_names
+
+    def match_port(self, value: str) -> bool:
+        try:
+            return int(value) in self.ports
+        except (TypeError, ValueError):
+            return False
+
+    def match_results(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Match an entire result set in one pass
+
+        Values are grouped by indicator type and de-duplicated first, so each
+        distinct value is looked up once no matter how many rows carry it.
+
+        Returns:
+            List of hits: {"row", "column", "value", "type"}
+        """
+        checks = (
+            ("ip", ADDRESS_COLUMNS, self.match_ip),
+            ("domain", DOMAIN_COLUMNS, self.match_domain),
+            ("hash", HASH_COLUMNS, self.match_hash),
+            ("process_name", NAME_COLUMNS, self.match_process_name),
+            ("port", PORT_COLUMNS, self.match_port),
+        )
+        active = [(kind, columns, check) for kind, columns, check in checks if self._has_indicators(kind)]
+        if not active:
+            return []
+
+        occurrences: Dict[Tuple[str, str], List[Tuple[int, str]]] = {}
+        for index, row in enumerate(rows):
+            for column, value in row.items():
+                if value in (None, ""):
+                    continue
+                column_lower = column.lower()
+                for kind, columns, _ in active:
+                    if column_lower in columns:
+                        occurrences.setdefault((kind, str(value)), []).append((index, column))
+
+        hits = []
+        check_by_kind = {kind: check for kind, _, check in active}
+        for (kind, value), places in occurrences.items():
+            if check_by_kind[kind](value):
+                hits.extend({"row": index, "column": column, "value": value, "type": kind}
+                            for index, column in places)
+        hits.sort(key=lambda hit: (hit["row"], hit["column"]))
+        return hits
+
+    def _has_indicators(self, kind: str) -> bool:
+        if kind == "ip":
+            return len(self.ipv4_starts) > 0 or len(self.ipv6_starts) > 0
+        if kind == "domain":
+            return len(self.domains) > 0
+        if kind == "hash":
+            return any(len(records) for records in self.hashes.values())
+        if kind == "process_name":
+            return len(self.process_names) > 0
+        return bool(self.ports)
+
+    def summarize_hits(self, hits: List[Dict[str, Any]], source: str = "") -> List[str]:
+        """One line per distinct (type, value) hit, for alerts and result footers"""
+        seen = {}
+        for hit in hits:
+            key = (hit["type"], hit["value"])
+            seen.setdefault(key, set()).add(hit["column"])
+        where = f" in {source}" if source else ""
+        return [f"IOC match ({kind.replace('_', ' ')}): {value} [{', '.join(sorted(columns))}]{where}"
+                for (kind, value), columns in sorted(seen.items())]
+
+
+def _source_stamps(source_dir: str) -> Dict[str, List[float]]:
+    """{list name: [mtime, size]} of the source lists present"""
+    stamps = {}
+    for name in SOURCE_FILES:
+        try:
+            st = os.stat(os.path.join(source_dir, name))
+        except OSError:
+            continue
+        stamps[name] = [st.st_mtime, st.st_size]
+    return stamps
+
+
+def _read_indicators(path: str) -> Iterable[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            indicator = line.split("#", 1)[0].strip()
+            if indicator:
+                yield indicator
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sort and merge overlapping or adjacent integer ranges"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
@@ -0,0 +1,265 @@
+"""
+In-memory process tree index built from a single `processes` scan.
+
+Keeps parent/children adjacency, a name index and subtree sizes so lineage
+questions ("what spawned this shell", "descendants of sshd") are answered
+in O(depth) or O(subtree) without further osquery calls or recursive JOINs.
+"""
+import os
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+PROCESS_COLUMNS = "pid, parent, name, path, cmdline, uid, start_time"
+PROCESS_SQL = f"SELECT {PROCESS_COLUMNS} FROM processes;"
+
+SHELLS = {"sh", "bash", "zsh", "dash", "ksh", "fish", "csh", "tcsh", "ash", "busybox"}
+
+# Services that should never be the direct parent of an interactive shell
+SERVICE_PARENTS = {
+    "nginx", "apache2", "httpd", "php-fpm", "php-cgi", "lighttpd", "mysqld", "mariadbd",
+    "postgres", "redis-server", "mongod", "java", "tomcat", "node", "w3wp", "sqlservr"
+}
+
+# Daemons and the parents they are expected to have
+EXPECTED_PARENTS = {
+    "sshd": {"systemd", "init", "sshd", "launchd"},
+    "cron": {"systemd", "init"},
+    "crond": {"systemd", "init"},
+    "systemd-journald": {"systemd"},
+    "systemd-logind": {"systemd"},
+    "dbus-daemon": {"systemd", "init", "launchd", "dbus-launch", "gnome-session-binary"},
+    "lsass.exe": {"wininit.exe"},
+    "services.exe": {"wininit.exe"},
+    "svchost.exe": {"services.exe", "MsMpEng.exe"},
+}
+
+
+class ProcessNode:
+    """One process in the tree."""
+
+    __slots__ = ("pid", "parent", "name", "path", "cmdline", "uid", "start_time", "children", "subtree_size")
+
+    def __init__(self, row: Dict[str, Any]):
+        self.pid = int(row.get("pid", 0) or 0)
+        self.parent = int(row.get("parent", 0) or 0)
+        self.name = row.get("name", "") or ""
+        self.path = row.get("path", "") or ""
+        self.cmdline = row.get("cmdline", "") or ""
+        self.uid = row.get("uid", "")
+        self.start_time = str(row.get("start_time", ""))
+        self.children: Set[int] = set()
+        self.subtree_size = 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid, "parent": self.parent, "name": self.name, "path": self.path,
+            "cmdline": self.cmdline, "uid": self.uid, "subtree_size": self.subtree_size
+        }
+
+
+class ProcessTree:
+    """Process lineage index refreshed incrementally from osquery."""
+
+    def __init__(self, osquery_engine, max_age: float = 5.0):
+        """
+        Args:
+            osquery_engine: OsqueryEngine used for the `processes` scan
+            max_age: Seconds after which ensure_fresh() rescans
+        """
+        self.osquery_engine = osquery_engine
+        self.max_age = max_age
+        self.nodes: Dict[int, ProcessNode] = {}
+        self.by_name: Dict[str, Set[int]] = {}
+        self._orphans: Dict[int, Set[int]] = {}  # parent pid not (yet) indexed -> children
+        self.refreshed_at = 0.0
+
+    def refresh(self) -> str:
+        """
+        Rescan processes with one osquery call and apply the differences
+
+        Returns:
+            Error message, empty on success
+        """
+        rows, error = self.osquery_engine.execute_query(PROCESS_SQL)
+        if error:
+            return error
+        self.apply_rows(rows)
+        return ""
+
+    def ensure_fresh(self) -> str:
+        """Refresh only if the index is older than max_age"""
+        if time.time() - self.refreshed_at > self.max_age:
+            return self.refresh()
+        return ""
+
+    def apply_rows(self, rows: List[Dict[str, Any]]):
+        """
+        Update the index from a full `processes` result
+
+        Only processes that appeared, exited or were re-parented are touched,
+        so a refresh costs O(changes x depth) on top of the scan itself.
+        """
+        seen = {}
+        for row in rows:
+            node = ProcessNode(row)
+            seen[node.pid] = node
+
+        for pid in [pid for pid in self.nodes if pid not in seen]:
+            self._remove(pid)
+
+        for pid, node in seen.items():
+            current = self.nodes.get(pid)
+            if current is None:
+                self._add(node)
+            elif current.start_time != node.start_time:
+                # PID reuse: a different process now owns this pid
+                self._remove(pid)
+                self._add(node)
+            elif current.parent != node.parent:
+                self._reparent(current, node.parent)
+
+        self.refreshed_at = time.time()
+
+    def _add(self, node: ProcessNode):
+        # Adopt children that were indexed before their parent
+        for child_pid in self._orphans.pop(node.pid, ()):
+            child = self.nodes.get(child_pid)
+            if child is not None and child_pid != node.pid:
+                node.children.add(child_pid)
+                node.subtree_size += child.subtree_size
+        self.nodes[node.pid] = node
+        self.by_name.setdefault(node.name, set()).add(node.pid)
+        self._attach(node)
+
+    def _remove(self, pid: int):
+        node = self.nodes.pop(pid)
+        names = self.by_name.get(node.name)
+        if names is not None:
+            names.discard(pid)
+            if not names:
+                del self.by_name[node.name]
+        self._detach(node)
+        if node.children:
+            self._orphans.setdefault(pid, set()).update(node.children)
+
+    def _reparent(self, node: ProcessNode, new_parent: int):
+        self._detach(node)
+        node.parent = new_parent
+        self._attach(node)
+
+    def _attach(self, node: ProcessNode):
+        """Link a node under its parent, or park it until the parent shows up"""
+        if node.parent == node.pid:
+            return
+        parent = self.nodes.get(node.parent)
+        if parent is None:
+            self._orphans.setdefault(node.parent, set()).add(node.pid)
+            return
+        parent.children.add(node.pid)
+        self._adjust_sizes(node.parent, node.subtree_size)
+
+    def _detach(self, node: ProcessNode):
+        parent = self.nodes.get(node.parent)
+        if parent is not None and node.pid in parent.children:
+            parent.children.discard(node.pid)
+            self._adjust_sizes(node.parent, -node.subtree_size)
+            return
+        orphans = self._orphans.get(node.parent)
+        if orphans is not None:
+            orphans.discard(node.pid)
+            if not orphans:
+                del self._orphans[node.parent]
+
+    def _adjust_sizes(self, pid: int, delta: int):
+        """Propagate a subtree size change to every ancestor (O(depth))"""
+        visited = set()
+        while pid in self.nodes and pid not in visited:
+            visited.add(pid)
+            node = self.nodes[pid]
+            node.subtree_size += delta
+            pid = node.parent
+
+    def get(self, pid: int) -> Optional[ProcessNode]:
+        return self.nodes.get(pid)
+
+    def find(self, name: str) -> List[int]:
+        """PIDs of processes with an exact (case-insensitive fallback) name"""
+        pids = self.by_name.get(name)
+        if pids:
+            return sorted(pids)
+        name_lower = name.lower()
+        return sorted(pid for key, pids in self.by_name.items() if key.lower() == name_lower for pid in pids)
+
+    def ancestors(self, pid: int) -> List[ProcessNode]:
+        """Parent chain from the direct parent up to the root, O(depth)"""
+        chain = []
+        visited = {pid}
+        node = self.nodes.get(pid)
+        while node is not None and node.parent not in visited:
+            visited.add(node.parent)
+            node = self.nodes.get(node.parent)
+            if node is not None:
+                chain.append(node)
+        return chain
+
+    def descendants(self, pid: int, max_nodes: int = 500) -> List[Tuple[int, ProcessNode]]:
+        """
+        Depth-first list of (depth, node) below pid, excluding pid itself
+
+        Args:
+            pid: Root of the subtree
+            max_nodes: Stop after this many nodes
+        """
+        result = []
+        root = self.nodes.get(pid)
+        if root is None:
+            return result
+        stack = [(1, child) for child in sorted(root.children, reverse=True)]
+        visited = {pid}
+        while stack and len(result) < max_nodes:
+            depth, child_pid = stack.pop()
+            if child_pid in visited or child_pid not in self.nodes:
+                continue
+            visited.add(child_pid)
+            child = self.nodes[child_pid]
+            result.append((depth, child))
+            stack.extend((depth + 1, grandchild) for grandchild in sorted(child.children, reverse=True))
+        return result
+
+    def unusual_parents(self) -> List[str]:
+        """Describe processes whose parent doesn't fit their role"""
+        alerts = []
+        for node in self.nodes.values():
+            parent = self.nodes.get(node.parent)
+            if parent is None:
+                continue
+            expected = EXPECTED_PARENTS.get(node.name)
+            if expected is not None and parent.name not in expected:
+                alerts.append(f"{node.name} (pid {node.pid}) spawned by unexpected parent {parent.name} (pid {parent.pid})")
+            elif node.name in SHELLS and parent.name in SERVICE_PARENTS:
+                alerts.append(f"Shell {node.name} (pid {node.pid}) spawned by service {parent.name} (pid {parent.pid})")
+        return sorted(alerts)
+
+    def resolve(self, target: str) -> List[int]:
+        """
+        Resolve a user's process reference to PIDs
+
+        Accepts "pid 1234", "1234", "this shell" (the shell LiaAI runs in),
+        "shell"/"shells" (every shell) or a process name.
+        """
+        target = target.strip().strip("?.!'\"`").strip()
+        lowered = target.lower()
+        for prefix in ("process ", "the ", "pid ", "process id "):
+            if lowered.startswith(prefix):
+                target = target[len(prefix):].strip()
+                lowered = target.lower()
+        if lowered.isdigit():
+            return [int(lowered)] if int(lowered) in self.nodes else []
+        if lowered in ("this shell", "my shell", "this terminal"):
+            pid = os.getppid()
+            return [pid] if pid in self.nodes else []
+        if lowered in ("shell", "shells", "a shell"):
+            return sorted(pid for name in SHELLS for pid in self.by_name.get(name, ()))
+        if lowered.endswith(" process") or lowered.endswith(" processes"):
+            target = target.rsplit(" ", 1)[0]
+        return self.find(target)
@@ -0,0 +1,160 @@
+"""
+Query planner for declarative osquery metrics.
+
+Callers declare what they need (aggregate metrics and row sets); the planner
+makes sure every table is scanned once:
+
+- a table that is already fetched in full as a row set gets its metrics
+  computed from those rows in Python
+- the remaining metrics are merged into one aggregate SELECT per table
+  (e.g. COUNT(*) and SUM(uid = 0) in a single scan of `processes`)
+
+All statements then run in one osqueryi session (OsqueryEngine.execute_batch)
+and the values are fanned back out by name.
+"""
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
+
+
+class Metric:
+    """A named scalar computed over one table."""
+
+    def __init__(self, name: str, table: str, aggregate: str,
+                 row_fn: Optional[Callable[[List[Dict[str, Any]]], float]] = None):
+        """
+        Args:
+            name: Result key (also used as the SQL column alias)
+            table: osquery table the metric is computed over
+            aggregate: SQL aggregate expression, e.g. "COUNT(*)" or "SUM(uid = 0)"
+            row_fn: Equivalent computation over the table's rows, used when the
+                rows are fetched anyway
+        """
+        self.name = name
+        self.table = table
+        self.aggregate = aggregate
+        self.row_fn = row_fn
+
+
+class RowQuery:
+    """A named row set from one table."""
+
+    def __init__(self, name: str, table: str, columns: str, where: Optional[str] = None):
+        """
+        Args:
+            name: Result key
+            table: osquery table
+            columns: Comma-separated column list
+            where: Optional filter; only unfiltered row sets can stand in for metrics
+        """
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.where = where
+
+    @property
+    def sql(self) -> str:
+        sql = f"SELECT {self.columns} FROM {self.table}"
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql + ";"
+
+
+class QueryPlan:
+    """Statements to run and how to map their results back to names."""
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self.row_targets: List[Tuple[int, str]] = []  # (statement index, row set name)
+        self.aggregate_targets: List[Tuple[int, List[str]]] = []  # (statement index, metric names)
+        self.derived: List[Metric] = []  # metrics computed from fetched rows
+        self.table_rows: Dict[str, str] = {}  # table -> unfiltered row set name
+
+
+class QueryPlanner:
+    """Plans and executes metric/row-set declarations against an OsqueryEngine."""
+
+    def __init__(self, osquery_engine):
+        self.osquery_engine = osquery_engine
+
+    def plan(self, metrics: Iterable[Metric], row_queries: Iterable[RowQuery]) -> QueryPlan:
+        plan = QueryPlan()
+
+        seen_rows = set()
+        for query in row_queries:
+            if query.name in seen_rows:
+                continue
+            seen_rows.add(query.name)
+            plan.row_targets.append((len(plan.statements), query.name))
+            plan.statements.append(query.sql)
+            if query.where is None:
+                plan.table_rows.setdefault(query.table, query.name)
+
+        by_table: Dict[str, List[Metric]] = {}
+        seen_metrics = set()
+        for metric in metrics:
+            if metric.name in seen_metrics:
+                continue
+            seen_metrics.add(metric.name)
+            if metric.row_fn is not None and metric.table in plan.table_rows:
+                plan.derived.append(metric)
+            else:
+                by_table.setdefault(metric.table, []).append(metric)
+
+        for table, table_metrics in by_table.items():
+            columns = ", ".join(
+                f"COALESCE({metric.aggregate}, 0) AS {metric.name}" for metric in table_metrics
+            )
+            plan.aggregate_targets.append((len(plan.statements), [metric.name for metric in table_metrics]))
+            plan.statements.append(f"SELECT {columns} FROM {table};")
+
+        return plan
+
+    def execute(self, metrics: Iterable[Metric], row_queries: Iterable[RowQuery],
+                timeout: Optional[float] = None) -> Tuple[Dict[str, float], Dict[str, List[Dict[str, Any]]]]:
+        """
+        Run the declarations
+
+        Returns:
+            Tuple of (metric values, row sets); metrics and row sets whose
+            query failed are left out
+        """
+        plan = self.plan(metrics, row_queries)
+        results = self.osquery_engine.execute_batch(plan.statements, timeout=timeout)
+
+        rows: Dict[str, List[Dict[str, Any]]] = {}
+        for index, name in plan.row_targets:
+            result, error = results[index]
+            if not error:
+                rows[name] = result
+
+        values: Dict[str, float] = {}
+        for index, names in plan.aggregate_targets:
+            result, error = results[index]
+            if error or not result:
+                continue
+            for name in names:
+                try:
+                    values[name] = float(result[0].get(name, 0) or 0)
+                except (TypeError, ValueError):
+                    continue
+
+        for metric in plan.derived:
+            table_rows = rows.get(plan.table_rows[metric.table])
+            if table_rows is not None:
+                values[metric.name] = float(metric.row_fn(table_rows))
+
+        return values, rows
+
+
+def count_where(predicate: Callable[[Dict[str, Any]], bool]) -> Callable[[List[Dict[str, Any]]], int]:
+    """Build a row_fn counting the rows that satisfy predicate"""
+    def row_fn(rows: List[Dict[str, Any]]) -> int:
+        return sum(1 for row in rows if predicate(row))
+    return row_fn
+
+
+def as_int(value: Any, default: int = 0) -> int:
+    """osquery returns every value as a string; convert leniently"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
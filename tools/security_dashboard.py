@@ -5,15 +5,76 @@ Add this as a new command: "show security dashboard" or "security status"
 """
 
 from core.lia_main import LiaMain
-from typing import Dict, List, Any
+from tools.baselines import HostBaseline
+from tools.process_tree import PROCESS_COLUMNS
+from tools.query_planner import QueryPlanner, Metric, RowQuery, count_where, as_int
+from typing import Dict, List, Any, Optional, Iterable
 import json
+import socket
+import time
+
+LOOPBACK_ADDRESSES = ("", "127.0.0.1", "::1")
+
+# Row sets shared between sections; each table is scanned at most once per run
+SYSTEM_INFO = RowQuery("system_info", "system_info", "hostname, cpu_brand, physical_memory")
+LOGGED_IN = RowQuery("logged_in_users", "logged_in_users", "user, tty, host")
+LISTENERS = RowQuery("listeners", "listening_ports", "pid, port, protocol, address")
+SOCKETS = RowQuery("sockets", "process_open_sockets", "pid, remote_address, remote_port")
+PROCESSES = RowQuery("processes", "processes", PROCESS_COLUMNS)
+
+METRICS = {
+    "users": Metric("users", "users", "COUNT(*)"),
+    "listening_ports": Metric("listening_ports", "listening_ports", "COUNT(*)", len),
+    "privileged_ports": Metric("privileged_ports", "listening_ports", "SUM(port < 1024)",
+                               count_where(lambda row: as_int(row.get('port'), 65535) < 1024)),
+    "external_connections": Metric(
+        "external_connections", "process_open_sockets",
+        "SUM(remote_address NOT IN ('', '127.0.0.1', '::1'))",
+        count_where(lambda row: (row.get('remote_address') or '') not in LOOPBACK_ADDRESSES)
+    ),
+    "processes": Metric("processes", "processes", "COUNT(*)", len),
+    "root_processes": Metric("root_processes", "processes", "SUM(uid = 0)",
+                             count_where(lambda row: as_int(row.get('uid'), -1) == 0)),
+    "cron_jobs": Metric("cron_jobs", "crontab", "COUNT(*)"),
+}
+
+
+class DashboardSection:
+    """A dashboard section and the data it needs."""
+
+    def __init__(self, key: str, title: str, metrics: List[str], row_queries: List[RowQuery]):
+        self.key = key
+        self.title = title
+        self.metrics = [METRICS[name] for name in metrics]
+        self.row_queries = row_queries
+
+
+SECTIONS = [
+    DashboardSection("system", "📊 SYSTEM OVERVIEW", [], [SYSTEM_INFO]),
+    DashboardSection("users", "👤 USER ACTIVITY", ["users"], [LOGGED_IN]),
+    DashboardSection("network", "🌐 NETWORK SECURITY",
+                     ["listening_ports", "external_connections", "privileged_ports"], [LISTENERS, SOCKETS]),
+    DashboardSection("processes", "⚙️  PROCESS SECURITY", ["processes", "root_processes"], [PROCESSES]),
+    DashboardSection("alerts", "🚨 SECURITY ALERTS", list(METRICS), [SYSTEM_INFO, LISTENERS, SOCKETS, PROCESSES]),
+]
+
 
 class SecurityDashboard:
     def __init__(self, lia_instance: LiaMain):
         self.lia = lia_instance
+        self.hostname = socket.gethostname()
+        self.planner = QueryPlanner(self.lia.osquery_engine)
+        self.sections = {section.key: section for section in SECTIONS}
+        self.last_alerts: List[str] = []
+        # Minimum seconds between baseline observations (watch mode refreshes far more often)
+        self.baseline_interval = 0.0
+        self._baseline_alerts: List[str] = []
+        self._baseline_at = 0.0
+        self.baseline = HostBaseline(self.hostname)
         
     def generate_dashboard(self) -> str:
         """Generate a comprehensive security dashboard"""
+        values, rows = self.collect()
         
         dashboard = []
         dashboard.append("=" * 70)
@@ -21,64 +82,58 @@ class SecurityDashboard:
         dashboard.append("=" * 70)
         dashboard.append("")
         
-        # Section 1: System Overview
-        dashboard.append("📊 SYSTEM OVERVIEW")
-        dashboard.append("-" * 70)
-        sys_info = self._get_system_info()
-        for key, value in sys_info.items():
-            dashboard.append(f"  {key}: {value}")
-        dashboard.append("")
-        
-        # Section 2: User Activity
-        dashboard.append("👤 USER ACTIVITY")
-        dashboard.append("-" * 70)
-        user_info = self._get_user_activity()
-        for item in user_info:
-            dashboard.append(f"  • {item}")
-        dashboard.append("")
-        
-        # Section 3: Network Security
-        dashboard.append("🌐 NETWORK SECURITY")
-        dashboard.append("-" * 70)
-        network_info = self._get_network_security()
-        for item in network_info:
-            dashboard.append(f"  • {item}")
-        dashboard.append("")
-        
-        # Section 4: Process Security
-        dashboard.append("⚙️  PROCESS SECURITY")
-        dashboard.append("-" * 70)
-        process_info = self._get_process_security()
-        for item in process_info:
-            dashboard.append(f"  • {item}")
-        dashboard.append("")
-        
-        # Section 5: Security Alerts
-        dashboard.append("🚨 SECURITY ALERTS")
-        dashboard.append("-" * 70)
-        alerts = self._check_security_alerts()
-        if alerts:
-            for alert in alerts:
-                dashboard.append(f"  ⚠️  {alert}")
-        else:
-            dashboard.append("  ✅ No immediate security concerns detected")
-        dashboard.append("")
+        for section in SECTIONS:
+            dashboard.append(section.title)
+            dashboard.append("-" * 70)
+            dashboard.extend(self.render_section(section.key, values, rows))
+            dashboard.append("")
         
         dashboard.append("=" * 70)
         
         return "\n".join(dashboard)
+
+    def collect(self, section_keys: Optional[Iterable[str]] = None):
+        """
+        Fetch everything the given sections need in one planned batch
+
+        Args:
+            section_keys: Sections to collect for (default: all)
+
+        Returns:
+            Tuple of (metric values, row sets)
+        """
+        sections = [self.sections[key] for key in (section_keys or self.sections)]
+        metrics = [metric for section in sections for metric in section.metrics]
+        row_queries = [query for section in sections for query in section.row_queries]
+        values, rows = self.planner.execute(metrics, row_queries)
+
+        if rows.get("system_info"):
+            self.hostname = rows["system_info"][0].get('hostname') or self.hostname
+            if self.baseline.host != self.hostname:
+                # osquery reported a different name than socket did; switch baselines once
+                self.baseline = HostBaseline(self.hostname)
+        if "processes" in rows:
+            self.lia.process_tree.apply_rows(rows["processes"])
+        return values, rows
+
+    def render_section(self, key: str, values: Dict[str, float], rows: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+        """Render one section's lines from collected data"""
+        if key == "system":
+            return [f"  {k}: {v}" for k, v in self._get_system_info(rows).items()]
+        if key == "users":
+            return [f"  • {item}" for item in self._get_user_activity(values, rows)]
+        if key == "network":
+            return [f"  • {item}" for item in self._get_network_security(values)]
+        if key == "processes":
+            return [f"  • {item}" for item in self._get_process_security(values)]
+        alerts = self._check_security_alerts(values, rows)
+        if alerts:
+            return [f"  ⚠️  {alert}" for alert in alerts]
+        return ["  ✅ No immediate security concerns detected"]
     
-    def _run_query(self, sql: str) -> List[Dict[str, Any]]:
-        """Execute osquery and return results"""
-        results, error = self.lia.osquery_engine.execute_query(sql)
-        if error:
-            return []
-        return results
-    
-    def _get_system_info(self) -> Dict[str, str]:
+    def _get_system_info(self, rows: Dict[str, List[Dict[str, Any]]]) -> Dict[str, str]:
         """Get basic system information"""
-        sql = "SELECT hostname, cpu_brand, physical_memory FROM system_info;"
-        results = self._run_query(sql)
+        results = rows.get("system_info")
         
         if results:
             info = results[0]
@@ -90,10 +145,9 @@ class SecurityDashboard:
             }
         return {"Status": "Unable to retrieve system info"}
     
-    def _get_user_activity(self) -> List[str]:
+    def _get_user_activity(self, values: Dict[str, float], rows: Dict[str, List[Dict[str, Any]]]) -> List[str]:
         """Get current user activity"""
-        sql = "SELECT user, tty, host FROM logged_in_users;"
-        results = self._run_query(sql)
+        results = rows.get("logged_in_users")
         
         info = []
         if results:
@@ -103,90 +157,76 @@ class SecurityDashboard:
         else:
             info.append("No logged in users detected")
         
-        # Get total users
-        sql = "SELECT COUNT(*) as count FROM users;"
-        results = self._run_query(sql)
-        if results:
-            info.append(f"Total system users: {results[0].get('count', 0)}")
+        if "users" in values:
+            info.append(f"Total system users: {values['users']:.0f}")
         
         return info
     
-    def _get_network_security(self) -> List[str]:
+    def _get_network_security(self, values: Dict[str, float]) -> List[str]:
         """Get network security status"""
         info = []
-        
-        # Listening ports
-        sql = "SELECT COUNT(*) as count FROM listening_ports;"
-        results = self._run_query(sql)
-        if results:
-            info.append(f"Listening ports: {results[0].get('count', 0)}")
-        
-        # External connections
-        sql = """
-        SELECT COUNT(*) as count 
-        FROM process_open_sockets 
-        WHERE remote_address != '' 
-          AND remote_address != '127.0.0.1'
-          AND remote_address != '::1';
-        """
-        results = self._run_query(sql)
-        if results:
-            info.append(f"Active external connections: {results[0].get('count', 0)}")
-        
-        # Privileged ports (< 1024)
-        sql = "SELECT COUNT(*) as count FROM listening_ports WHERE port < 1024;"
-        results = self._run_query(sql)
-        if results:
-            info.append(f"Privileged ports in use: {results[0].get('count', 0)}")
-        
+        if "listening_ports" in values:
+            info.append(f"Listening ports: {values['listening_ports']:.0f}")
+        if "external_connections" in values:
+            info.append(f"Active external connections: {values['external_connections']:.0f}")
+        if "privileged_ports" in values:
+            info.append(f"Privileged ports in use: {values['privileged_ports']:.0f}")
         return info
     
-    def _get_process_security(self) -> List[str]:
+    def _get_process_security(self, values: Dict[str, float]) -> List[str]:
         """Get process security status"""
         info = []
-        
-        # Total processes
-        sql = "SELECT COUNT(*) as count FROM processes;"
-        results = self._run_query(sql)
-        if results:
-            info.append(f"Running processes: {results[0].get('count', 0)}")
-        
-        # Root processes
-        sql = "SELECT COUNT(*) as count FROM processes WHERE uid = 0;"
-        results = self._run_query(sql)
-        if results:
-            info.append(f"Root-owned processes: {results[0].get('count', 0)}")
-        
+        if "processes" in values:
+            info.append(f"Running processes: {values['processes']:.0f}")
+        if "root_processes" in values:
+            info.append(f"Root-owned processes: {values['root_processes']:.0f}")
         return info
     
-    def _check_security_alerts(self) -> List[str]:
+    def _check_security_alerts(self, values: Dict[str, float], rows: Dict[str, List[Dict[str, Any]]]) -> List[str]:
         """Check for potential security issues"""
         alerts = []
+        baseline = self.baseline
+        listeners = rows.get("listeners", [])
+        sockets = rows.get("sockets", [])
         
-        # Check for suspicious ports
-        sql = "SELECT port, protocol FROM listening_ports WHERE port IN (4444, 5555, 6666, 31337);"
-        results = self._run_query(sql)
-        if results:
-            ports = [str(r.get('port')) for r in results]
-            alerts.append(f"Suspicious ports detected: {', '.join(ports)}")
+        # Check listeners and connections against the IOC lists (ports, IPs)
+        ioc = self.lia.ioc
+        alerts.extend(ioc.summarize_hits(ioc.match_results(listeners), "listening_ports"))
+        alerts.extend(ioc.summarize_hits(ioc.match_results(sockets), "process_open_sockets"))
         
+        # Fixed thresholds below only apply until the host baseline has warmed up
         # Check for too many external connections (potential data exfiltration)
-        sql = """
-        SELECT COUNT(*) as count 
-        FROM process_open_sockets 
-        WHERE remote_address != '' 
-          AND remote_address != '127.0.0.1';
-        """
-        results = self._run_query(sql)
-        if results and int(results[0].get('count', 0)) > 50:
-            alerts.append(f"High number of external connections: {results[0]['count']}")
+        if not baseline.is_warm("external_connections") and values.get("external_connections", 0) > 50:
+            alerts.append(f"High number of external connections: {values['external_connections']:.0f}")
         
         # Check for unusual cron jobs (if accessible)
-        sql = "SELECT COUNT(*) as count FROM crontab;"
-        results = self._run_query(sql)
-        if results and int(results[0].get('count', 0)) > 20:
-            alerts.append(f"Unusual number of cron jobs: {results[0]['count']}")
+        if not baseline.is_warm("cron_jobs") and values.get("cron_jobs", 0) > 20:
+            alerts.append(f"Unusual number of cron jobs: {values['cron_jobs']:.0f}")
+
+        # Check for processes with unusual parents (e.g. a web server spawning a shell)
+        processes = []
+        if "processes" in rows:
+            alerts.extend(self.lia.process_tree.unusual_parents())
+            processes = rows["processes"]
+            alerts.extend(ioc.summarize_hits(ioc.match_results(processes), "processes"))
+
+        # Compare this run with the host's streaming baseline, then fold it in
+        if time.time() - self._baseline_at >= self.baseline_interval:
+            self._baseline_alerts = baseline.observe(
+                values,
+                remote_addresses=[row['remote_address'] for row in sockets
+                                  if (row.get('remote_address') or '') not in LOOPBACK_ADDRESSES],
+                process_names=[row['name'] for row in processes if row.get('name')],
+                ports=[row.get('port', '') for row in listeners]
+            )
+            self._baseline_at = time.time()
+            try:
+                baseline.save()
+            except OSError as e:
+                print(f"Warning: Could not save baseline: {e}")
+        alerts.extend(self._baseline_alerts)
         
+        self.last_alerts = alerts
         return alerts
 
 
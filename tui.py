@@ -4,7 +4,10 @@ LiaAI – Professional Left-Aligned TUI (White Text • Modern Design)
 Inspired by: Gemini CLI • Claude • Warp • Perplexity
 """
 import os
+import re
 import sys
+import threading
+import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from rich.align import Align
 
@@ -22,6 +25,11 @@ except ImportError:
     sys.exit(1)
 
 from core.lia_main import LiaMain
+from engines.output_buffer import OutputBuffer
+from tools.dashboard_watch import DashboardRefresher
+
+# Lines of streamed command output shown while a command runs
+LIVE_OUTPUT_LINES = 12
 
 
 class LiaTUI:
@@ -106,11 +114,121 @@ class LiaTUI:
         )
         return Padding(bubble, pad=(0, 4, 1, 0))  # Left-aligned
 
-    def thinking(self):
-        return Padding(
-            Text("● LiaAI is thinking...", style="white dim"),
-            pad=(0, 4)
+    def thinking(self, output: OutputBuffer = None, cancelling: bool = False):
+        status = "● Cancelling..." if cancelling else "● LiaAI is thinking..."
+        if output is None or not output.total_bytes:
+            return Padding(Text(status, style="white dim"), pad=(0, 4))
+        live_output = Panel(
+            Text(output.tail(LIVE_OUTPUT_LINES), style="white", no_wrap=True, overflow="ellipsis"),
+            subtitle=Text(f"{output.total_lines} lines • Ctrl+C to stop", style="dim white"),
+            style="on #0f0f1a",
+            border_style="#4c1d95",
+            padding=(0, 2),
         )
+        return Padding(Group(Text(status, style="white dim"), live_output), pad=(0, 4))
+
+    def ask(self, user_input: str) -> str:
+        """
+        Process a request on a worker thread, showing command output as it
+        streams in; Ctrl+C cancels the running command
+        """
+        output = OutputBuffer(64 * 1024)
+        cancel_event = threading.Event()
+        result = {}
+
+        def work():
+            try:
+                result["response"] = self.lia.process_input(user_input, on_output=output.append,
+                                                            cancel_event=cancel_event)
+            except Exception as e:
+                result["error"] = e
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        with Live(self.thinking(), refresh_per_second=8, console=self.console) as live:
+            while worker.is_alive():
+                try:
+                    worker.join(timeout=0.125)
+                except KeyboardInterrupt:
+                    if cancel_event.is_set():
+                        raise  # Second Ctrl+C: stop waiting
+                    cancel_event.set()
+                live.update(self.thinking(output, cancel_event.is_set()))
+
+        if "error" in result:
+            raise result["error"]
+        return result["response"]
+
+    def section_panel(self, view):
+        body = Text("\n".join(view.lines) if view.lines else "Collecting...", style="white")
+        age = f"updated {time.strftime('%H:%M:%S', time.localtime(view.updated_at))}" if view.updated_at else "pending"
+        return Panel(
+            body,
+            title=Text(view.title.strip(), style="bold #22d3ee"),
+            subtitle=Text(age, style="dim white"),
+            style="on #0f0f1a",
+            border_style="#4c1d95",
+            padding=(0, 2),
+        )
+
+    def alert_events_panel(self, refresher: DashboardRefresher):
+        lines = Text()
+        for timestamp, kind, alert in list(refresher.events)[-10:]:
+            stamp = time.strftime('%H:%M:%S', time.localtime(timestamp))
+            if kind == "raised":
+                lines.append(f"{stamp}  ▲ {alert}\n", style="bold red")
+            else:
+                lines.append(f"{stamp}  ▼ cleared: {alert}\n", style="green")
+        if not lines:
+            lines.append("No alert transitions yet.", style="dim white")
+        title = f"🔔 ALERT TRANSITIONS • {len(refresher.active_alerts)} active"
+        return Panel(lines, title=Text(title, style="bold #c4b5fd"), style="on #0f0f1a",
+                     border_style="#6366f1", padding=(0, 2))
+
+    def watch_dashboard(self, user_input: str):
+        """Keep the dashboard live until Ctrl+C, redrawing only changed sections"""
+        from tools.security_dashboard import SecurityDashboard
+
+        base_interval = 10.0
+        match = re.search(r"every (\d+)\s*(s|sec|secs|seconds?|m|min|mins|minutes?)?\b", user_input, re.IGNORECASE)
+        if match:
+            unit = (match.group(2) or "s").lower()
+            base_interval = max(1.0, float(match.group(1)) * (60 if unit.startswith("m") else 1))
+
+        dashboard = SecurityDashboard(self.lia)
+        dashboard.baseline_interval = 300.0  # Don't let fast refreshes flood the baseline
+        refresher = DashboardRefresher(dashboard, base_interval=base_interval)
+        refresher.start()
+
+        panels = {}  # section key -> (version, renderable)
+        footer = Text(f"Refreshing every {base_interval:.0f}s (slower for expensive sections) • Ctrl+C to stop",
+                      style="dim white")
+
+        def render():
+            for view in refresher.snapshot():
+                cached = panels.get(view.key)
+                if cached is None or cached[0] != view.version:
+                    panels[view.key] = (view.version, self.section_panel(view))
+            parts = [panels[key][1] for key in refresher.views]
+            parts.append(self.alert_events_panel(refresher))
+            if refresher.error:
+                parts.append(Text(f"Refresh error: {refresher.error}", style="bold red"))
+            parts.append(footer)
+            return Group(*parts)
+
+        seen_version = -1
+        try:
+            with Live(render(), refresh_per_second=4, console=self.console) as live:
+                while True:
+                    if refresher.version != seen_version:
+                        seen_version = refresher.version
+                        live.update(render())
+                    time.sleep(0.25)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            refresher.stop()
+        self.console.print("[dim]Stopped watching the dashboard.[/]\n")
 
     def run(self):
         self.console.clear()
@@ -156,13 +274,16 @@ class LiaTUI:
                     self.console.print(Rule(style="#4c1d95"))
                     continue
 
+                if user_input.lower().startswith("watch dashboard"):
+                    self.watch_dashboard(user_input)
+                    continue
+
                 # Display user message
                 self.console.print(self.user_message(user_input))
                 self.console.print()
 
-                # Thinking
-                with Live(self.thinking(), refresh_per_second=8, console=self.console):
-                    response = self.lia.process_input(user_input)
+                # Thinking (with live command output)
+                response = self.ask(user_input)
 
                 # Display assistant response
                 self.console.print(self.assistant_message(response))
@@ -176,7 +297,10 @@ class LiaTUI:
 
 def main():
     app = LiaTUI()
-    app.run()
+    try:
+        app.run()
+    finally:
+        app.lia.close()
 
 
 if __name__ == "__main__":